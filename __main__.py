@@ -17,6 +17,17 @@ insert_time_1 = process_time()
 
 print("Inserting 10k records took:  \t\t\t", insert_time_1 - insert_time_0)
 
+# Measuring Bulk Insert Performance
+bulk_table = db.create_table('BulkGrades', 5, 0)
+bulk_query = Query(bulk_table)
+bulk_rows = [(906659671 + i, 93, 0, 0, 0) for i in range(0, 10000)]
+
+bulk_insert_time_0 = process_time()
+bulk_query.insert_many(bulk_rows)
+bulk_insert_time_1 = process_time()
+
+print("Bulk inserting 10k records took:  \t\t", bulk_insert_time_1 - bulk_insert_time_0)
+
 # Measuring update Performance
 update_cols = [
     [None, None, None, None, None],
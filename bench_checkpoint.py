@@ -0,0 +1,90 @@
+from lstore.db import Database
+from lstore.query import Query
+from time import perf_counter, sleep
+from random import randrange, seed
+import os, sys, shutil, subprocess, tempfile
+
+# Crashes a database after loading it and updating it for a while, then times opening it again. Without background
+# checkpoints recovery replays the whole log, so it grows with the database; with them it only replays the log
+# written since the last one. Then times updates while checkpoints run and prints the latency they add.
+
+update_seconds = 3.0
+record_counts = [20000, 80000]
+checkpoint_intervals = [None, 0.5]
+
+
+# loads and updates a database, then stops without closing it once its log is on disk
+def crash(path, number_of_records, checkpoint_interval):
+    seed(3562901)
+    db = Database()
+    db.open(path, checkpoint_interval = checkpoint_interval)
+    grades_table = db.create_table('Grades', 5, 0)
+    query = Query(grades_table)
+    query.insert_many([(906659671 + i, 0, 0, 0, 0) for i in range(number_of_records)])
+
+    update_time_0 = perf_counter()
+    while perf_counter() - update_time_0 < update_seconds:
+        query.update(906659671 + randrange(number_of_records), None, randrange(100), None, None, None)
+    db.wal.flush()
+    os._exit(0)
+
+
+def recovery():
+    print(f"{'records':>10}{'checkpoints':>13}{'log (KB)':>10}{'open (s)':>10}")
+    for number_of_records in record_counts:
+        for checkpoint_interval in checkpoint_intervals:
+            path = tempfile.mkdtemp()
+            subprocess.run([sys.executable, __file__, "crash", path, str(number_of_records), str(checkpoint_interval)], check = True)
+            log_size = sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path) if name.endswith(".log"))
+
+            open_time_0 = perf_counter()
+            db = Database()
+            db.open(path)
+            open_time_1 = perf_counter()
+            db.close()
+            shutil.rmtree(path)
+
+            print(f"{number_of_records:>10}{str(checkpoint_interval):>13}{log_size // 1024:>10}{open_time_1 - open_time_0:>10.3f}")
+
+
+def latency():
+    number_of_records = 80000
+    number_of_updates = 100000
+
+    print()
+    print(f"{'checkpoints':>13}{'updates/s':>11}{'p99 (ms)':>10}{'max (ms)':>10}{'taken':>7}{'each (s)':>10}{'gate closed (ms)':>18}")
+    for checkpoint_interval in checkpoint_intervals:
+        seed(3562901)
+        path = tempfile.mkdtemp()
+        db = Database()
+        db.open(path, checkpoint_interval = checkpoint_interval)
+        grades_table = db.create_table('Grades', 5, 0)
+        query = Query(grades_table)
+        query.insert_many([(906659671 + i, 0, 0, 0, 0) for i in range(number_of_records)])
+
+        latencies = []
+        update_time_0 = perf_counter()
+        for _ in range(number_of_updates):
+            latency_time_0 = perf_counter()
+            query.update(906659671 + randrange(number_of_records), None, randrange(100), None, None, None)
+            latencies.append(perf_counter() - latency_time_0)
+        update_time_1 = perf_counter()
+
+        stats = db.checkpointer.stats() if db.checkpointer is not None else {"checkpoints": 0, "checkpoint_seconds": 0.0,
+                                                                                 "gate_closes": 0, "gate_closed_seconds": 0.0}
+        db.close()
+        shutil.rmtree(path)
+
+        latencies.sort()
+        checkpoint_seconds = stats["checkpoint_seconds"] / stats["checkpoints"] if stats["checkpoints"] else 0.0
+        closed_ms = stats["gate_closed_seconds"] / stats["gate_closes"] * 1000 if stats["gate_closes"] else 0.0
+        print(f"{str(checkpoint_interval):>13}{number_of_updates / (update_time_1 - update_time_0):>11.0f}"
+              f"{latencies[int(len(latencies) * 0.99)] * 1000:>10.2f}{latencies[-1] * 1000:>10.2f}{stats['checkpoints']:>7}{checkpoint_seconds:>10.3f}{closed_ms:>18.2f}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "crash":
+        crash(sys.argv[2], int(sys.argv[3]), None if sys.argv[4] == "None" else float(sys.argv[4]))
+    else:
+        recovery()
+        latency()
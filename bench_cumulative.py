@@ -0,0 +1,58 @@
+from lstore.db import Database
+from lstore.query import Query
+from time import perf_counter
+from random import randrange, seed
+import shutil, tempfile
+
+# Compares tables writing non-cumulative tail records, which hold only the columns of their own update, with
+# cumulative ones, which hold every column updated so far. Page pins are counted through the buffer pool hits
+# and misses: per update for write amplification, per select of every column for read amplification.
+
+number_of_records = 1000
+updates_per_record = [1, 4, 16]
+number_of_columns = 5
+
+
+def pins(bufferpool):
+    stats = bufferpool.stats()
+    return stats["hits"] + stats["misses"]
+
+
+print(f"{'mode':>14}{'updates/rec':>13}{'update us':>11}{'pins/update':>13}{'select us':>11}{'pins/select':>13}")
+for number_of_updates in updates_per_record:
+    for cumulative in (False, True):
+        seed(3562901)
+        path = tempfile.mkdtemp()
+
+        db = Database()
+        db.open(path)
+        grades_table = db.create_table('Grades', number_of_columns, 0, cumulative = cumulative)
+        query = Query(grades_table)
+        keys = [906659671 + i for i in range(number_of_records)]
+        query.insert_many([(key, 0, 0, 0, 0) for key in keys])
+
+        # each update changes one random column, so a non-cumulative chain has to be walked to find the others
+        total_updates = number_of_records * number_of_updates
+        pins_0 = pins(db.bufferpool)
+        update_time_0 = perf_counter()
+        for _ in range(total_updates):
+            columns = [None] * number_of_columns
+            columns[randrange(1, number_of_columns)] = randrange(100)
+            query.update(keys[randrange(number_of_records)], *columns)
+        update_time_1 = perf_counter()
+        update_pins = pins(db.bufferpool) - pins_0
+
+        pins_0 = pins(db.bufferpool)
+        select_time_0 = perf_counter()
+        for key in keys:
+            query.select(key, 0, [1] * number_of_columns)
+        select_time_1 = perf_counter()
+        select_pins = pins(db.bufferpool) - pins_0
+
+        db.close()
+        shutil.rmtree(path)
+
+        mode = "cumulative" if cumulative else "non-cumulative"
+        print(f"{mode:>14}{number_of_updates:>13}"
+              f"{(update_time_1 - update_time_0) / total_updates * 1e6:>11.1f}{update_pins / total_updates:>13.2f}"
+              f"{(select_time_1 - select_time_0) / number_of_records * 1e6:>11.1f}{select_pins / number_of_records:>13.2f}")
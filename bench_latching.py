@@ -0,0 +1,77 @@
+from lstore.bufferpool import BufferPool
+from time import perf_counter
+from random import Random
+import os, tempfile, threading
+
+# Stress test for the buffer pool latching: many threads share one pool, mostly reading cached pages,
+# sometimes missing, and sometimes incrementing a counter stored in a page under its exclusive latch.
+# At the end every counter must add up to the number of increments, and no pins may be left behind.
+
+thread_counts = [1, 2, 4, 8, 16]
+operations_per_thread = 50000
+number_of_pages = 2048
+pool_size = 1024
+write_ratio = 0.05
+
+with tempfile.TemporaryDirectory() as root:
+    print(f"{'threads':>8}{'ops/sec':>14}{'hits':>10}{'misses':>10}{'evictions':>11}")
+    for num_threads in thread_counts:
+        bufferpool = BufferPool(pool_size = pool_size, db_root = root)
+        paths = [(os.path.join(root, f"run_{num_threads}.seg"), i) for i in range(number_of_pages)]
+        increments = [0] * num_threads
+        errors = []
+
+        # every page starts with one counter set to 0
+        for path in paths:
+            page = bufferpool.get_page(path)
+            page.write(0)
+            bufferpool.mark_dirty(path)
+            bufferpool.unpin(path)
+
+        def worker(thread_id):
+            rng = Random(thread_id)
+            try:
+                for _ in range(operations_per_thread):
+                    # skew accesses towards the first quarter of the pages so most of them hit
+                    if rng.random() < 0.8:
+                        path = paths[rng.randrange(number_of_pages // 4)]
+                    else:
+                        path = paths[rng.randrange(number_of_pages)]
+
+                    if rng.random() < write_ratio:
+                        with bufferpool.latched(path, exclusive = True) as page:
+                            page.update(0, page.read(0) + 1)
+                        increments[thread_id] += 1
+                    else:
+                        with bufferpool.latched(path) as page:
+                            page.read(0)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target = worker, args = (i,)) for i in range(num_threads)]
+        time_0 = perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        time_1 = perf_counter()
+
+        total = 0
+        for path in paths:
+            page = bufferpool.get_page(path)
+            total += page.read(0)
+            bufferpool.unpin(path)
+
+        stats = bufferpool.stats()
+        if errors:
+            print("error:", errors[0])
+        if total != sum(increments):
+            print("lost updates:", sum(increments) - total)
+        if stats["pinned_frames"] != 0:
+            print("pins left behind:", stats["pinned_frames"])
+
+        ops = num_threads * operations_per_thread / (time_1 - time_0)
+        print(f"{num_threads:>8}{ops:>14.0f}{stats['hits']:>10}{stats['misses']:>10}{stats['evictions']:>11}")
+
+        # the segment files are closed before the directory holding them is removed
+        bufferpool.storage.close()
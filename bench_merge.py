@@ -0,0 +1,75 @@
+from lstore.db import Database
+from lstore.query import Query
+from time import perf_counter
+from random import randrange, seed
+import shutil, tempfile
+
+# Times the merge of one page range as its number of full tail pages grows. Background merges are turned off and
+# the merge is run directly, so the time is the merge alone; it should grow linearly with the tail pages.
+# Then runs an update-heavy workload with background merges at different rate limits and prints the scheduler
+# counters next to the foreground update rate.
+
+number_of_records = 8192
+tail_page_counts = [2, 10, 40]
+number_of_columns = 5
+records_per_tail_page = 512
+
+print(f"{'tail pages':>12}{'merge (s)':>12}{'ms/tail page':>14}")
+for tail_pages in tail_page_counts:
+    seed(3562901)
+    path = tempfile.mkdtemp()
+
+    db = Database()
+    db.open(path)
+    grades_table = db.create_table('Grades', number_of_columns, 0)
+    db.merge_scheduler.min_tail_pages = float('inf')
+    query = Query(grades_table)
+    keys = [906659671 + i for i in range(number_of_records)]
+    query.insert_many([(key, 0, 0, 0, 0) for key in keys])
+
+    # fill the full tail pages plus part of the last one, which the merge leaves alone
+    for _ in range(tail_pages * records_per_tail_page + 1):
+        columns = [None] * number_of_columns
+        columns[randrange(1, number_of_columns)] = randrange(100)
+        query.update(keys[randrange(number_of_records)], *columns)
+
+    merge_time_0 = perf_counter()
+    grades_table.merge_page_range(0)
+    merge_time_1 = perf_counter()
+
+    db.close()
+    shutil.rmtree(path)
+
+    merge_time = merge_time_1 - merge_time_0
+    print(f"{tail_pages:>12}{merge_time:>12.3f}{merge_time / tail_pages * 1000:>14.1f}")
+
+
+number_of_updates = 100000
+merge_rates = [None, 20000, 2000]
+
+print()
+print(f"{'merge rate':>12}{'updates/s':>11}{'merges':>8}{'merge (s)':>11}{'rewritten':>11}{'throttled (s)':>15}{'max queue':>11}")
+for merge_rate in merge_rates:
+    seed(3562901)
+    path = tempfile.mkdtemp()
+
+    db = Database()
+    db.open(path, merge_rate = merge_rate)
+    grades_table = db.create_table('Grades', number_of_columns, 0)
+    query = Query(grades_table)
+    keys = [906659671 + i for i in range(number_of_records)]
+    query.insert_many([(key, 0, 0, 0, 0) for key in keys])
+
+    update_time_0 = perf_counter()
+    for _ in range(number_of_updates):
+        columns = [None] * number_of_columns
+        columns[randrange(1, number_of_columns)] = randrange(100)
+        query.update(keys[randrange(number_of_records)], *columns)
+    update_time_1 = perf_counter()
+
+    stats = db.merge_scheduler.stats()
+    db.close()
+    shutil.rmtree(path)
+
+    print(f"{str(merge_rate):>12}{number_of_updates / (update_time_1 - update_time_0):>11.0f}{stats['merges']:>8}"
+          f"{stats['merge_seconds']:>11.3f}{stats['pages_rewritten']:>11}{stats['throttled_seconds']:>15.3f}{stats['max_queue_depth']:>11}")
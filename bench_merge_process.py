@@ -0,0 +1,73 @@
+from lstore.db import Database
+from lstore.query import Query
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+from random import randrange, seed
+import multiprocessing, threading
+import shutil, tempfile
+
+# Measures select latency in a query thread while one big page range is merged, once with the range consolidated
+# in the merging thread and once in a merge process. In the thread the merge holds the GIL for most of its run, in
+# a process the query thread only waits for it while the new base pages are installed.
+
+number_of_records = 8192
+number_of_columns = 5
+tail_pages = 80
+records_per_tail_page = 512
+
+
+def percentile(latencies, fraction):
+    return sorted(latencies)[int(fraction * (len(latencies) - 1))]
+
+
+def run(executor):
+    seed(3562901)
+    path = tempfile.mkdtemp()
+
+    db = Database()
+    db.open(path)
+    grades_table = db.create_table('Grades', number_of_columns, 0)
+    db.merge_scheduler.min_tail_pages = float('inf')
+    query = Query(grades_table)
+    keys = [906659671 + i for i in range(number_of_records)]
+    query.insert_many([(key, 0, 0, 0, 0) for key in keys])
+
+    for _ in range(tail_pages * records_per_tail_page + 1):
+        columns = [None] * number_of_columns
+        columns[randrange(1, number_of_columns)] = randrange(100)
+        query.update(keys[randrange(number_of_records)], *columns)
+
+    latencies = []
+    done = threading.Event()
+
+    def select_loop():
+        while not done.is_set():
+            select_time_0 = perf_counter()
+            query.select(keys[randrange(number_of_records)], 0, [1] * number_of_columns)
+            latencies.append(perf_counter() - select_time_0)
+
+    selector = threading.Thread(target = select_loop)
+    selector.start()
+    merge_time_0 = perf_counter()
+    grades_table.merge_page_range(0, executor)
+    merge_time = perf_counter() - merge_time_0
+    done.set()
+    selector.join()
+
+    db.close()
+    shutil.rmtree(path)
+    return merge_time, latencies
+
+
+if __name__ == "__main__":
+    process_pool = ProcessPoolExecutor(max_workers = 1, mp_context = multiprocessing.get_context("spawn"))
+    # start the merge process before timing anything
+    process_pool.submit(abs, 0).result()
+
+    print(f"{'merge in':>10}{'merge (s)':>11}{'selects/s':>11}{'p50 us':>9}{'p99 us':>9}{'max ms':>9}")
+    for name, executor in (("thread", None), ("process", process_pool)):
+        merge_time, latencies = run(executor)
+        print(f"{name:>10}{merge_time:>11.3f}{len(latencies) / merge_time:>11.0f}{percentile(latencies, 0.5) * 1e6:>9.0f}"
+              f"{percentile(latencies, 0.99) * 1e6:>9.0f}{max(latencies) * 1e3:>9.1f}")
+
+    process_pool.shutdown()
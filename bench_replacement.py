@@ -0,0 +1,47 @@
+from lstore.bufferpool import BufferPool
+from lstore.replacement import POLICIES
+from time import perf_counter
+from random import randrange, seed
+import os, tempfile
+
+# Measures the cost of one buffer pool access for every replacement policy as the pool grows.
+# Pages are never written, so the numbers only show the bookkeeping done by the pool and its policy.
+
+pool_sizes = [32, 1024, 16384, 100000]
+number_of_accesses = 200000
+seed(3562901)
+
+with tempfile.TemporaryDirectory() as root:
+    print(f"{'policy':<8}{'frames':>10}{'hit ns/access':>18}{'miss ns/access':>18}")
+    for policy in POLICIES:
+        for pool_size in pool_sizes:
+            bufferpool = BufferPool(pool_size = pool_size, db_root = root, policy = policy)
+            paths = [(os.path.join(root, "pages.seg"), i) for i in range(pool_size)]
+
+            # fill the pool
+            for path in paths:
+                bufferpool.get_page(path)
+                bufferpool.unpin(path)
+
+            # every access hits a page that is already in the pool
+            accesses = [paths[randrange(pool_size)] for _ in range(number_of_accesses)]
+            hit_time_0 = perf_counter()
+            for path in accesses:
+                bufferpool.get_page(path)
+                bufferpool.unpin(path)
+            hit_time_1 = perf_counter()
+
+            # every access misses, so every access has to evict a page
+            misses = [(os.path.join(root, "misses.seg"), i) for i in range(number_of_accesses)]
+            miss_time_0 = perf_counter()
+            for path in misses:
+                bufferpool.get_page(path)
+                bufferpool.unpin(path)
+            miss_time_1 = perf_counter()
+
+            hit_ns = (hit_time_1 - hit_time_0) / number_of_accesses * 1e9
+            miss_ns = (miss_time_1 - miss_time_0) / number_of_accesses * 1e9
+            print(f"{policy:<8}{pool_size:>10}{hit_ns:>18.0f}{miss_ns:>18.0f}")
+
+            # the segment files are closed before the directory holding them is removed
+            bufferpool.storage.close()
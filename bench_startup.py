@@ -0,0 +1,44 @@
+from lstore.db import Database
+from lstore.query import Query
+from time import perf_counter
+from random import randrange, seed
+import glob, os, shutil, tempfile
+
+# Measures how long Database.open takes as the number of tail records grows, once with the saved page
+# directory and index snapshots and once with them removed so open has to rebuild both from the pages.
+
+number_of_records = 10000
+update_counts = [0, 10000, 50000, 100000]
+seed(3562901)
+
+print(f"{'tail records':>14}{'open (snapshot)':>18}{'open (rebuild)':>18}")
+for number_of_updates in update_counts:
+    path = tempfile.mkdtemp()
+
+    db = Database()
+    db.open(path)
+    grades_table = db.create_table('Grades', 5, 0)
+    query = Query(grades_table)
+    query.insert_many([(906659671 + i, 93, 0, 0, 0) for i in range(number_of_records)])
+    for _ in range(number_of_updates):
+        query.update(906659671 + randrange(number_of_records), None, randrange(100), None, None, None)
+    db.close()
+
+    open_time_0 = perf_counter()
+    db = Database()
+    db.open(path)
+    open_time_1 = perf_counter()
+    db.close()
+
+    table_dir = os.path.join(path, "tables", "Grades")
+    for snapshot_file in glob.glob(os.path.join(table_dir, "directory*.bin")) + glob.glob(os.path.join(table_dir, "index*.bin")):
+        os.remove(snapshot_file)
+
+    rebuild_time_0 = perf_counter()
+    db = Database()
+    db.open(path)
+    rebuild_time_1 = perf_counter()
+    db.close()
+
+    shutil.rmtree(path)
+    print(f"{number_of_updates:>14}{open_time_1 - open_time_0:>18.3f}{rebuild_time_1 - rebuild_time_0:>18.3f}")
@@ -0,0 +1,71 @@
+from lstore.db import Database
+from lstore.query import Query
+from lstore.transaction import Transaction
+from lstore.transaction_worker import TransactionWorker
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+from random import randint, seed
+import shutil, tempfile
+
+# Runs the select and update transactions of m3_tester_part_2 over a growing number of threads and prints how many
+# transactions commit per second. Dedicated runs give each of the workers a thread of its own, shared runs have
+# a fixed number of workers take turns on a thread pool of that size.
+
+thread_counts = [1, 2, 4, 8]
+shared_workers = 8
+number_of_records = 10000
+number_of_transactions = 1000
+number_of_operations_per_record = 2
+
+
+def load(path):
+    seed(3562901)
+    db = Database()
+    db.open(path)
+    grades_table = db.create_table('Grades', 5, 0)
+    query = Query(grades_table)
+    keys = [92106429 + i for i in range(number_of_records)]
+    query.insert_many([[key, randint(0, 20), randint(0, 20), randint(0, 20), randint(0, 20)] for key in keys])
+    return db, grades_table, query, keys
+
+
+def make_transactions(grades_table, query, keys):
+    transactions = [Transaction() for _ in range(number_of_transactions)]
+    for _ in range(number_of_operations_per_record):
+        for key in keys:
+            updated_columns = [None, None, randint(0, 20), randint(0, 20), randint(0, 20)]
+            transactions[key % number_of_transactions].add_query(query.select, grades_table, key, 0, [1, 1, 1, 1, 1])
+            transactions[key % number_of_transactions].add_query(query.update, grades_table, key, *updated_columns)
+    return transactions
+
+
+# returns the transactions that committed per second
+def run(num_threads, shared):
+    path = tempfile.mkdtemp()
+    db, grades_table, query, keys = load(path)
+    transactions = make_transactions(grades_table, query, keys)
+
+    executor = ThreadPoolExecutor(max_workers = num_threads) if shared else None
+    num_workers = shared_workers if shared else num_threads
+    transaction_workers = [TransactionWorker(executor = executor) for _ in range(num_workers)]
+    for i, transaction in enumerate(transactions):
+        transaction_workers[i % num_workers].add_transaction(transaction)
+
+    time_0 = perf_counter()
+    for transaction_worker in transaction_workers:
+        transaction_worker.run()
+    for transaction_worker in transaction_workers:
+        transaction_worker.join()
+    time_1 = perf_counter()
+
+    if executor is not None:
+        executor.shutdown()
+    db.close()
+    shutil.rmtree(path)
+    return sum(transaction_worker.result for transaction_worker in transaction_workers) / (time_1 - time_0)
+
+
+if __name__ == "__main__":
+    print(f"{'threads':>8}{'dedicated (txn/s)':>19}{'shared (txn/s)':>16}")
+    for num_threads in thread_counts:
+        print(f"{num_threads:>8}{run(num_threads, False):>19.0f}{run(num_threads, True):>16.0f}")
@@ -0,0 +1,67 @@
+from lstore.db import Database
+from lstore.query import Query
+from time import perf_counter
+from random import Random
+import threading
+import shutil, tempfile
+
+# Update throughput and commit latency with the write-ahead log off, synced in the background every interval, and
+# synced before every update returns. Synchronous commits are run from several threads, one table each, to show
+# concurrent commits sharing an fsync: commits per fsync grows with the threads and with the group commit window.
+
+number_of_records = 2000
+number_of_columns = 5
+updates_per_thread = 2000
+
+configs = [
+    # (label, wal, wal_sync, wal_interval, threads)
+    ("no log", False, False, 0, 1),
+    ("async 10ms", True, False, 0.01, 1),
+    ("async 100ms", True, False, 0.1, 1),
+    ("sync", True, True, 0, 1),
+    ("sync", True, True, 0, 8),
+    ("sync 1ms", True, True, 0.001, 8),
+]
+
+
+def run_updates(query, keys, latencies, seed):
+    rnd = Random(seed)
+    for _ in range(updates_per_thread):
+        columns = [None] * number_of_columns
+        columns[rnd.randrange(1, number_of_columns)] = rnd.randrange(100)
+        update_time_0 = perf_counter()
+        query.update(keys[rnd.randrange(number_of_records)], *columns)
+        latencies.append(perf_counter() - update_time_0)
+
+
+print(f"{'log':>12}{'threads':>9}{'updates/s':>11}{'p50 us':>9}{'p99 us':>9}{'fsyncs':>8}{'commits/fsync':>15}")
+for label, wal, wal_sync, wal_interval, threads in configs:
+    path = tempfile.mkdtemp()
+    db = Database()
+    db.open(path, wal = wal, wal_sync = wal_sync, wal_interval = wal_interval)
+
+    queries = []
+    keys = [906659671 + i for i in range(number_of_records)]
+    for thread_ind in range(threads):
+        query = Query(db.create_table(f'Grades{thread_ind}', number_of_columns, 0))
+        query.insert_many([(key, 0, 0, 0, 0) for key in keys])
+        queries.append(query)
+    fsyncs_0 = db.wal.stats()["fsyncs"] if wal else 0
+
+    latencies = [[] for _ in range(threads)]
+    workers = [threading.Thread(target = run_updates, args = (queries[i], keys, latencies[i], i)) for i in range(threads)]
+    update_time_0 = perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    update_time = perf_counter() - update_time_0
+
+    fsyncs = db.wal.stats()["fsyncs"] - fsyncs_0 if wal else 0
+    db.close()
+    shutil.rmtree(path)
+
+    all_latencies = sorted(latency for thread_latencies in latencies for latency in thread_latencies)
+    updates = len(all_latencies)
+    print(f"{label:>12}{threads:>9}{updates / update_time:>11.0f}{all_latencies[updates // 2] * 1e6:>9.0f}"
+          f"{all_latencies[int(updates * 0.99)] * 1e6:>9.0f}{fsyncs:>8}{updates / fsyncs if fsyncs else 0:>15.1f}")
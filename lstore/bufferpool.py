@@ -1,7 +1,106 @@
 from lstore.page import Page
-import os
+from lstore.replacement import make_policy
+from lstore.storage import make_storage
+from lstore.config import FRAME_SIZE, BUFFERPOOL_SHARDS, MIN_FRAMES_PER_SHARD
+from contextlib import contextmanager
 import threading
 
+# multipliers for the units accepted in a memory budget such as "512MB"
+BUDGET_UNITS = {
+    "B": 1,
+    "KB": 1024,
+    "MB": 1024 ** 2,
+    "GB": 1024 ** 3,
+}
+
+
+"""
+:param size: int or string      #number of frames, or a memory budget such as "512MB"
+# returns the number of frames that fit in the given size
+"""
+def frames_for(size):
+    if isinstance(size, int):
+        if size <= 0:
+            raise ValueError("Buffer pool needs at least one frame")
+        return size
+    
+    text = str(size).strip().upper()
+    for unit in sorted(BUDGET_UNITS, key = len, reverse = True):
+        if text.endswith(unit):
+            number = text[:-len(unit)].strip()
+            break
+    else:
+        unit, number = "B", text
+        
+    try:
+        budget = float(number) * BUDGET_UNITS[unit]
+    except ValueError:
+        raise ValueError(f"Invalid buffer pool size: {size}")
+    
+    frames = int(budget // FRAME_SIZE)
+    if frames <= 0:
+        raise ValueError(f"Memory budget {size} is smaller than one frame ({FRAME_SIZE} bytes)")
+    return frames
+
+
+class Latch:
+    
+    
+    """
+    Reader-writer latch protecting the contents of one frame. Any number of threads can hold it shared,
+    exclusive holders wait until every reader is gone.
+    """
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        
+        
+    def acquire_shared(self):
+        with self._cond:
+            while self._writer:
+                self._cond.wait()
+            self._readers += 1
+            
+            
+    def release_shared(self):
+        with self._cond:
+            self._readers -= 1
+            if self._readers == 0:
+                self._cond.notify_all()
+                
+                
+    def acquire_exclusive(self):
+        with self._cond:
+            while self._writer or self._readers:
+                self._cond.wait()
+            self._writer = True
+            
+            
+    def release_exclusive(self):
+        with self._cond:
+            self._writer = False
+            self._cond.notify_all()
+            
+            
+    @contextmanager
+    def shared(self):
+        self.acquire_shared()
+        try:
+            yield
+        finally:
+            self.release_shared()
+            
+            
+    @contextmanager
+    def exclusive(self):
+        self.acquire_exclusive()
+        try:
+            yield
+        finally:
+            self.release_exclusive()
+
+
 class Frame:
 
     
@@ -9,8 +108,18 @@ class Frame:
         self.page = page
         # whether the page has been modified since it was loaded into buffer pool, initially no
         self.dirty = False
+        # log position of the latest change to the page, the log must be durable up to it before the page is written
+        self.lsn = 0
         # number of active users using the page, intially none
         self.pin_count = 0
+        # protects the page contents, pin counts are protected by the lock of the frame's shard
+        self.latch = Latch()
+        # set once the page has been read from disk, threads that hit a frame still being loaded wait on it
+        self.loaded = threading.Event()
+        if page is not None:
+            self.loaded.set()
+        # set while an eviction writes the page back without the shard lock, hits wait on it and read the page again
+        self.evicted = None
         
 
     def pin(self):
@@ -22,8 +131,10 @@ class Frame:
             self.pin_count -= 1
     
     
-    def mark_dirty(self):
+    def mark_dirty(self, lsn = 0):
         self.dirty = True
+        if lsn > self.lsn:
+            self.lsn = lsn
         
         
     def can_evict(self):
@@ -31,107 +142,295 @@ class Frame:
         return self.pin_count == 0
     
     
-class BufferPool:
+class Shard:
     
-    def __init__(self, pool_size, db_root: str):
-        self.pool_size = pool_size
-        self.db_root = db_root
-        
+    
+    """
+    One partition of the page table. Each shard has its own lock, frames and replacement policy,
+    so threads working on pages in different shards never wait on each other.
+    """
+    def __init__(self, capacity, policy):
+        self.capacity = capacity
+        self.lock = threading.Lock()
         # mapping of path of page to frame
         self.frames = {}
-        # list of paths in order of least recently used to most recently used
-        self.lru = []
+        # decides which unpinned frame is evicted when the shard is full
+        self.policy = make_policy(policy, capacity)
         
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
     
-    # page has been accessed, so update its position in lru list by moving it to the end
-    def _touch(self, path: str):
-        if path in self.lru:
-            self.lru.remove(path)
-        self.lru.append(path)
+class BufferPool:
+    
+    """
+    :param pool_size: int       #maximum number of frames held in memory, or a memory budget such as "512MB"
+    :param db_root: string      #root directory of the database
+    :param policy: string       #page replacement policy: lru, clock or 2q
+    :param storage: string      #how segment files are accessed: pread or mmap
+    :param write_ahead: bool    #pages are covered by a write-ahead log, changes reach the files only when written back
+    """
+    def __init__(self, pool_size, db_root: str, policy = "lru", storage = "pread", write_ahead = False):
+        self.pool_size = frames_for(pool_size)
+        self.db_root = db_root
+        self.storage = make_storage(storage, write_ahead)
+        # write-ahead log of the database, set once it is recovered
+        self.wal = None
         
+        # split the frames over the shards, small pools get fewer shards so a shard isn't filled by a few pinned pages
+        num_shards = max(1, min(BUFFERPOOL_SHARDS, self.pool_size // MIN_FRAMES_PER_SHARD))
+        self.shards = []
+        for shard_ind in range(num_shards):
+            capacity = self.pool_size // num_shards + (1 if shard_ind < self.pool_size % num_shards else 0)
+            self.shards.append(Shard(capacity, policy))
+            
+            
+    def _shard(self, path):
+        return self.shards[hash(path) % len(self.shards)]
         
-    def _read_page_from_disk(self, path: str):
-        # if page doesn't exist on disk, treat as new page and return empty page
-        if not os.path.exists(path):
-            return Page()
-        with open(path, 'rb') as file:
-            raw_bytes = file.read()
-        return Page.from_bytes(raw_bytes)
+        
+    # pages are identified by (segment file, page id) as returned by Table._page_path
+    def _read_page_from_disk(self, path):
+        segment, page_id = path
+        return self.storage.read_page(segment, page_id)
     
     
-    def _write_page_to_disk(self, path: str, page: Page):
-        os.makedirs(os.path.dirname(path), exist_ok = True)
-        data = page.to_bytes()
+    def _write_page_to_disk(self, path, page: Page):
+        segment, page_id = path
+        self.storage.write_page(segment, page_id, page)
         
-        tmp = path + f".{threading.get_ident()}.tmp"
-        with open(tmp, "wb") as file:
-            file.write(data)
-            file.flush()
-            
-        os.replace(tmp, path)
+        
+    # write-ahead rule: the changes in a page are in the durable log before the page reaches the disk
+    def _flush_log(self, frame):
+        if self.wal is not None and frame.lsn:
+            self.wal.flush(frame.lsn)
+
+
+    # write a frame's page to disk if it is dirty, the latch keeps writers from changing the page half way through
+    def _flush_frame(self, path, frame):
+        with frame.latch.shared():
+            if frame.dirty:
+                # clear the flag first so a write that happens after the copy marks the frame dirty again
+                frame.dirty = False
+                self._flush_log(frame)
+                self._write_page_to_disk(path, frame.page)
             
     
-    def _evict(self):
-        # no need to evict if buffer pool is not full
-        if len(self.frames) < self.pool_size:
-            return
+    # must be called with the shard's lock held. a clean victim is dropped right away, a dirty one is returned as
+    # (path, frame) to be written back without the lock, (None, event) to wait on while another thread writes
+    # back the only evictable frames. returns None once the shard has room
+    def _evict(self, shard):
+        # no need to evict if shard is not full
+        if len(shard.frames) < shard.capacity:
+            return None
         
-        lru_index = 0
-        while lru_index < len(self.lru):
-            path = self.lru[lru_index]
-            frame = self.frames.get(path)
+        pending = None
+        for path in shard.policy.victims():
+            frame = shard.frames[path]
             
-            if frame is None:
-                self.lru.pop(lru_index)
+            # nobody has the page pinned, and new pins need the shard lock we are holding
+            if not frame.can_evict():
                 continue
-            
-            if frame.can_evict():
-                if frame.dirty:
-                    self._write_page_to_disk(path, frame.page)
-                    frame.dirty = False
-                    
-                self.lru.pop(lru_index)
-                del self.frames[path]
-                return
-            
-            lru_index += 1
+            if frame.evicted is not None:
+                pending = pending or frame.evicted
+                continue
+            if frame.dirty:
+                # from now on hits wait for the write back and other evictions pass the frame over
+                frame.evicted = threading.Event()
+                return path, frame
+            self._drop(shard, path)
+            return None
         
+        if pending is not None:
+            return None, pending
         # if no pages are unpinned, then no page can be evicted
         raise RuntimeError("Cannot evict: all pages are in use")
     
     
+    def _drop(self, shard, path):
+        shard.policy.remove(path)
+        del shard.frames[path]
+        shard.evictions += 1
+    
+    
+    # writes back a frame picked by _evict. the log flush and the write run without the shard lock, so hits on
+    # other pages of the shard don't wait for them
+    def _write_back(self, shard, path, frame):
+        try:
+            self._flush_frame(path, frame)
+        except BaseException:
+            # the page stays in the pool, still dirty, and can be evicted again later
+            with shard.lock:
+                frame.dirty = True
+                evicted, frame.evicted = frame.evicted, None
+            evicted.set()
+            raise
+        with shard.lock:
+            # a discard may have dropped the frame in the meantime
+            if shard.frames.get(path) is frame:
+                self._drop(shard, path)
+        frame.evicted.set()
+    
+    
     def get_page(self, path: str):
-            # if page is already in buffer pool, update it's position in lru list and return page
-            if path in self.frames:
-                frame = self.frames[path]
-                frame.pin()
-                self._touch(path)
+            shard = self._shard(path)
+            
+            while True:
+                with shard.lock:
+                    # if page is already in buffer pool, let the replacement policy know it was used and return page
+                    frame = shard.frames.get(path)
+                    if frame is not None and frame.evicted is None:
+                        frame.pin()
+                        shard.policy.record_access(path)
+                        shard.hits += 1
+                        loading = False
+                        break
+                    if frame is None:
+                        # if shard is full, try to evict
+                        victim = self._evict(shard)
+                        if victim is None:
+                            shard.misses += 1
+                            
+                            # reserve the frame before reading, so other threads asking for the page wait for this read
+                            frame = Frame(None)
+                            frame.pin()
+                            shard.frames[path] = frame
+                            shard.policy.insert(path)
+                            loading = True
+                            break
+                    else:
+                        # the page is being written back by an eviction, it is read again once that is done
+                        victim = (None, frame.evicted)
+                
+                if victim[0] is None:
+                    victim[1].wait()
+                else:
+                    self._write_back(shard, *victim)
+                    
+            if frame.page is not None:
                 return frame.page
             
-            # if buffer pool is full, try to evict
-            self._evict()
+            if not loading:
+                frame.loaded.wait()
+                if frame.page is None:
+                    # loading thread failed and dropped the frame, try again from scratch
+                    with shard.lock:
+                        frame.unpin()
+                    return self.get_page(path)
+                return frame.page
+            
+            # read from disk without holding the shard lock
+            try:
+                frame.page = self._read_page_from_disk(path)
+            except Exception:
+                with shard.lock:
+                    if shard.frames.get(path) is frame:
+                        del shard.frames[path]
+                        shard.policy.remove(path)
+                frame.loaded.set()
+                raise
             
-            page = self._read_page_from_disk(path)
-            frame = Frame(page)
-            frame.pin()
-            self.frames[path] = frame
-            self._touch(path)
-            return page
+            frame.loaded.set()
+            return frame.page
     
     
     def unpin(self, path: str):
-            if path in self.frames:
-                self.frames[path].unpin()
+            shard = self._shard(path)
+            with shard.lock:
+                frame = shard.frames.get(path)
+                if frame is not None:
+                    frame.unpin()
             
             
-    def mark_dirty(self, path: str):
-            if path in self.frames:
-                self.frames[path].mark_dirty()
+    """
+    :param path: string         #page that was modified, pinned by the caller
+    :param lsn: int             #log position of the change, 0 if it wasn't logged
+    """
+    def mark_dirty(self, path: str, lsn = 0):
+            # the caller has the page pinned, so the frame can't be evicted while we look it up
+            frame = self._shard(path).frames.get(path)
+            if frame is not None:
+                frame.mark_dirty(lsn)
+                
+                
+    # drops a page without writing it back, for pages that are being freed. nobody may have it pinned
+    def discard(self, path: str):
+            shard = self._shard(path)
+            with shard.lock:
+                frame = shard.frames.pop(path, None)
+                if frame is not None:
+                    shard.policy.remove(path)
+            # a flush that listed the frame before it was dropped must not write it over the freed page afterwards
+            if frame is not None:
+                with frame.latch.exclusive():
+                    frame.dirty = False
+                
+                
+    """
+    # Pins the page and holds its frame latch for the duration of the with block
+    :param path: string         #page to latch
+    :param exclusive: bool      #True to modify the page, False to only read it
+    """
+    @contextmanager
+    def latched(self, path: str, exclusive = False):
+        page = self.get_page(path)
+        frame = self._shard(path).frames[path]
+        latch = frame.latch
+        
+        if exclusive:
+            latch.acquire_exclusive()
+        else:
+            latch.acquire_shared()
+        try:
+            yield page
+        finally:
+            if exclusive:
+                frame.mark_dirty()
+                latch.release_exclusive()
+            else:
+                latch.release_shared()
+            self.unpin(path)
             
     
+    # writes the given pages back to disk if they are dirty, for readers of the segment files outside the pool
+    def flush(self, paths):
+            for path in paths:
+                shard = self._shard(path)
+                with shard.lock:
+                    frame = shard.frames.get(path)
+                # frames still loading have nothing newer than the disk
+                if frame is not None and frame.page is not None:
+                    self._flush_frame(path, frame)
+                    
+                    
     # when database is closed, all dirty pages in buffer pool need to be written back to disk
     def flush_all(self):
-            for path, frame in list(self.frames.items()):
-                if frame.dirty:
-                    self._write_page_to_disk(path, frame.page)
-                    frame.dirty = False
\ No newline at end of file
+            for shard in self.shards:
+                with shard.lock:
+                    frames = list(shard.frames.items())
+                for path, frame in frames:
+                    if frame.page is not None:
+                        self._flush_frame(path, frame)
+            self.storage.sync()
+                    
+                    
+    # bytes of page data currently held in memory
+    def memory_usage(self):
+        return sum(len(shard.frames) for shard in self.shards) * FRAME_SIZE
+    
+    
+    def stats(self):
+        frames = [frame for shard in self.shards for frame in list(shard.frames.values())]
+        return {
+            "pool_size": self.pool_size,
+            "shards": len(self.shards),
+            "frames_used": len(frames),
+            "capacity_bytes": self.pool_size * FRAME_SIZE,
+            "memory_usage": len(frames) * FRAME_SIZE,
+            "dirty_frames": sum(1 for frame in frames if frame.dirty),
+            "pinned_frames": sum(1 for frame in frames if not frame.can_evict()),
+            "hits": sum(shard.hits for shard in self.shards),
+            "misses": sum(shard.misses for shard in self.shards),
+            "evictions": sum(shard.evictions for shard in self.shards),
+        }
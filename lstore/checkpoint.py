@@ -0,0 +1,133 @@
+"""
+Checkpoints bound how much of the write-ahead log recovery has to replay. A checkpoint starts a new log generation
+and copies the page directories, version index, indexes and page lists of every table while writes are held back
+for a moment at the write gate. Dirty pages are then written back while queries carry on, and the copies are saved
+next to them once they are all on disk. Pages may hold changes made after the copies were taken, replaying the log
+from the new generation redoes those changes on top of them and ends up in the same state.
+"""
+
+from lstore.config import CHECKPOINT_INTERVAL
+from contextlib import contextmanager
+from time import perf_counter
+import threading
+
+
+class WriteGate:
+
+
+    """
+    Every operation changing a table passes the gate, a checkpoint closes it to see the tables between operations.
+    Closing lets the operations already inside finish and holds back new ones until the gate opens again.
+    """
+    def __init__(self):
+        # operations inside the gate
+        self.writers = 0
+        self.closing = False
+        self.cond = threading.Condition(threading.Lock())
+
+        self.closes = 0
+        self.closed_seconds = 0.0
+
+
+    # held for the duration of one write, writes never pass the gate twice without leaving it in between
+    @contextmanager
+    def enter(self):
+        with self.cond:
+            while self.closing:
+                self.cond.wait()
+            self.writers += 1
+        try:
+            yield
+        finally:
+            with self.cond:
+                self.writers -= 1
+                if not self.writers:
+                    self.cond.notify_all()
+
+
+    # held while the tables are copied, new writes wait from the moment it is asked for
+    @contextmanager
+    def closed(self):
+        with self.cond:
+            while self.closing:
+                self.cond.wait()
+            self.closing = True
+            closed_time_0 = perf_counter()
+            while self.writers:
+                self.cond.wait()
+        try:
+            yield
+        finally:
+            with self.cond:
+                self.closing = False
+                self.closes += 1
+                self.closed_seconds += perf_counter() - closed_time_0
+                self.cond.notify_all()
+
+
+class Checkpointer:
+
+
+    """
+    :param database: Database       #database to checkpoint
+    :param interval: float          #seconds between checkpoints
+    """
+    def __init__(self, database, interval = CHECKPOINT_INTERVAL):
+        self.database = database
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.lock = threading.Lock()
+
+        self.checkpoints = 0
+        self.skipped = 0
+        # checkpoints that raised, the next one is tried after the interval as usual
+        self.failed = 0
+        self.last_error = None
+        self.checkpoint_seconds = 0.0
+        self.max_checkpoint_seconds = 0.0
+
+        self.thread = threading.Thread(target = self._worker, daemon = True)
+        self.thread.start()
+
+
+    def _worker(self):
+        while not self.stopped.wait(self.interval):
+            checkpoint_time_0 = perf_counter()
+            try:
+                done = self.database.checkpoint()
+            except Exception as e:
+                # a disk error must not end the thread, recovery time is only bounded while checkpoints keep coming
+                with self.lock:
+                    self.failed += 1
+                    self.last_error = repr(e)
+                continue
+            checkpoint_time = perf_counter() - checkpoint_time_0
+
+            with self.lock:
+                if not done:
+                    self.skipped += 1
+                    continue
+                self.checkpoints += 1
+                self.checkpoint_seconds += checkpoint_time
+                self.max_checkpoint_seconds = max(self.max_checkpoint_seconds, checkpoint_time)
+
+
+    # waits for a running checkpoint to finish
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+
+    def stats(self):
+        gate = self.database.write_gate
+        with self.lock, gate.cond:
+            return {
+                "checkpoints": self.checkpoints,
+                "skipped": self.skipped,
+                "failed": self.failed,
+                "last_error": self.last_error,
+                "checkpoint_seconds": self.checkpoint_seconds,
+                "max_checkpoint_seconds": self.max_checkpoint_seconds,
+                "gate_closes": gate.closes,
+                "gate_closed_seconds": gate.closed_seconds,
+            }
@@ -20,4 +20,47 @@ TIMESTAMP_COLUMN = 2
 # 0 for all base records. for tail records, bitmap for which cols were updated: 1 if updated, 0 if not.
 SCHEMA_ENCODING_COLUMN = 3
 # tracks RID of original base record for each tail record
-BASE_RID_COLUMN = 4
\ No newline at end of file
+BASE_RID_COLUMN = 4
+
+# schema encoding bit of snapshot tail records. an update changing columns for the first time writes one before it
+# with their original values, merges overwrite those in the base record and older versions still read them
+SNAPSHOT_FLAG = 1 << 62
+
+# size of one page as stored on disk and held in a buffer pool frame: header plus data
+FRAME_SIZE = HEADER_SIZE + PAGE_SIZE
+
+# number of frames in the buffer pool when Database.open isn't given a size
+DEFAULT_POOL_SIZE = 4096
+
+# number of partitions of the buffer pool page table, each with its own lock
+BUFFERPOOL_SHARDS = 16
+# pools too small to give every shard this many frames use fewer shards
+MIN_FRAMES_PER_SHARD = 64
+
+# a page range is merged once its full tail pages reach this fraction of its base pages
+MERGE_TAIL_BASE_RATIO = 0.5
+# ... or once a record's chain of unmerged tail records reaches this length
+MERGE_MAX_CHAIN_LENGTH = 32
+# ranges with fewer full tail pages than this are never worth merging
+MERGE_MIN_TAIL_PAGES = 2
+# merges whose tail pages, and the base pages they wrote, a page range keeps for reads of older versions. versions
+# from before them are read as of the oldest merge kept, the pages of earlier merges are freed
+MERGE_HISTORY = 4
+# merge threads shared by every table of a database
+MERGE_WORKERS = 2
+# pages merges may read and write per second, so foreground queries keep most of the time. None for no limit
+MERGE_PAGES_PER_SECOND = 20000
+# merge processes consolidating big page ranges outside the interpreter running queries, 0 for none
+MERGE_PROCESSES = 0
+# merges reading fewer pages than this stay in the merge threads, handing them to a process costs more than it saves
+MERGE_PROCESS_MIN_PAGES = 256
+# operations wait for their write-ahead log records to be synced before returning
+WAL_SYNC_COMMIT = False
+# seconds log records may wait to be synced together with later ones: the group commit window
+WAL_COMMIT_INTERVAL = 0.01
+# buffered log bytes that make the log be written out before the interval is up
+WAL_BUFFER_BYTES = 1 << 20
+# seconds between background checkpoints, recovery replays about this much log. None for checkpoints on close only
+CHECKPOINT_INTERVAL = 30.0
+# number of partitions of the record lock table, each with its own mutex
+LOCK_PARTITIONS = 64
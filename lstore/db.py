@@ -1,6 +1,14 @@
 from lstore.table import Table
 from lstore.bufferpool import BufferPool
+from lstore.merge import MergeScheduler
+from lstore.wal import WriteAheadLog, CREATE_TABLE, DROP_TABLE, INSERT, COMMIT, ABORT
+from lstore.checkpoint import WriteGate, Checkpointer
+from lstore.lock_manager import LockManager
+from lstore.config import (DEFAULT_POOL_SIZE, MERGE_WORKERS, MERGE_PAGES_PER_SECOND, MERGE_PROCESSES, WAL_SYNC_COMMIT, WAL_COMMIT_INTERVAL,
+                           CHECKPOINT_INTERVAL)
 import os, json
+import atexit, shutil, tempfile
+import threading
 
 class Database():
 
@@ -8,13 +16,40 @@ class Database():
     def __init__(self):
         self.tables = []
         self.path = None
+        self.wal = None
+        self.checkpointer = None
+        # every table write passes it, checkpoints close it while they copy the tables
+        self.write_gate = WriteGate()
+        # record locks of the transactions running on any table
+        self.lock_manager = LockManager()
+        # one checkpoint at a time
+        self.checkpoint_lock = threading.Lock()
+        # set when the database was never opened and keeps its pages in a scratch directory
+        self.temporary = False
 
 
-    def open(self, path):
+    """
+    :param path: string                 #directory the database is stored in
+    :param pool_size: int or string     #number of buffer pool frames, or a memory budget such as "512MB"
+    :param policy: string               #buffer pool replacement policy: lru, clock or 2q
+    :param storage: string              #pread reads pages into memory, mmap reads them from mapped segment files and uses them in place without a log
+    :param merge_workers: int           #merge threads shared by every table
+    :param merge_rate: int              #pages merges may read and write per second, None for no limit
+    :param merge_processes: int         #processes consolidating big page ranges away from the query threads, 0 for none
+    :param wal: bool                    #log every change so it survives a crash, False to only save tables on close
+    :param wal_sync: bool               #queries wait for their log records to be synced, False syncs them in the background
+    :param wal_interval: float          #seconds log records wait to be synced in one group with later ones
+    :param checkpoint_interval: float   #seconds between background checkpoints, None to only checkpoint on close
+    """
+    def open(self, path, pool_size = DEFAULT_POOL_SIZE, policy = "lru", storage = "pread", merge_workers = MERGE_WORKERS, merge_rate = MERGE_PAGES_PER_SECOND,
+             merge_processes = MERGE_PROCESSES, wal = True, wal_sync = WAL_SYNC_COMMIT, wal_interval = WAL_COMMIT_INTERVAL,
+             checkpoint_interval = CHECKPOINT_INTERVAL):
         self.path = path
         os.makedirs(self.path, exist_ok = True)
         
-        self.bufferpool = BufferPool(pool_size = 32, db_root = path)
+        self.bufferpool = BufferPool(pool_size = pool_size, db_root = path, policy = policy, storage = storage, write_ahead = wal)
+        # merge thresholds can be changed on it at any time
+        self.merge_scheduler = MergeScheduler(workers = merge_workers, pages_per_second = merge_rate, processes = merge_processes)
         
         tables_dir = os.path.join(self.path, "tables")
         os.makedirs(tables_dir, exist_ok = True)
@@ -29,26 +64,141 @@ class Database():
                 with open(meta_path, 'r') as file:
                     meta = json.load(file)
                 
-                table = Table(name, meta["num_columns"], meta["key"])
-                table.db_root = self.path
-                table.bufferpool = self.bufferpool
+                # databases written with one file per page are moved into segment files first
+                self.bufferpool.storage.migrate(os.path.join(self.path, name))
+                
+                table = self._new_table(name, meta["num_columns"], meta["key"], meta.get("cumulative", False))
                 table.load(self.path)
                 self.tables.append(table)
+                
+        self.wal = None
+        if wal:
+            self.wal = WriteAheadLog(self.path, sync_commit = wal_sync, commit_interval = wal_interval)
+            unfinished = self._recover()
+            self.bufferpool.wal = self.wal
+            for table in self.tables:
+                table.wal = self.wal
+            self._roll_back(unfinished)
+                
+        # nothing reads the pages merges replaced before the last save, without a log they can be reused right away
+        for table in self.tables:
+            table.clear_retired(reusable = self.wal is None)
+            
+        self.checkpointer = None
+        if self.wal is not None and checkpoint_interval:
+            self.checkpointer = Checkpointer(self, checkpoint_interval)
+
+
+    # replays the log on top of the saved tables, each table from the checkpoint it was saved at. returns the changes
+    # of transactions that never ended: id -> ({undo list position: [(table, kind, values)]}, positions undone)
+    def _recover(self):
+        unfinished = {}
+        for generation, kind, name, values, transaction in self.wal.records():
+            if kind in (COMMIT, ABORT):
+                unfinished.pop(transaction[0], None)
+            elif kind == CREATE_TABLE:
+                self.tables = [table for table in self.tables if table.name != name]
+                table = self._new_table(name, *values)
+                table.log_generation = generation
+                self.tables.append(table)
+            elif kind == DROP_TABLE:
+                self.tables = [table for table in self.tables if table.name != name]
+            else:
+                table = self.get_table(name)
+                # tables saved at a later checkpoint already hold the changes of this generation
+                if table is not None and table.log_generation <= generation:
+                    table.replay(kind, values)
+                # changes of a transaction saved by a later checkpoint are rolled back all the same, checkpoints keep
+                # the files of running transactions
+                if table is not None and transaction is not None:
+                    transaction_id, position = transaction
+                    changes, undone = unfinished.setdefault(transaction_id, ({}, set()))
+                    if position < 0:
+                        undone.add(~position)
+                    else:
+                        changes.setdefault(position, []).append((table, kind, values))
+                    
+        # new records go to a file of their own, the replayed files are kept until the next checkpoint saves their changes
+        generations = self.wal.generations() + [table.log_generation for table in self.tables]
+        self.wal.start(max(generations, default = -1) + 1)
+        return unfinished
+        
+        
+    # rolls back the transactions a crash cut short like an abort would have, newest change first. the undo records
+    # and the abort record logged make a crash during this rollback resume it
+    def _roll_back(self, unfinished):
+        for transaction_id, (changes, undone) in unfinished.items():
+            for position in sorted(changes, reverse = True):
+                records = changes[position]
+                table, kind = records[-1][0], records[-1][1]
+                # deleting the records of an insert again does nothing, a rollback cut short in the middle of one is finished
+                if (position in undone and kind != INSERT) or table not in self.tables:
+                    continue
+                entry = table.undo_entry(kind, [values for _, _, values in records])
+                if entry is not None:
+                    table.rollback(kind, entry, (transaction_id, ~position))
+            self.wal.append(ABORT, "", (), (transaction_id, 0))
+        self.wal.flush()
+        
+        
+    """
+    # Saves every table and deletes the log written before, while queries keep running. Writes are held back
+    # only while the tables are copied, the pages are written back and the copies saved after that
+    # returns False if a bulk load was running and the checkpoint was not taken
+    """
+    def checkpoint(self):
+        with self.checkpoint_lock:
+            with self.write_gate.closed():
+                # bulk loads index their records at the end, a copy of the indexes taken before would miss them
+                if any(table.loading for table in self.tables):
+                    return False
+                generation = self.wal.rotate() if self.wal is not None else 0
+                tables = list(self.tables)
+                snapshots = [table.snapshot(generation) for table in tables]
+                
+            # pages may hold changes made after the copies, the log of the new generation redoes them on recovery
+            self.bufferpool.flush_all()
+            for table, snapshot in zip(tables, snapshots):
+                table.save_snapshot(self.path, snapshot)
+                
+            if self.wal is not None:
+                self.wal.remove_before(generation)
+            for table, snapshot in zip(tables, snapshots):
+                table.release_sealed(snapshot)
+            return True
 
 
     def close(self):
         if self.path is None:
             return
+        if self.temporary:
+            atexit.unregister(self.close)
         
-        self.bufferpool.flush_all()
+        if self.checkpointer is not None:
+            self.checkpointer.stop()
+            self.checkpointer = None
         
+        # stop merges first, they can still write pages and change page ids, then free the pages they replaced
+        self.merge_scheduler.stop()
         for table in self.tables:
-            table.flush(self.path)
+            table.deallocateQ.put(None)
+            if hasattr(table, "_deallocate_thread"):
+                table._deallocate_thread.join()
+                
+        # a scratch directory is removed right after, nothing in it needs saving
+        if not self.temporary:
+            self.checkpoint()
+        if self.wal is not None:
+            self.wal.close()
+            self.bufferpool.wal = None
+            self.wal = None
             
-        for table in self.tables:
-            table.mergeQ.put(None)
-            if hasattr(table, "_merge_thread"):
-                table._merge_thread.join()
+        self.bufferpool.storage.close()
+        
+        if self.temporary:
+            shutil.rmtree(self.path, ignore_errors = True)
+            self.path = None
+            self.temporary = False
 
 
     """
@@ -56,29 +206,70 @@ class Database():
     :param name: string         #Table name
     :param num_columns: int     #Number of Columns: all columns are integer
     :param key: int             #Index of table key in columns
+    :param cumulative: bool     #tail records carry every column updated so far, reads of the latest version touch one tail record
     """
-    def create_table(self, name, num_columns, key_index):
+    def create_table(self, name, num_columns, key_index, cumulative = False):
         # check if table name already exists
         for table in self.tables:
             if table.name == name:
                 raise RuntimeError("Table name already exists")
             
-        table = Table(name, num_columns, key_index)
-        
+        # tables of a database that was never opened still need somewhere to evict pages to, nothing to recover there
+        if self.path is None:
+            self.open(tempfile.mkdtemp(prefix = "lstore_"), wal = False)
+            self.temporary = True
+            # scripts that never open the database don't close it either, its threads and directory go at exit
+            atexit.register(self.close)
+            
+        table = self._new_table(name, num_columns, key_index, cumulative)
+        with self.write_gate.enter():
+            lsn = 0
+            if self.wal is not None:
+                lsn = self.wal.append(CREATE_TABLE, name, [num_columns, key_index, int(cumulative)])
+                table.wal = self.wal
+                table.log_generation = self.wal.generation
+            self.tables.append(table)
+            
+        if self.wal is not None:
+            self.wal.commit(lsn)
+        return table
+    
+    
+    def _new_table(self, name, num_columns, key_index, cumulative):
+        table = Table(name, num_columns, key_index, bool(cumulative))
         table.db_root = self.path
         table.bufferpool = self.bufferpool
-        
-        self.tables.append(table)
+        table.merge_scheduler = self.merge_scheduler
+        table.write_gate = self.write_gate
+        table.lock_manager = self.lock_manager
         return table
 
     
+    """
+    # Loads records from a CSV or packed int64 file into a table
+    :param name: string         #Table name
+    :param path: string         #file to load
+    :param format: string       #csv or bin, taken from the file extension if None
+    # returns the number of records loaded, a bad row raises BulkLoadError with the number loaded before it
+    """
+    def bulk_load(self, name, path, format = None):
+        table = self.get_table(name)
+        if table is None:
+            raise RuntimeError("Table not found")
+        return table.bulk_load(path, format)
+
+    
     """
     # Deletes the specified table
     """
     def drop_table(self, name):
         for i, table in enumerate(self.tables):
             if table.name == name:
-                del self.tables[i]
+                with self.write_gate.enter():
+                    del self.tables[i]
+                    lsn = self.wal.append(DROP_TABLE, name) if self.wal is not None else 0
+                if self.wal is not None:
+                    self.wal.commit(lsn)
                 return
         raise RuntimeError("Table not found")
 
@@ -0,0 +1,49 @@
+"""
+Epochs tell when pages retired by a merge can be reused. Every table operation runs inside the epoch that was
+current when it started. Retiring pages closes the current epoch, and the pages are only freed once every
+operation of that epoch or an earlier one has finished, since only those can still hold the old page ids.
+"""
+
+import threading
+
+
+class Epochs:
+
+
+    def __init__(self):
+        self.current = 0
+        # number of running operations started in each epoch
+        self.active = {}
+        self.cond = threading.Condition(threading.Lock())
+
+
+    # returns the epoch the operation runs in, to be passed to exit
+    def enter(self):
+        with self.cond:
+            epoch = self.current
+            self.active[epoch] = self.active.get(epoch, 0) + 1
+            return epoch
+
+
+    def exit(self, epoch):
+        with self.cond:
+            remaining = self.active[epoch] - 1
+            if remaining:
+                self.active[epoch] = remaining
+            else:
+                del self.active[epoch]
+                self.cond.notify_all()
+
+
+    # closes the current epoch, returns it for wait
+    def retire(self):
+        with self.cond:
+            self.current += 1
+            return self.current - 1
+
+
+    # blocks until no operation started in epoch or earlier is running
+    def wait(self, epoch):
+        with self.cond:
+            while self.active and min(self.active) <= epoch:
+                self.cond.wait()
@@ -2,15 +2,232 @@
 A data strucutre holding indices for various columns of a table. Key column should be indexd by default, other columns can be indexed through this object. Indices are usually B-Trees, but other data structures can be used as well.
 """
 
+from lstore.postings import RidSet
+from bisect import bisect_left, bisect_right, insort
+from array import array
+import os, struct, zlib
+import threading
+
+# maximum number of keys in one block of an ordered index before it is split in two
+BLOCK_SIZE = 512
+
+# saved index file: magic, format version, rid_counter of the table when saved, number of indexed columns
+INDEX_FILE_HEADER = struct.Struct('<8sIqI')
+INDEX_FILE_MAGIC = b'LSTOREIX'
+INDEX_FILE_VERSION = 1
+# per indexed column: column, index type code, number of (key, rid) pairs that follow
+INDEX_HEADER = struct.Struct('<IIq')
+# crc32 of everything before it
+INDEX_FILE_TRAILER = struct.Struct('<I')
+
+
+class HashIndex:
+
+
+    """
+    Maps every column value to the RIDs of the records holding it. O(1) point lookups, range lookups scan every key.
+    A value held by one record maps straight to its RID, values held by more records map to a RidSet.
+    """
+    def __init__(self):
+        self.postings = {}
+
+
+    def get(self, value):
+        key_rids = self.postings.get(value)
+        if key_rids is None:
+            return []
+        if isinstance(key_rids, int):
+            return [key_rids]
+        return key_rids.to_list()
+
+
+    def add(self, value, rid):
+        key_rids = self.postings.get(value)
+        # if key value is not in index, store the RID by itself
+        if key_rids is None:
+            self.postings[value] = rid
+        # second RID for the value, switch to a set. makes sure no RID is added more than once for the same key value
+        elif isinstance(key_rids, int):
+            if key_rids != rid:
+                self.postings[value] = RidSet((key_rids, rid))
+        else:
+            key_rids.add(rid)
+
+
+    # returns True if the value has no RIDs left and was removed from the index
+    def remove(self, value, rid):
+        key_rids = self.postings.get(value)
+        # if value is not in index
+        if key_rids is None:
+            return False
+
+        if isinstance(key_rids, int):
+            if key_rids != rid:
+                return False
+            del self.postings[value]
+            return True
+
+        # if RID in index, remove
+        key_rids.discard(rid)
+        # if value doesn't have any RIDs, delete value from index, a single RID is stored by itself again
+        if len(key_rids) == 0:
+            del self.postings[value]
+            return True
+        if len(key_rids) == 1:
+            self.postings[value] = next(iter(key_rids))
+        return False
+
+
+    def _extend(self, rids, key_rids):
+        if isinstance(key_rids, int):
+            rids.append(key_rids)
+        else:
+            rids.extend(key_rids)
+
+
+    def range(self, begin, end):
+        rids = []
+        for key, key_rids in self.postings.items():
+            # check that key is within specified range
+            if begin <= key <= end:
+                self._extend(rids, key_rids)
+        return rids
+
+
+    # every (key, rid) pair, keys grouped together
+    def items(self):
+        for key, key_rids in self.postings.items():
+            if isinstance(key_rids, int):
+                yield key, key_rids
+            else:
+                for rid in key_rids:
+                    yield key, rid
+
+
+    def __len__(self):
+        return len(self.postings)
+
+
+class OrderedIndex(HashIndex):
+
+
+    """
+    Hash index that also keeps its keys in order, for O(log n + k) range lookups and ordered iteration.
+    Keys are stored in sorted blocks of at most BLOCK_SIZE keys, a two-level B+-tree: the max key of every
+    block finds the block, so inserts and deletes only shift keys within one block.
+    """
+    def __init__(self):
+        super().__init__()
+        self.blocks = []
+        # largest key of each block, used to find the block a key belongs to
+        self.maxes = []
+
+
+    def add(self, value, rid):
+        is_new = value not in self.postings
+        super().add(value, rid)
+        if is_new:
+            self._insert_key(value)
+
+
+    def remove(self, value, rid):
+        removed_key = super().remove(value, rid)
+        if removed_key:
+            self._delete_key(value)
+        return removed_key
+
+
+    def _insert_key(self, value):
+        if not self.blocks:
+            self.blocks.append([value])
+            self.maxes.append(value)
+            return
+
+        block_ind = bisect_left(self.maxes, value)
+        if block_ind == len(self.blocks):
+            # larger than every key, append to the last block
+            block_ind -= 1
+            self.blocks[block_ind].append(value)
+            self.maxes[block_ind] = value
+        else:
+            insort(self.blocks[block_ind], value)
+
+        # split full blocks in half
+        block = self.blocks[block_ind]
+        if len(block) > BLOCK_SIZE:
+            half = len(block) // 2
+            self.blocks[block_ind:block_ind + 1] = [block[:half], block[half:]]
+            self.maxes[block_ind:block_ind + 1] = [block[half - 1], block[-1]]
+
+
+    def _delete_key(self, value):
+        block_ind = bisect_left(self.maxes, value)
+        if block_ind == len(self.blocks):
+            return
+
+        block = self.blocks[block_ind]
+        pos = bisect_left(block, value)
+        if pos == len(block) or block[pos] != value:
+            return
+
+        del block[pos]
+        if not block:
+            del self.blocks[block_ind]
+            del self.maxes[block_ind]
+        else:
+            self.maxes[block_ind] = block[-1]
+
+
+    # keys between begin and end, in order
+    def keys(self, begin = None, end = None):
+        block_ind = 0 if begin is None else bisect_left(self.maxes, begin)
+
+        for block in self.blocks[block_ind:]:
+            start = 0 if begin is None else bisect_left(block, begin)
+            stop = len(block) if end is None else bisect_right(block, end)
+            yield from block[start:stop]
+            if stop < len(block):
+                return
+
+
+    def range(self, begin, end):
+        rids = []
+        for key in self.keys(begin, end):
+            self._extend(rids, self.postings[key])
+        return rids
+
+
+    # every (key, rid) pair in key order, loading them back only appends to the last block
+    def items(self):
+        for key in self.keys():
+            key_rids = self.postings[key]
+            if isinstance(key_rids, int):
+                yield key, key_rids
+            else:
+                for rid in key_rids:
+                    yield key, rid
+
+
+INDEX_TYPES = {
+    "hash": HashIndex,
+    "ordered": OrderedIndex,
+}
+# index type codes used in saved index files
+INDEX_TYPE_CODES = {kind: code for code, kind in enumerate(INDEX_TYPES)}
+INDEX_TYPE_NAMES = {code: kind for kind, code in INDEX_TYPE_CODES.items()}
+
+
 class Index:
 
     def __init__(self, table):
         # One index for each table. All our empty initially.
         self.table = table
         self.indices = [None] *  table.num_columns
-        # needed 'index' key because it is used in other methods
-        self.indices[table.key] = {'index': {}}  # Initialize the key column index as a dictionary for O(1) lookups
-        
+        # the key column is used for point lookups and range sums, so it gets an ordered index
+        self.indices[table.key] = OrderedIndex()
+        # writers from several threads would split the same block at once, lookups go without it
+        self.lock = threading.Lock()
+
 
     """
     # returns the location of all records with the given value on column "column"
@@ -19,15 +236,13 @@ class Index:
         # return empty list if column number is invalid
         if column < 0 or column >= self.table.num_columns:
             return []
-        
+
         # return empty list if column is not indexed
         if self.indices[column] is None:
             return []
 
-        # get hash index dictionary for column
-        bucket = self.indices[column]['index']
-        # if exists, return value associated with key value in dictionary
-        return bucket.get(value, [])
+        # if exists, return RIDs associated with key value
+        return self.indices[column].get(value)
 
 
     """
@@ -36,36 +251,35 @@ class Index:
     def locate_range(self, begin, end, column):
         if column < 0 or column >= self.table.num_columns:
             return []
-        
+
         if self.indices[column] is None:
             return []
-        
-        rids = []
-        # get hash index dictionary for column
-        bucket = self.indices[column]['index']
-        for key, key_rids in bucket.items():
-            # check that key is within specified range
-            if begin <= key <= end:
-                rids.extend(key_rids)
-        return rids
-     
-    
-    def create_index(self, column):
+
+        return self.indices[column].range(begin, end)
+
+
+    """
+    :param column: int      #column to index
+    :param kind: string     #hash for point lookups only, ordered for point and range lookups
+    """
+    def create_index(self, column, kind = "hash"):
         if column < 0 or column >= self.table.num_columns:
-            return 
-        
+            return
+
         # make sure index doesn't already exist for column
         if self.indices[column] is not None:
-            return 
-        
-        self.indices[column] = {'index': {}}
-        
+            return
+
+        if kind not in INDEX_TYPES:
+            raise ValueError(f"Unknown index type: {kind}")
+        self.indices[column] = INDEX_TYPES[kind]()
+
         # for every record, get latest value for column and add it to index
         for rid in self.table.page_directory.keys():
             value = self.table.read_version(rid, column, 0)
             self.add_to_index(column, value, rid)
 
-    
+
     # optional: Drop index of specific column
     def drop_index(self, column_number):
         self.indices[column_number] = None
@@ -74,35 +288,151 @@ class Index:
     def add_to_index(self, column, value, rid):
         if column < 0 or column >= self.table.num_columns:
             return
-        
+
         if self.indices[column] is None:
             return
-        
-        bucket = self.indices[column]['index']
-        # if key value is not in index, create an empty list for its RID
-        if value not in bucket:
-            bucket[value] = []
-        # makes sure no RID is added more than once for the smame key value
-        if rid not in bucket[value]:
-            bucket[value].append(rid)
+
+        with self.lock:
+            self.indices[column].add(value, rid)
+
+
+    """
+    :param column: int          #column the values belong to
+    :param values: list[int]    #column value of each record
+    :param rids: list[int]      #RID of each record, in the same order as values
+    """
+    def add_many(self, column, values, rids):
+        if column < 0 or column >= self.table.num_columns:
+            return
+
+        if self.indices[column] is None:
+            return
+
+        index = self.indices[column]
+        with self.lock:
+            for value, rid in zip(values, rids):
+                index.add(value, rid)
 
 
     def remove_from_index(self, column, value, rid):
         if column < 0 or column >= self.table.num_columns:
             return
-        
+
         # if index doesn't exist
         if self.indices[column] is None:
             return
-        
-        bucket = self.indices[column]['index']
-        # if value is not in index
-        if value not in bucket:
-            return
-        
-        # if RID in index, remove
-        if rid in bucket[value]:
-            bucket[value].remove(rid)
-            # if value doesn't have any RIDs, delete value from index
-            if len(bucket[value]) == 0:
-                del bucket[value]
\ No newline at end of file
+
+        with self.lock:
+            self.indices[column].remove(value, rid)
+
+
+    # mapping of indexed column to its index type
+    def kinds(self):
+        kinds = {}
+        for column, index in enumerate(self.indices):
+            if index is not None:
+                kinds[column] = "ordered" if isinstance(index, OrderedIndex) else "hash"
+        return kinds
+
+
+    """
+    # Copies the postings of every index, cheap enough to take while writes are held back for a checkpoint
+    # returns a list of (column, index type, postings) for save
+    """
+    def snapshot(self):
+        snapshot = []
+        with self.lock:
+            for column, kind in self.kinds().items():
+                postings = dict(self.indices[column].postings)
+                # values held by one record are plain RIDs, only the sets of the others can still change
+                for value, key_rids in postings.items():
+                    if not isinstance(key_rids, int):
+                        postings[value] = key_rids.copy()
+                snapshot.append((column, kind, postings))
+        return snapshot
+
+
+    """
+    # Writes every index to one file as packed (key, rid) arrays with a checksum
+    :param path: string         #file to write
+    :param rid_counter: int     #rid_counter of the table, load checks the file was saved with the same one
+    :param snapshot: list       #taken by snapshot, None to save the indices as they are now
+    """
+    def save(self, path, rid_counter, snapshot = None):
+        if snapshot is None:
+            snapshot = self.snapshot()
+        parts = [INDEX_FILE_HEADER.pack(INDEX_FILE_MAGIC, INDEX_FILE_VERSION, rid_counter, len(snapshot))]
+
+        for column, kind, postings in snapshot:
+            keys = array('q')
+            rids = array('q')
+            # ordered indexes are saved in key order, loading them back only appends to the last block
+            for key in (sorted(postings) if kind == "ordered" else postings):
+                key_rids = postings[key]
+                if isinstance(key_rids, int):
+                    keys.append(key)
+                    rids.append(key_rids)
+                else:
+                    for rid in key_rids:
+                        keys.append(key)
+                        rids.append(rid)
+            parts.append(INDEX_HEADER.pack(column, INDEX_TYPE_CODES[kind], len(keys)))
+            parts.append(keys.tobytes())
+            parts.append(rids.tobytes())
+
+        payload = b''.join(parts)
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as file:
+            file.write(payload)
+            file.write(INDEX_FILE_TRAILER.pack(zlib.crc32(payload)))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp, path)
+
+
+    """
+    # Replaces the indices with the ones saved in path
+    :param path: string         #file written by save
+    :param rid_counter: int     #rid_counter of the table, the file is stale if it was saved with another one
+    # returns False, leaving the indices untouched, if the file is missing, damaged or stale
+    """
+    def load(self, path, rid_counter):
+        if not os.path.exists(path):
+            return False
+
+        with open(path, "rb") as file:
+            raw_bytes = file.read()
+
+        if len(raw_bytes) < INDEX_FILE_HEADER.size + INDEX_FILE_TRAILER.size:
+            return False
+        payload = memoryview(raw_bytes)[:-INDEX_FILE_TRAILER.size]
+        (checksum,) = INDEX_FILE_TRAILER.unpack_from(raw_bytes, len(payload))
+        if zlib.crc32(payload) != checksum:
+            return False
+
+        magic, version, saved_rid_counter, num_indexes = INDEX_FILE_HEADER.unpack_from(payload, 0)
+        if magic != INDEX_FILE_MAGIC or version != INDEX_FILE_VERSION or saved_rid_counter != rid_counter:
+            return False
+
+        indices = [None] * self.table.num_columns
+        pos = INDEX_FILE_HEADER.size
+        for _ in range(num_indexes):
+            column, code, count = INDEX_HEADER.unpack_from(payload, pos)
+            pos += INDEX_HEADER.size
+            if column >= self.table.num_columns or code not in INDEX_TYPE_NAMES:
+                return False
+
+            keys = array('q')
+            keys.frombytes(payload[pos:pos + count * keys.itemsize])
+            pos += count * keys.itemsize
+            rids = array('q')
+            rids.frombytes(payload[pos:pos + count * rids.itemsize])
+            pos += count * rids.itemsize
+
+            index = INDEX_TYPES[INDEX_TYPE_NAMES[code]]()
+            for key, rid in zip(keys, rids):
+                index.add(key, rid)
+            indices[column] = index
+
+        self.indices = indices
+        return True
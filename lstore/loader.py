@@ -0,0 +1,101 @@
+"""
+Readers for bulk loading. Each reader streams a file and yields its rows in chunks of at most chunk_size rows,
+so a load only ever holds one chunk of the input in memory however large the file is.
+"""
+
+from array import array
+import csv, os, sys
+
+# rows of a binary file are num_columns signed 64-bit little-endian integers, one after another
+BINARY_TYPE = 'q'
+
+
+class BulkLoadError(ValueError):
+
+
+    """
+    A load stopped by a bad row. Rows are loaded in file order, the first ones stay in the table and the load can
+    be resumed after them.
+    :param message: string
+    :param loaded: int          #number of rows loaded, the first rows of the file
+    """
+    def __init__(self, message, loaded):
+        super().__init__(message)
+        self.loaded = loaded
+
+
+"""
+:param path: string             #CSV file, one record per line
+:param num_columns: int         #number of values in every row
+:param chunk_size: int          #maximum number of rows per chunk
+"""
+def read_csv(path, num_columns, chunk_size):
+    with open(path, newline = '') as file:
+        chunk = []
+        for line_number, row in enumerate(csv.reader(file)):
+            # skip blank lines
+            if not row or all(not value.strip() for value in row):
+                continue
+
+            try:
+                values = tuple(int(value) for value in row)
+            except ValueError:
+                # a header line is allowed before the first record
+                if line_number == 0:
+                    continue
+                raise ValueError(f"{path}:{line_number + 1}: values must be integers")
+
+            if len(values) != num_columns:
+                raise ValueError(f"{path}:{line_number + 1}: expected {num_columns} values, got {len(values)}")
+
+            chunk.append(values)
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+
+        if chunk:
+            yield chunk
+
+
+"""
+:param path: string             #file of packed int64 values, num_columns per record
+:param num_columns: int         #number of values in every row
+:param chunk_size: int          #maximum number of rows per chunk
+"""
+def read_binary(path, num_columns, chunk_size):
+    row_bytes = num_columns * array(BINARY_TYPE).itemsize
+    if os.path.getsize(path) % row_bytes != 0:
+        raise ValueError(f"{path}: size is not a multiple of {num_columns} int64 values")
+
+    with open(path, 'rb') as file:
+        while True:
+            raw_bytes = file.read(chunk_size * row_bytes)
+            if not raw_bytes:
+                break
+
+            values = array(BINARY_TYPE)
+            values.frombytes(raw_bytes)
+            if sys.byteorder != 'little':
+                values.byteswap()
+
+            yield [tuple(values[start:start + num_columns]) for start in range(0, len(values), num_columns)]
+
+
+READERS = {
+    "csv": read_csv,
+    "bin": read_binary,
+}
+
+
+"""
+:param path: string             #file to load
+:param num_columns: int         #number of values in every row
+:param chunk_size: int          #maximum number of rows per chunk
+:param format: string           #csv or bin, taken from the file extension if None
+"""
+def read_rows(path, num_columns, chunk_size, format = None):
+    if format is None:
+        format = os.path.splitext(path)[1].lstrip('.').lower()
+    if format not in READERS:
+        raise ValueError(f"Unknown bulk load format: {format}")
+    return READERS[format](path, num_columns, chunk_size)
@@ -0,0 +1,121 @@
+"""
+Record locks for strict two-phase locking. Transactions lock the records their queries read shared and the records
+they change exclusive, and hold every lock until they commit or abort. A lock that can't be granted right away is
+refused instead of waited for (no-wait), the query fails and its transaction aborts, so transactions never wait on
+each other in a cycle.
+"""
+
+from lstore.config import LOCK_PARTITIONS
+import threading
+
+
+class RecordLock:
+
+
+    def __init__(self):
+        # transactions holding the lock shared
+        self.shared = set()
+        # transaction holding the lock exclusive, None if nobody does
+        self.exclusive = None
+
+
+    def is_free(self):
+        return not self.shared and self.exclusive is None
+
+
+class LockPartition:
+
+
+    """
+    One partition of the lock table. Each has its own mutex, so transactions locking records in different
+    partitions never wait on each other.
+    """
+    def __init__(self):
+        self.mutex = threading.Lock()
+        # mapping of locked key to its lock, keys leave once nobody holds their lock
+        self.locks = {}
+
+        self.granted = 0
+        self.refused = 0
+
+
+class LockManager:
+
+
+    """
+    :param partitions: int      #number of partitions of the lock table
+    """
+    def __init__(self, partitions = LOCK_PARTITIONS):
+        self.partitions = [LockPartition() for _ in range(partitions)]
+
+
+    def _partition(self, key):
+        return self.partitions[hash(key) % len(self.partitions)]
+
+
+    """
+    :param owner: Transaction   #transaction asking for the lock
+    :param key: tuple           #record to lock, (table name, primary key)
+    :param exclusive: bool      #True to change the record, False to only read it
+    # returns True if the owner holds the lock now, False if another transaction holds it in a conflicting mode
+    """
+    def acquire(self, owner, key, exclusive = False):
+        partition = self._partition(key)
+        with partition.mutex:
+            lock = partition.locks.get(key)
+            if lock is None:
+                lock = partition.locks[key] = RecordLock()
+
+            if lock.exclusive is owner:
+                granted = True
+            elif exclusive:
+                # a shared lock is upgraded only if nobody else reads the record
+                granted = lock.exclusive is None and lock.shared <= {owner}
+                if granted:
+                    lock.shared.discard(owner)
+                    lock.exclusive = owner
+            else:
+                granted = lock.exclusive is None
+                if granted:
+                    lock.shared.add(owner)
+
+            if granted:
+                partition.granted += 1
+            else:
+                partition.refused += 1
+                if lock.is_free():
+                    del partition.locks[key]
+            return granted
+
+
+    """
+    :param owner: Transaction   #transaction that is done with the locks
+    :param keys: iterable       #records the owner locked
+    """
+    def release(self, owner, keys):
+        for key in keys:
+            partition = self._partition(key)
+            with partition.mutex:
+                lock = partition.locks.get(key)
+                if lock is None:
+                    continue
+                if lock.exclusive is owner:
+                    lock.exclusive = None
+                lock.shared.discard(owner)
+                if lock.is_free():
+                    del partition.locks[key]
+
+
+    def stats(self):
+        granted = refused = held = 0
+        for partition in self.partitions:
+            with partition.mutex:
+                granted += partition.granted
+                refused += partition.refused
+                held += len(partition.locks)
+        return {
+            "granted": granted,
+            "refused": refused,
+            "held": held,
+            "partitions": len(self.partitions),
+        }
@@ -0,0 +1,275 @@
+"""
+Merge scheduling for a whole database. Tables report every update, the scheduler decides when a page range is worth
+merging and hands it to a pool of merge threads shared by all tables. Merges are paced to a budget of pages per
+second so a burst of them doesn't take the interpreter away from foreground queries.
+
+Consolidating a page range is plain Python decoding and copying of integers and holds the GIL while it runs. Big
+ranges can instead be consolidated in a process pool: the merge process reads the segment files directly, writes the
+new base pages to page ids chosen by the table and hands back what the table needs to install them.
+"""
+
+from lstore.config import (MERGE_TAIL_BASE_RATIO, MERGE_MAX_CHAIN_LENGTH, MERGE_MIN_TAIL_PAGES, MERGE_WORKERS, MERGE_PAGES_PER_SECOND,
+                           MERGE_PROCESSES, MERGE_PROCESS_MIN_PAGES, RID_COLUMN, BASE_RID_COLUMN, SCHEMA_ENCODING_COLUMN)
+from lstore.storage import SegmentStorage
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from time import perf_counter, sleep
+import multiprocessing
+import threading
+import queue
+
+
+"""
+# Applies the full tail pages of a page range to copies of its base pages and writes the copies to new page ids
+:param plan: dict               #pages to read and write, made by Table._merge_plan
+:param open_page: function      #path -> context manager holding the page while it is read
+:param write_page: function     #(path, page) -> writes a consolidated base page
+# returns the TPS after the merge and the record count of every written page
+"""
+def consolidate(plan, open_page, write_page):
+    num_columns = plan["num_columns"]
+    base_pages = plan["base_pages"]
+    tail_pages = plan["tail_pages"]
+    user_cols = range(5, num_columns + 5)
+
+    cons_pages = {}
+    for col in user_cols:
+        for page_ind, path in enumerate(base_pages[col]):
+            with open_page(path) as base_page:
+                cons_pages[col, page_ind] = base_page.copy()
+
+    base_lookup = {}
+    for page_ind, path in enumerate(base_pages[RID_COLUMN]):
+        with open_page(path) as rid_page:
+            base_rids = rid_page.read_all()
+        for offset, base_rid in enumerate(base_rids):
+            # deleted records have RID 0
+            if base_rid != 0 or (page_ind, offset) == (0, 0):
+                base_lookup[base_rid] = (page_ind, offset)
+
+    # first pass over the metadata pages only: the newest tail record updating a column holds its merged value,
+    # so records are visited newest first and the first one seen for a record and column wins.
+    # winners[user_col] maps a tail page to the (tail offset, base page, base offset) cells taken from it
+    winners = [{} for _ in range(num_columns)]
+    merged = [set() for _ in range(num_columns)]
+    tps = plan["tps"]
+    for tail_ind in range(len(tail_pages[RID_COLUMN]) - 1, -1, -1):
+        with open_page(tail_pages[RID_COLUMN][tail_ind]) as rid_page:
+            tail_rids = rid_page.read_all()
+        with open_page(tail_pages[BASE_RID_COLUMN][tail_ind]) as base_rid_page:
+            tail_base_rids = base_rid_page.read_all()
+        with open_page(tail_pages[SCHEMA_ENCODING_COLUMN][tail_ind]) as schema_page:
+            schemas = schema_page.read_all()
+        tps = max(tps, max(tail_rids, default = tps))
+
+        for tail_offset in range(len(tail_rids) - 1, -1, -1):
+            base_rid = tail_base_rids[tail_offset]
+            base_info = base_lookup.get(base_rid)
+            if base_info is None:
+                continue
+            schema = schemas[tail_offset]
+
+            for user_col in range(num_columns):
+                if (schema >> user_col) & 1 and base_rid not in merged[user_col]:
+                    merged[user_col].add(base_rid)
+                    winners[user_col].setdefault(tail_ind, []).append((tail_offset,) + base_info)
+
+    # second pass one column at a time, every tail page of the column is pinned once for all its cells
+    for user_col in range(num_columns):
+        for tail_ind, cells in winners[user_col].items():
+            with open_page(tail_pages[user_col + 5][tail_ind]) as tail_page:
+                tail_values = tail_page.values
+                for tail_offset, base_page_ind, base_offset in cells:
+                    cons_pages[user_col + 5, base_page_ind].values[base_offset] = tail_values[tail_offset]
+
+    record_counts = {}
+    for (col, page_ind), cons_page in cons_pages.items():
+        write_page(plan["new_base_pages"][col][page_ind], cons_page)
+        record_counts[col, page_ind] = cons_page.num_records
+
+    return tps, record_counts
+
+
+# consolidate run in a merge process, which has no buffer pool and works on the segment files themselves
+def consolidate_in_process(plan):
+    storage = SegmentStorage()
+
+    @contextmanager
+    def open_page(path):
+        yield storage.read_page(*path)
+
+    def write_page(path, page):
+        storage.write_page(*path, page)
+
+    try:
+        return consolidate(plan, open_page, write_page)
+    finally:
+        storage.close()
+
+
+class MergeScheduler:
+
+
+    """
+    :param workers: int                 #number of merge threads
+    :param tail_base_ratio: float       #merge once full tail pages reach this fraction of the base pages of a range
+    :param max_chain_length: int        #merge once a record has this many unmerged tail records
+    :param min_tail_pages: int          #never merge ranges with fewer full tail pages
+    :param pages_per_second: int        #pages merges may read and write per second, None for no limit
+    :param processes: int               #merge processes for big ranges, 0 to consolidate every range in the merge threads
+    :param process_min_pages: int       #ranges whose merge reads at least this many pages go to a merge process
+    """
+    def __init__(self, workers = MERGE_WORKERS, tail_base_ratio = MERGE_TAIL_BASE_RATIO, max_chain_length = MERGE_MAX_CHAIN_LENGTH,
+                 min_tail_pages = MERGE_MIN_TAIL_PAGES, pages_per_second = MERGE_PAGES_PER_SECOND,
+                 processes = MERGE_PROCESSES, process_min_pages = MERGE_PROCESS_MIN_PAGES):
+        self.tail_base_ratio = tail_base_ratio
+        self.max_chain_length = max_chain_length
+        self.min_tail_pages = min_tail_pages
+        self.pages_per_second = pages_per_second
+        self.process_min_pages = process_min_pages
+
+        # spawned rather than forked, forking copies the locks of the other threads in whatever state they are in.
+        # scripts starting merge processes need the usual __main__ guard since spawned processes import them
+        self.process_pool = None
+        if processes:
+            self.process_pool = ProcessPoolExecutor(max_workers = processes, mp_context = multiprocessing.get_context("spawn"))
+
+        self.mergeQ = queue.Queue()
+        # (table, page range) pairs queued or being merged, a range is never queued twice
+        self.scheduled = set()
+        self.lock = threading.Lock()
+
+        self.merges = 0
+        self.merge_seconds = 0.0
+        self.pages_rewritten = 0
+        self.tail_pages_merged = 0
+        self.throttled_seconds = 0.0
+        self.max_queue_depth = 0
+        self.process_merges = 0
+        # merges that raised, the range stays as it was and can be scheduled again
+        self.failed_merges = 0
+        self.last_error = None
+
+        self.workers = [threading.Thread(target = self._worker, daemon = True) for _ in range(workers)]
+        for worker in self.workers:
+            worker.start()
+
+
+    """
+    # Called after every update, queues the page range for a merge if it crossed a threshold
+    :param table: Table
+    :param range_id: int            #page range the update wrote to
+    :param chain_length: int        #unmerged tail records of the updated record
+    """
+    def updated(self, table, range_id, chain_length):
+        page_range = table.page_ranges[range_id]
+        # the last tail page is still being filled and is never merged
+        full_tail_pages = len(page_range.tail_pages[0]) - 1
+        if full_tail_pages < self.min_tail_pages:
+            return
+        if full_tail_pages < self.tail_base_ratio * len(page_range.base_pages[0]) and chain_length < self.max_chain_length:
+            return
+        self.schedule(table, range_id)
+
+
+    def schedule(self, table, range_id):
+        with self.lock:
+            if (table, range_id) in self.scheduled:
+                return
+            self.scheduled.add((table, range_id))
+            self.mergeQ.put((table, range_id))
+            self.max_queue_depth = max(self.max_queue_depth, self.mergeQ.qsize())
+
+
+    # merge processes only pay off when the pages of a range take longer to consolidate than to hand over
+    def _executor(self, table, range_id):
+        if self.process_pool is None:
+            return None
+        page_range = table.page_ranges[range_id]
+        full_tail_pages = len(page_range.tail_pages[0]) - 1
+        pages = full_tail_pages * len(page_range.tail_pages) + len(page_range.base_pages[0]) * (table.num_columns + 1)
+        return self.process_pool if pages >= self.process_min_pages else None
+
+
+    def _worker(self):
+        while True:
+            job = self.mergeQ.get()
+            if job is None:
+                break
+
+            table, range_id = job
+            executor = None
+            merged = None
+            try:
+                merge_time_0 = perf_counter()
+                executor = self._executor(table, range_id)
+                merged = table.merge_page_range(range_id, executor)
+                merge_time = perf_counter() - merge_time_0
+            except Exception as e:
+                # a failed merge must not take the worker down with it, the queued jobs still need one
+                with self.lock:
+                    self.failed_merges += 1
+                    self.last_error = repr(e)
+            finally:
+                with self.lock:
+                    self.scheduled.discard(job)
+
+            if not merged:
+                continue
+            base_pages, tail_pages = merged
+            pages = base_pages + tail_pages
+
+            with self.lock:
+                self.merges += 1
+                self.merge_seconds += merge_time
+                self.pages_rewritten += base_pages
+                self.tail_pages_merged += tail_pages
+                if executor is not None:
+                    self.process_merges += 1
+
+            # wait out the rest of the time the merge was allowed for its pages before taking the next one
+            if self.pages_per_second:
+                pause = pages / self.pages_per_second - merge_time
+                if pause > 0:
+                    sleep(pause)
+                    with self.lock:
+                        self.throttled_seconds += pause
+
+
+    # waits for running merges to finish, merges still queued are dropped
+    def stop(self):
+        while True:
+            try:
+                job = self.mergeQ.get_nowait()
+            except queue.Empty:
+                break
+            if job is not None:
+                with self.lock:
+                    self.scheduled.discard(job)
+
+        for _ in self.workers:
+            self.mergeQ.put(None)
+        for worker in self.workers:
+            worker.join()
+        self.workers = []
+
+        if self.process_pool is not None:
+            self.process_pool.shutdown()
+            self.process_pool = None
+
+
+    def stats(self):
+        with self.lock:
+            return {
+                "merges": self.merges,
+                "process_merges": self.process_merges,
+                "merge_seconds": self.merge_seconds,
+                "pages_rewritten": self.pages_rewritten,
+                "tail_pages_merged": self.tail_pages_merged,
+                "throttled_seconds": self.throttled_seconds,
+                "queue_depth": self.mergeQ.qsize(),
+                "max_queue_depth": self.max_queue_depth,
+                "scheduled": len(self.scheduled),
+                "failed_merges": self.failed_merges,
+                "last_error": self.last_error,
+            }
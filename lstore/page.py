@@ -1,80 +1,133 @@
 import struct
-from lstore.config import INT_SIZE, PAGE_SIZE, HEADER_SIZE, MAX_RECORDS_PER_PAGE
+from array import array
+from lstore.config import PAGE_SIZE, HEADER_SIZE, MAX_RECORDS_PER_PAGE, FRAME_SIZE
+
+# number of records in the page, stored in the first 8 bytes
+HEADER = struct.Struct('<Q')
+# every value is a signed 64-bit integer. pages are read through a typed view in machine byte order,
+# which matches the little-endian files written so far on every platform we run on
+VALUE_TYPE = 'q'
 
 class Page:
-    
 
-    def __init__(self):
-        self.num_records = 0
-        # allocate 4096 bytes of empty space
-        self.data = bytearray(PAGE_SIZE)
-        
+
+    """
+    :param buffer: bytearray or memoryview      #header followed by page data, None allocates a new empty page
+    """
+    def __init__(self, buffer = None):
+        if buffer is None:
+            # allocate space for the header and 4096 bytes of data
+            buffer = bytearray(FRAME_SIZE)
+
+        # the buffer is either owned by the page or a window into a memory-mapped segment, both are used without copying
+        self.buffer = memoryview(buffer)
+        self.data = self.buffer[HEADER_SIZE:]
+        # int64 view of the data, indexing it decodes one value without allocating a slice
+        self.values = self.data.cast(VALUE_TYPE)
+        (self.num_records,) = HEADER.unpack_from(self.buffer, 0)
+        # (segment, page id) of the mapping the buffer is a window into, None if the page owns its buffer
+        self.origin = None
+
 
     def has_capacity(self):
         return self.num_records < MAX_RECORDS_PER_PAGE
-    
+
+    """
+    :param value: int
     """
-    :param value: int     
-    """ 
     def write(self, value):
         if not self.has_capacity():
             raise RuntimeError("Page is full")
-        
-        # compute the start index to insert new record at
-        start = self.num_records * INT_SIZE
-        # insert the integer as 8 bytes with order of bytes being least significant first
-        self.data[start:start + INT_SIZE] = value.to_bytes(INT_SIZE, byteorder = 'little')
-        
+
+        # insert the integer at the end of the page, straight into the buffer
+        self.values[self.num_records] = value
+
         self.num_records += 1
-        
+
     """
     :param value: int
-    """     
+    """
     def read(self, value):
         if value < 0 or value >= self.num_records:
             raise RuntimeError("Index out of bounds")
-        
-        # compute the start index to read record from
-        start = value * INT_SIZE
-        # read 8 bytes from bytearray as one integer with order of bytes matching how it was written
-        return int.from_bytes(self.data[start:start + INT_SIZE], byteorder='little')
-    
+
+        # decode one integer directly from the buffer without slicing it
+        return self.values[value]
+
+
+    """
+    :param offsets: iterable of int     #record offsets to read
+    """
+    def read_many(self, offsets):
+        values = self.values
+        num_records = self.num_records
+        result = []
+        for offset in offsets:
+            if offset < 0 or offset >= num_records:
+                raise RuntimeError("Index out of bounds")
+            result.append(values[offset])
+        return result
+
+
+    # every value in the page, decoded in one call
+    def read_all(self):
+        return self.values[:self.num_records].tolist()
+
+
+    # zero-copy int64 view of the records in the page, for whole-column work
+    def view(self):
+        return self.values[:self.num_records]
+
+
+    """
+    :param values: iterable of int      #values appended to the page in order
+    """
+    def write_many(self, values):
+        values = array(VALUE_TYPE, values)
+        count = len(values)
+        if self.num_records + count > MAX_RECORDS_PER_PAGE:
+            raise RuntimeError("Page is full")
+
+        # copy all values into the buffer at once
+        self.values[self.num_records:self.num_records + count] = values
+        self.num_records += count
+
 
     # might not need for milestone 1
     def update(self, offset, value):
         if offset <0 or offset >= self.num_records:
             raise RuntimeError("Index out of bounds")
 
-        start = offset * INT_SIZE
-        self.data[start:start + INT_SIZE] = int(value).to_bytes(INT_SIZE, byteorder='little', signed=True)
-        
+        self.values[offset] = int(value)
+
+
+    # copy of the page in a buffer of its own, taken with one copy of the buffer
+    def copy(self):
+        page = Page(bytearray(self.buffer))
+        page.num_records = self.num_records
+        return page
+
+
+    # store the number of records in the header so the buffer can be written to disk as is
+    def sync_header(self):
+        HEADER.pack_into(self.buffer, 0, self.num_records)
+        return self.buffer
+
+
     # turn the page into raw bytes to be written to disk
     def to_bytes(self):
-        # store the number of records in page as first 8 bytes of page 
-        header = struct.pack('<Q', self.num_records)
-        
         if len(self.data) != PAGE_SIZE:
             raise RuntimeError("Page must be exactly PAGE_SIZE bytes")
-        
-        return header + bytes(self.data)
-    
-    
+
+        return bytes(self.sync_header())
+
+
     # turn raw_bytes from disk into page object
     @classmethod
     def from_bytes(cls, raw_bytes):
         # make sure size is correct
         if len(raw_bytes) != HEADER_SIZE + PAGE_SIZE:
             raise RuntimeError("Raw bytes must be exactly HEADER + PAGE_SIZE bytes")
-        
-        # unpack first 8 bytes to get num_records
-        (num_records,) = struct.unpack('<Q', raw_bytes[:HEADER_SIZE])
-        
-        # extract page data
-        data = raw_bytes[HEADER_SIZE:]
-        
-        # create page object 
-        page = cls()
-        page.num_records = num_records
-        page.data[:] = data
-        
-        return page
\ No newline at end of file
+
+        # copy into a buffer owned by the new page, header gives num_records
+        return cls(bytearray(raw_bytes))
@@ -0,0 +1,184 @@
+"""
+Page directories map RIDs to record locations. RIDs come from one dense counter per table, so a directory is
+an int64 array indexed by RID holding each record's (page range, page, offset) packed into one integer, with a
+tombstone for RIDs it doesn't hold. That is 8 bytes per RID instead of a dict entry and a tuple, and a snapshot
+of the directories and the version index is their raw arrays, each written and read back with a single call.
+"""
+
+from lstore.version_index import VersionIndex
+from array import array
+import os, struct, zlib
+
+# bits of a packed location: page range | page index | offset in page
+OFFSET_BITS = 16
+PAGE_BITS = 24
+RANGE_BITS = 23
+
+# location of RIDs that are not in the directory
+TOMBSTONE = -1
+
+# magic, format version, rid_counter of the table when saved, number of arrays that follow
+SNAPSHOT_HEADER = struct.Struct('<8sIqI')
+SNAPSHOT_MAGIC = b'LSTOREPD'
+SNAPSHOT_VERSION = 3
+# number of values in each array
+ARRAY_HEADER = struct.Struct('<q')
+# crc32 of everything before it
+SNAPSHOT_TRAILER = struct.Struct('<I')
+
+
+def pack_location(page_range_ind, page_ind, offset):
+    if page_range_ind >= 1 << RANGE_BITS or page_ind >= 1 << PAGE_BITS or offset >= 1 << OFFSET_BITS:
+        raise OverflowError("Record location doesn't fit in a packed location")
+    return (page_range_ind << (PAGE_BITS + OFFSET_BITS)) | (page_ind << OFFSET_BITS) | offset
+
+
+def unpack_location(location):
+    return (
+        location >> (PAGE_BITS + OFFSET_BITS),
+        (location >> OFFSET_BITS) & ((1 << PAGE_BITS) - 1),
+        location & ((1 << OFFSET_BITS) - 1),
+    )
+
+
+class PageDirectory:
+
+
+    def __init__(self, locations = None):
+        # packed location of every RID, TOMBSTONE where the RID isn't in the directory
+        self.locations = locations if locations is not None else array('q')
+
+
+    def __getitem__(self, rid):
+        if 0 <= rid < len(self.locations):
+            location = self.locations[rid]
+            if location != TOMBSTONE:
+                return unpack_location(location)
+        raise KeyError(rid)
+
+
+    def __setitem__(self, rid, location):
+        self._grow(rid + 1)
+        self.locations[rid] = pack_location(*location)
+
+
+    """
+    # Adds count consecutive RIDs stored at consecutive offsets of one page
+    :param first_rid: int           #RID of the first record
+    :param page_range_ind: int      #page range of the records
+    :param page_ind: int            #page of the records in the page range
+    :param first_offset: int        #offset of the first record in the page
+    :param count: int               #number of records
+    """
+    def set_many(self, first_rid, page_range_ind, page_ind, first_offset, count):
+        self._grow(first_rid + count)
+        # packing the last location checks every offset of the run fits
+        pack_location(page_range_ind, page_ind, first_offset + count - 1)
+        first_location = pack_location(page_range_ind, page_ind, first_offset)
+        for i in range(count):
+            self.locations[first_rid + i] = first_location + i
+
+
+    def __delitem__(self, rid):
+        if rid not in self:
+            raise KeyError(rid)
+        self.locations[rid] = TOMBSTONE
+
+
+    def __contains__(self, rid):
+        return 0 <= rid < len(self.locations) and self.locations[rid] != TOMBSTONE
+
+
+    # counted on demand, merges delete entries from another thread
+    def __len__(self):
+        return len(self.locations) - self.locations.count(TOMBSTONE)
+
+
+    def _grow(self, size):
+        missing = size - len(self.locations)
+        if missing > 0:
+            self.locations.extend(array('q', [TOMBSTONE]) * missing)
+
+
+    # RIDs in the directory, in ascending order
+    def keys(self):
+        for rid, location in enumerate(self.locations):
+            if location != TOMBSTONE:
+                yield rid
+
+
+    def items(self):
+        for rid, location in enumerate(self.locations):
+            if location != TOMBSTONE:
+                yield rid, unpack_location(location)
+
+
+    __iter__ = keys
+
+
+"""
+:param path: string                         #file to write
+:param rid_counter: int                     #rid_counter of the table, load checks the snapshot was saved with the same one
+:param page_directory: PageDirectory        #base RID to (page range, page, offset)
+:param tail_page_directory: PageDirectory   #tail RID to (page range, page, offset)
+:param version_index: VersionIndex          #tail chains of every record
+"""
+def save_directories(path, rid_counter, page_directory, tail_page_directory, version_index):
+    arrays = [
+        page_directory.locations,
+        tail_page_directory.locations,
+        version_index.links,
+        version_index.numbers,
+        version_index.schemas,
+    ]
+
+    parts = [SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, rid_counter, len(arrays))]
+    for values in arrays:
+        parts.append(ARRAY_HEADER.pack(len(values)))
+        parts.append(values.tobytes())
+    payload = b''.join(parts)
+
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as file:
+        file.write(payload)
+        file.write(SNAPSHOT_TRAILER.pack(zlib.crc32(payload)))
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp, path)
+
+
+"""
+:param path: string             #file written by save_directories
+:param rid_counter: int         #rid_counter of the table, the snapshot is stale if it was saved with another one
+# returns (page_directory, tail_page_directory, version_index), or None if the file is missing, damaged or stale
+"""
+def load_directories(path, rid_counter):
+    if not os.path.exists(path):
+        return None
+
+    with open(path, "rb") as file:
+        raw_bytes = file.read()
+
+    if len(raw_bytes) < SNAPSHOT_HEADER.size + SNAPSHOT_TRAILER.size:
+        return None
+    payload = memoryview(raw_bytes)[:-SNAPSHOT_TRAILER.size]
+    (checksum,) = SNAPSHOT_TRAILER.unpack_from(raw_bytes, len(payload))
+    if zlib.crc32(payload) != checksum:
+        return None
+
+    magic, version, saved_rid_counter, num_arrays = SNAPSHOT_HEADER.unpack_from(payload, 0)
+    if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION or saved_rid_counter != rid_counter or num_arrays != 5:
+        return None
+
+    arrays = []
+    pos = SNAPSHOT_HEADER.size
+    for _ in range(num_arrays):
+        (count,) = ARRAY_HEADER.unpack_from(payload, pos)
+        pos += ARRAY_HEADER.size
+        values = array('q')
+        values.frombytes(payload[pos:pos + count * values.itemsize])
+        pos += count * values.itemsize
+        arrays.append(values)
+
+    base_locations, tail_locations, links, numbers, schemas = arrays
+    return PageDirectory(base_locations), PageDirectory(tail_locations), VersionIndex(links, numbers, schemas)
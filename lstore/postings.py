@@ -0,0 +1,165 @@
+"""
+Compact sets of RIDs for index postings, laid out like a roaring bitmap. RIDs are split by their high bits into
+containers of 2^16 values. A container holding few RIDs is a sorted array of 16-bit low halves, a container
+holding many is a bitmap of 8 KB. Either way a RID costs at most 2 bytes, and adding or removing one only
+touches its own container.
+"""
+
+from array import array
+from bisect import bisect_left
+
+CONTAINER_BITS = 16
+LOW_MASK = (1 << CONTAINER_BITS) - 1
+# an array container holding more values than this becomes a bitmap, which is smaller at that point
+ARRAY_MAX = 4096
+# a bitmap container holding fewer values than this turns back into an array, lower than ARRAY_MAX so a
+# container around the limit doesn't flip back and forth
+BITMAP_MIN = 2048
+BITMAP_BYTES = (1 << CONTAINER_BITS) // 8
+
+
+class RidSet:
+
+
+    def __init__(self, rids = ()):
+        # mapping of high bits to a sorted array('H') of low bits
+        self.arrays = {}
+        # mapping of high bits to a bitmap of low bits, and the number of bits set in it
+        self.bitmaps = {}
+        self.bitmap_counts = {}
+        self.size = 0
+
+        for rid in rids:
+            self.add(rid)
+
+
+    # returns True if rid wasn't in the set yet
+    def add(self, rid):
+        high, low = rid >> CONTAINER_BITS, rid & LOW_MASK
+
+        bitmap = self.bitmaps.get(high)
+        if bitmap is not None:
+            byte, bit = low >> 3, 1 << (low & 7)
+            if bitmap[byte] & bit:
+                return False
+            bitmap[byte] |= bit
+            self.bitmap_counts[high] += 1
+            self.size += 1
+            return True
+
+        lows = self.arrays.get(high)
+        if lows is None:
+            self.arrays[high] = array('H', [low])
+            self.size += 1
+            return True
+
+        pos = bisect_left(lows, low)
+        if pos < len(lows) and lows[pos] == low:
+            return False
+        lows.insert(pos, low)
+        self.size += 1
+
+        if len(lows) > ARRAY_MAX:
+            self._to_bitmap(high)
+        return True
+
+
+    # returns True if rid was in the set
+    def discard(self, rid):
+        high, low = rid >> CONTAINER_BITS, rid & LOW_MASK
+
+        bitmap = self.bitmaps.get(high)
+        if bitmap is not None:
+            byte, bit = low >> 3, 1 << (low & 7)
+            if not bitmap[byte] & bit:
+                return False
+            bitmap[byte] &= ~bit
+            self.bitmap_counts[high] -= 1
+            self.size -= 1
+            if self.bitmap_counts[high] < BITMAP_MIN:
+                self._to_array(high)
+            return True
+
+        lows = self.arrays.get(high)
+        if lows is None:
+            return False
+
+        pos = bisect_left(lows, low)
+        if pos == len(lows) or lows[pos] != low:
+            return False
+        del lows[pos]
+        self.size -= 1
+
+        if not lows:
+            del self.arrays[high]
+        return True
+
+
+    def _to_bitmap(self, high):
+        bitmap = bytearray(BITMAP_BYTES)
+        lows = self.arrays.pop(high)
+        for low in lows:
+            bitmap[low >> 3] |= 1 << (low & 7)
+        self.bitmaps[high] = bitmap
+        self.bitmap_counts[high] = len(lows)
+
+
+    def _to_array(self, high):
+        base = high << CONTAINER_BITS
+        lows = array('H', (rid - base for rid in self._bitmap_rids(high)))
+        del self.bitmaps[high]
+        del self.bitmap_counts[high]
+        if lows:
+            self.arrays[high] = lows
+
+
+    def _bitmap_rids(self, high):
+        base = high << CONTAINER_BITS
+        for byte_ind, byte in enumerate(self.bitmaps[high]):
+            if not byte:
+                continue
+            for bit in range(8):
+                if byte & (1 << bit):
+                    yield base + (byte_ind << 3) + bit
+
+
+    def __contains__(self, rid):
+        high, low = rid >> CONTAINER_BITS, rid & LOW_MASK
+
+        bitmap = self.bitmaps.get(high)
+        if bitmap is not None:
+            return bool(bitmap[low >> 3] & (1 << (low & 7)))
+
+        lows = self.arrays.get(high)
+        if lows is None:
+            return False
+        pos = bisect_left(lows, low)
+        return pos < len(lows) and lows[pos] == low
+
+
+    def __len__(self):
+        return self.size
+
+
+    # RIDs in ascending order
+    def __iter__(self):
+        for high in sorted(set(self.arrays) | set(self.bitmaps)):
+            if high in self.bitmaps:
+                yield from self._bitmap_rids(high)
+            else:
+                base = high << CONTAINER_BITS
+                for low in self.arrays[high]:
+                    yield base + low
+
+
+    def to_list(self):
+        return list(self)
+
+
+    def copy(self):
+        rids = RidSet()
+        rids.arrays = {high: array('H', lows) for high, lows in self.arrays.items()}
+        rids.bitmaps = {high: bytearray(bitmap) for high, bitmap in self.bitmaps.items()}
+        rids.bitmap_counts = dict(self.bitmap_counts)
+        rids.size = self.size
+        return rids
@@ -1,5 +1,6 @@
 from lstore.table import Table, Record
 from lstore.index import Index
+from lstore.transaction import running_transaction
 
 NULL = object()
 
@@ -16,7 +17,21 @@ class Query:
         self.index = table.index
         self.columns = table.num_columns
 
-    
+
+    # locks the record with the given primary key for the transaction running on this thread until it ends.
+    # queries run on their own take no locks
+    def _lock(self, key, exclusive = False):
+        transaction = running_transaction()
+        return transaction is None or transaction.lock(self.table, key, exclusive)
+
+
+    # shared locks on records found by RID, the primary key of a record never changes so it is read before the lock
+    def _lock_records(self, rids):
+        if running_transaction() is None:
+            return True
+        return all(self._lock(self.table.read_version(rid, self.table.key, 0)) for rid in rids)
+
+
     """
     # internal Method
     # Read a record with specified RID
@@ -25,25 +40,15 @@ class Query:
     """
     def delete(self, primary_key):
         try:
+            if not self._lock(primary_key, exclusive = True):
+                return False
+
             rids = self.table.index.locate(self.table.key, primary_key)
             if not rids:
                 return False
 
-            rid = rids[0]
-            
-            # get values for indexed columns before deleting to remove that rid from index
-            values = [self.table.read_version(rid, col, 0) for col in range(self.table.num_columns)]
-            
-            ok = self.table.delete(rid)
-            if not ok:
-                return False
-            
-            # remove rid from index for indexed columns
-            for col in range(self.table.num_columns):
-                if self.table.index.indices[col] is not None:
-                    self.table.index.remove_from_index(col, values[col], rid)
-            
-            return True
+            # the table removes the record from the indexes of its columns along with it
+            return self.table.delete(rids[0], transaction = running_transaction())
         except Exception:
             return False
     
@@ -67,16 +72,52 @@ class Query:
         
             key = columns[self.table.key] # Extract the key value from the columns based on the key index
         
+            # the key is locked before it is checked, so no other transaction inserts it in between
+            if not self._lock(key, exclusive = True):
+                return False
+        
             if self.table.index.locate(self.table.key, key):
                 return False # Duplicate key value, insertion fails
         
-            self.table.insert(columns)
+            self.table.insert(columns, transaction = running_transaction())
             return True # Insertion successful
     
         except Exception as e:
             return False # Return False if any exception occurs during the insertion process
 
     
+    """
+    # Insert many records at once
+    # :param rows: list of records, each with one value per column
+    # Return True upon succesful insertion of every record
+    # Returns False if any record is invalid or has a duplicate key, nothing is inserted in that case
+    """
+    def insert_many(self, rows):
+        try:
+            rows = [tuple(row) for row in rows]
+            keys = set()
+            
+            for row in rows:
+                if len(row) != self.table.num_columns:
+                    return False # Invalid number of columns
+                
+                if any(c is None for c in row):
+                    return False # Invalid column value (None)
+                
+                key = row[self.table.key]
+                if not self._lock(key, exclusive = True):
+                    return False
+                if key in keys or self.table.index.locate(self.table.key, key):
+                    return False # Duplicate key value
+                keys.add(key)
+                
+            self.table.insert_batch(rows, transaction = running_transaction())
+            return True
+        
+        except Exception:
+            return False
+
+    
     """
     # Read matching record with specified search key
     # :param search_key: the value you want to search based on
@@ -88,17 +129,20 @@ class Query:
     """
     def select(self, search_key, search_key_index, projected_columns_index):
         try:
-            data_columns = self.table.num_columns
+            # read the key along with the projected columns so the tail chain is walked once per record
+            read_columns = list(projected_columns_index)
+            read_columns[self.table.key] = 1
         
             def get_record_by_rid(rid):
-                record_data = [None] * data_columns
-                for i in range(data_columns):
-                    if projected_columns_index[i] == 1: # Check if the column is projected
-                        record_data[i] = self.table.read_version(rid, i, 0) # Read the value from the table for the projected column
-                    
-                key_value = self.table.read_version(rid, self.table.key, 0) # Get the key value for the record
+                record_data = self.table.read_record(rid, read_columns, 0)
+                key_value = record_data[self.table.key] # Get the key value for the record
+                if projected_columns_index[self.table.key] != 1:
+                    record_data[self.table.key] = None
                 return Record(rid, key_value, record_data)
         
+            if search_key_index == self.table.key and not self._lock(search_key):
+                return False
+        
             if self.table.index.indices[search_key_index] is not None:
                 rids = self.table.index.locate(search_key_index, search_key)
             else:
@@ -110,6 +154,9 @@ class Query:
                     if key_val == search_key:
                         rids.append(rid)
             
+            if search_key_index != self.table.key and not self._lock_records(rids):
+                return False
+            
             records = []
             for rid in rids:
                 records.append(get_record_by_rid(rid))
@@ -131,15 +178,19 @@ class Query:
     """
     def select_version(self, search_key, search_key_index, projected_columns_index, relative_version):
         try:
-            def get_record_by_rid(rid):
-                record_data = [None] * self.table.num_columns
-                for i in range(self.table.num_columns):
-                    if projected_columns_index[i] == 1:
-                        record_data[i] = self.table.read_version(rid, i, relative_version)
+            read_columns = list(projected_columns_index)
+            read_columns[self.table.key] = 1
 
-                key_value = self.table.read_version(rid, self.table.key, relative_version)
+            def get_record_by_rid(rid):
+                record_data = self.table.read_record(rid, read_columns, relative_version)
+                key_value = record_data[self.table.key]
+                if projected_columns_index[self.table.key] != 1:
+                    record_data[self.table.key] = None
                 return Record(rid, key_value, record_data)
 
+            if search_key_index == self.table.key and not self._lock(search_key):
+                return False
+        
             if self.table.index.indices[search_key_index] is not None:
                 rids = self.table.index.locate(search_key_index, search_key)
             else:
@@ -151,6 +202,9 @@ class Query:
                     if key_val == search_key:
                         rids.append(rid)
             
+            if search_key_index != self.table.key and not self._lock_records(rids):
+                return False
+            
             records = []
             for rid in rids:
                 records.append(get_record_by_rid(rid))
@@ -174,12 +228,15 @@ class Query:
             if list(columns)[self.table.key] is not None:
                 return False
 
+            if not self._lock(primary_key, exclusive = True):
+                return False
+
             rids = self.table.index.locate(self.table.key, primary_key)
             if not rids:
                 return False
 
             rid = rids[0]
-            return self.table.update(rid, *columns)
+            return self.table.update(rid, *columns, transaction = running_transaction())
         except Exception:
             return False
 
@@ -197,6 +254,8 @@ class Query:
             rids = self.table.index.locate_range(start_range, end_range, self.table.key)
             if not rids:
                 return False # No records found in the given range, return False
+            if not self._lock_records(rids):
+                return False
             
             total_sum = 0
             found = False
@@ -232,6 +291,8 @@ class Query:
         # if rids is empty then there are no records within the range
         if not rids:
             return False
+        if not self._lock_records(rids):
+            return False
         
         total_sum = 0
         for rid in rids:
@@ -257,10 +318,14 @@ class Query:
         try:
             data_columns = self.table.num_columns 
     
+            # locked for the update right away, two transactions holding it shared could never upgrade under no-wait
+            if not self._lock(key, exclusive = True):
+                return False
+    
             r = self.select(key, self.table.key, [1] * self.table.num_columns)[0]
             if r is not False:
                 updated_columns = [None] * self.table.num_columns
-                updated_columns[column] = r[column] + 1
+                updated_columns[column] = r.columns[column] + 1
                 u = self.update(key, *updated_columns)
                 return u
             
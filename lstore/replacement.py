@@ -0,0 +1,219 @@
+"""
+Page replacement policies used by the buffer pool. Every policy tracks the keys of the frames currently held
+in the pool and hands them back in the order they should be considered for eviction. Pinned frames are skipped
+by the buffer pool, so a policy only decides the order, never whether a frame can actually be evicted.
+"""
+
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+class ReplacementPolicy(ABC):
+
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+
+
+    # a new page was brought into the buffer pool
+    @abstractmethod
+    def insert(self, key):
+        pass
+
+
+    # a page that is already in the buffer pool was accessed again
+    @abstractmethod
+    def record_access(self, key):
+        pass
+
+
+    # a page left the buffer pool
+    @abstractmethod
+    def remove(self, key):
+        pass
+
+
+    # yields keys in the order they should be tried for eviction
+    @abstractmethod
+    def victims(self):
+        pass
+
+
+    @abstractmethod
+    def __len__(self):
+        pass
+
+
+class LRUPolicy(ReplacementPolicy):
+
+
+    def __init__(self, capacity):
+        super().__init__(capacity)
+        # keys in order of least recently used to most recently used, every operation is O(1)
+        self.order = OrderedDict()
+
+
+    def insert(self, key):
+        self.order[key] = None
+        self.order.move_to_end(key)
+
+
+    def record_access(self, key):
+        if key in self.order:
+            self.order.move_to_end(key)
+
+
+    def remove(self, key):
+        self.order.pop(key, None)
+
+
+    def victims(self):
+        # the pool stops iterating as soon as it removes a victim, so no copy of the keys is needed
+        yield from self.order
+
+
+    def __len__(self):
+        return len(self.order)
+
+
+class ClockPolicy(ReplacementPolicy):
+
+
+    def __init__(self, capacity):
+        super().__init__(capacity)
+        # circular buffer of slots, each slot holds a key (or None if free) and its reference bit
+        self.slots = []
+        self.ref_bits = []
+        # mapping of key to its slot
+        self.slot_of = {}
+        self.free_slots = []
+        self.hand = 0
+
+
+    def insert(self, key):
+        if key in self.slot_of:
+            self.ref_bits[self.slot_of[key]] = 1
+            return
+
+        if self.free_slots:
+            slot = self.free_slots.pop()
+            self.slots[slot] = key
+            self.ref_bits[slot] = 1
+        else:
+            slot = len(self.slots)
+            self.slots.append(key)
+            self.ref_bits.append(1)
+        self.slot_of[key] = slot
+
+
+    def record_access(self, key):
+        slot = self.slot_of.get(key)
+        if slot is not None:
+            self.ref_bits[slot] = 1
+
+
+    def remove(self, key):
+        slot = self.slot_of.pop(key, None)
+        if slot is None:
+            return
+        self.slots[slot] = None
+        self.ref_bits[slot] = 0
+        self.free_slots.append(slot)
+
+
+    def victims(self):
+        num_slots = len(self.slots)
+        if num_slots == 0:
+            return
+
+        # two full sweeps: the first one clears reference bits, the second one is guaranteed to find every key
+        for _ in range(2 * num_slots):
+            slot = self.hand
+            self.hand = (self.hand + 1) % num_slots
+            key = self.slots[slot]
+            if key is None:
+                continue
+            if self.ref_bits[slot]:
+                self.ref_bits[slot] = 0
+                continue
+            yield key
+
+
+    def __len__(self):
+        return len(self.slot_of)
+
+
+class TwoQueuePolicy(ReplacementPolicy):
+
+
+    """
+    :param capacity: int        #number of frames in the buffer pool
+    :param in_ratio: float      #share of the pool given to pages that were only seen once
+    :param out_ratio: float     #number of evicted keys remembered, relative to the pool size
+    """
+    def __init__(self, capacity, in_ratio = 0.25, out_ratio = 0.5):
+        super().__init__(capacity)
+        self.max_in = max(1, int(capacity * in_ratio))
+        self.max_out = max(1, int(capacity * out_ratio))
+
+        # pages seen once, evicted in fifo order so a single scan cannot flush the hot set
+        self.a1_in = OrderedDict()
+        # keys recently evicted from a1_in, no frames are held for them
+        self.a1_out = OrderedDict()
+        # pages seen more than once, kept in lru order
+        self.am = OrderedDict()
+
+
+    def insert(self, key):
+        if key in self.a1_out:
+            # page came back soon after it was evicted, so it is hot
+            del self.a1_out[key]
+            self.am[key] = None
+        else:
+            self.a1_in[key] = None
+
+
+    def record_access(self, key):
+        if key in self.am:
+            self.am.move_to_end(key)
+        # hits on a1_in pages don't promote them, correlated accesses right after a load are not reuse
+
+
+    def remove(self, key):
+        if key in self.a1_in:
+            del self.a1_in[key]
+            self.a1_out[key] = None
+            if len(self.a1_out) > self.max_out:
+                self.a1_out.popitem(last = False)
+        else:
+            self.am.pop(key, None)
+
+
+    def victims(self):
+        if len(self.a1_in) > self.max_in:
+            queues = (self.a1_in, self.am)
+        else:
+            queues = (self.am, self.a1_in)
+
+        for q in queues:
+            yield from q
+
+
+    def __len__(self):
+        return len(self.a1_in) + len(self.am)
+
+
+POLICIES = {
+    "lru": LRUPolicy,
+    "clock": ClockPolicy,
+    "2q": TwoQueuePolicy,
+}
+
+
+"""
+:param name: string         #name of the policy: lru, clock or 2q
+:param capacity: int        #number of frames in the buffer pool
+"""
+def make_policy(name, capacity):
+    if name not in POLICIES:
+        raise ValueError(f"Unknown replacement policy: {name}")
+    return POLICIES[name](capacity)
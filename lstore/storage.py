@@ -0,0 +1,225 @@
+"""
+Pages of one column of one page range are stored together in a single segment file. A page lives at
+offset page_id * FRAME_SIZE in its segment and is read and written in place with pread / pwrite, so
+writing a page back costs one system call instead of creating, renaming and syncing a file per page.
+"""
+
+from lstore.page import Page
+from lstore.config import FRAME_SIZE
+import os, re, math, mmap
+import threading
+
+
+# name of the file every page of a column of a page range is stored in
+SEGMENT_NAME = "col_{col_id}.seg"
+# databases written before segment files stored every page in its own file
+LEGACY_PAGE_FILE = re.compile(r"^col_(\d+)_page_(\d+)\.bin$")
+
+
+class SegmentStorage:
+
+
+    def __init__(self):
+        # open file descriptors of segments, kept open until close
+        self.fds = {}
+        self.lock = threading.Lock()
+
+
+    def _fd(self, segment: str):
+        fd = self.fds.get(segment)
+        if fd is not None:
+            return fd
+
+        with self.lock:
+            fd = self.fds.get(segment)
+            if fd is None:
+                os.makedirs(os.path.dirname(segment), exist_ok = True)
+                fd = os.open(segment, os.O_RDWR | os.O_CREAT, 0o644)
+                self.fds[segment] = fd
+        return fd
+
+
+    """
+    :param segment: string      #path of the segment file
+    :param page_id: int         #position of the page in the segment
+    """
+    def read_page(self, segment: str, page_id: int):
+        # pages past the end of the segment have never been written, treat as new page
+        if segment not in self.fds and not os.path.exists(segment):
+            return Page()
+
+        # read straight into the buffer of the new page
+        buffer = bytearray(FRAME_SIZE)
+        num_bytes = os.preadv(self._fd(segment), [buffer], page_id * FRAME_SIZE)
+        if num_bytes < FRAME_SIZE:
+            return Page()
+        return Page(buffer)
+
+
+    def write_page(self, segment: str, page_id: int, page: Page):
+        os.pwrite(self._fd(segment), page.sync_header(), page_id * FRAME_SIZE)
+
+
+    # force every written page to stable storage
+    def sync(self):
+        with self.lock:
+            fds = list(self.fds.values())
+        for fd in fds:
+            os.fsync(fd)
+
+
+    def close(self):
+        with self.lock:
+            for fd in self.fds.values():
+                os.close(fd)
+            self.fds = {}
+
+
+    """
+    # Moves pages stored one per file into segment files and removes the old files
+    :param directory: string    #directory holding the page files of a table
+    """
+    def migrate(self, directory: str):
+        if not os.path.isdir(directory):
+            return
+
+        for dir_path, _, file_names in os.walk(directory):
+            legacy_files = []
+            for file_name in file_names:
+                # leftover temporary files from interrupted page writes
+                if file_name.endswith(".tmp"):
+                    os.remove(os.path.join(dir_path, file_name))
+                    continue
+
+                match = LEGACY_PAGE_FILE.match(file_name)
+                if match:
+                    legacy_files.append((int(match.group(1)), int(match.group(2)), file_name))
+
+            if not legacy_files:
+                continue
+
+            segments = set()
+            for col_id, page_id, file_name in legacy_files:
+                with open(os.path.join(dir_path, file_name), "rb") as file:
+                    raw_bytes = file.read()
+                segment = os.path.join(dir_path, SEGMENT_NAME.format(col_id = col_id))
+                self.write_page(segment, page_id, Page.from_bytes(raw_bytes))
+                segments.add(segment)
+
+            # only remove the old files once their pages are safely in the segments
+            for segment in segments:
+                os.fsync(self._fd(segment))
+            for _, _, file_name in legacy_files:
+                os.remove(os.path.join(dir_path, file_name))
+
+
+class MappedStorage(SegmentStorage):
+
+
+    """
+    Segments are memory-mapped and every page handed out is a window into the mapping, so reading a page
+    and writing it back never copies it. Segments are mapped in chunks of whole pages; a chunk stays mapped
+    until close because the pages in the buffer pool point into it.
+    A change to a window reaches the file whenever the OS writes the mapping back, before the write-ahead log may
+    hold it. Databases with a log get copies of the mapped pages instead, copied back when written back, so a page
+    reaches the file only once the log has every change made to it.
+    :param copy: bool       #hand out copies of the mapped pages instead of windows into the mapping
+    """
+    def __init__(self, copy = False):
+        super().__init__()
+        self.copy = copy
+        # smallest number of pages whose size is a multiple of the mmap offset granularity
+        self.chunk_pages = mmap.ALLOCATIONGRANULARITY // math.gcd(FRAME_SIZE, mmap.ALLOCATIONGRANULARITY)
+        self.chunk_bytes = self.chunk_pages * FRAME_SIZE
+        # mapping of (segment, chunk number) to its mmap
+        self.maps = {}
+
+
+    def _map(self, segment: str, chunk: int):
+        key = (segment, chunk)
+        mapping = self.maps.get(key)
+        if mapping is not None:
+            return mapping
+
+        fd = self._fd(segment)
+        with self.lock:
+            mapping = self.maps.get(key)
+            if mapping is None:
+                # grow the file to cover the whole chunk, the new part is a hole until pages are written
+                end = (chunk + 1) * self.chunk_bytes
+                if os.fstat(fd).st_size < end:
+                    os.ftruncate(fd, end)
+                mapping = mmap.mmap(fd, self.chunk_bytes, offset = chunk * self.chunk_bytes)
+                self.maps[key] = mapping
+        return mapping
+
+
+    def _window(self, segment: str, page_id: int):
+        chunk, slot = divmod(page_id, self.chunk_pages)
+        start = slot * FRAME_SIZE
+        return memoryview(self._map(segment, chunk))[start:start + FRAME_SIZE]
+
+
+    def read_page(self, segment: str, page_id: int):
+        if self.copy:
+            # still no system call per read, the copy is taken from the mapping
+            return Page(bytearray(self._window(segment, page_id)))
+        page = Page(self._window(segment, page_id))
+        page.origin = (segment, page_id)
+        return page
+
+
+    def write_page(self, segment: str, page_id: int, page: Page):
+        if page.origin == (segment, page_id):
+            # page already lives in the mapping, only the record count has to be stored
+            page.sync_header()
+        else:
+            self._window(segment, page_id)[:] = page.sync_header()
+
+
+    def sync(self):
+        with self.lock:
+            maps = list(self.maps.values())
+        for mapping in maps:
+            mapping.flush()
+
+
+    def close(self):
+        self.sync()
+        with self.lock:
+            for mapping in self.maps.values():
+                try:
+                    mapping.close()
+                except BufferError:
+                    # a page still points into the chunk, it is unmapped once that page is gone
+                    pass
+            self.maps = {}
+        super().close()
+
+
+STORAGE_MODES = {
+    "pread": SegmentStorage,
+    "mmap": MappedStorage,
+}
+
+
+"""
+:param mode: string         #how segment files are accessed: pread or mmap
+:param write_ahead: bool    #a write-ahead log covers the pages, they may only reach the files when written back
+"""
+def make_storage(mode, write_ahead = False):
+    if mode not in STORAGE_MODES:
+        raise ValueError(f"Unknown storage mode: {mode}")
+    # pread storage reads every page into memory of its own
+    if mode == "mmap":
+        return MappedStorage(copy = write_ahead)
+    return STORAGE_MODES[mode]()
+
+
+# makes files created, renamed or removed in a directory survive a crash
+def sync_directory(directory: str):
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
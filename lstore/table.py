@@ -1,12 +1,30 @@
-from lstore.index import Index
-from time import time
+from lstore.index import Index, INDEX_TYPES
+from time import time, sleep
 from lstore.page import Page
-from lstore.config import INDIRECTION_COLUMN, RID_COLUMN, TIMESTAMP_COLUMN, SCHEMA_ENCODING_COLUMN, MAX_BASE_PAGES, BASE_RID_COLUMN
-import os, json
+from lstore.storage import SEGMENT_NAME, sync_directory
+from lstore.loader import read_rows, BulkLoadError
+from lstore.postings import RidSet
+from lstore.page_directory import PageDirectory, save_directories, load_directories
+from lstore.version_index import VersionIndex
+from lstore.epoch import Epochs
+from lstore.checkpoint import WriteGate
+from lstore.lock_manager import LockManager
+from lstore.merge import consolidate, consolidate_in_process
+from lstore.wal import INSERT, UPDATE, DELETE, MERGE, UNDO_UPDATE, UNDO_DELETE
+from array import array
+from lstore.config import (INDIRECTION_COLUMN, RID_COLUMN, TIMESTAMP_COLUMN, SCHEMA_ENCODING_COLUMN, MAX_BASE_PAGES, BASE_RID_COLUMN, MAX_RECORDS_PER_PAGE,
+                           SNAPSHOT_FLAG, MERGE_HISTORY)
+import os, re, json
 import threading
 import queue
 import struct
 
+# snapshots of the page directories and indexes saved by a checkpoint, named by its generation. tables saved before
+# checkpoints had one of each without the generation
+DIRECTORY_FILE = "directory.{generation}.bin"
+INDEX_FILE = "index.{generation}.bin"
+SNAPSHOT_FILE_PATTERN = re.compile(r"^(directory|index)(\.\d+)?\.bin$")
+
 class PageRange:
     
     
@@ -24,10 +42,44 @@ class PageRange:
         # each column gets a list of pages
         self.base_pages = [[] for _ in range(num_col)]
         self.tail_pages = [[] for _ in range(num_col)]
-        
-        # initalize first tail page id to 0 for each column
-        for col in range(num_col):
-            self.tail_pages[col].append(0)
+        # [tps, merged tail page ids, base page ids written] of the newest merges, oldest first. reads of versions
+        # older than the TPS need their tail pages, and the base pages once the merge is the oldest one kept
+        self.history = []
+        # tail records up to the horizon are freed, the horizon pages hold every column's value as of it. each column
+        # gets a list of page ids like base_pages, empty for columns no merge wrote
+        self.horizon = -1
+        self.horizon_pages = [[] for _ in range(num_col)]
+        # first tail page id written by every running transaction that changed the range, None for one that deleted a
+        # record. merges stop before its tail records, the base pages kept as history never hold a change a rollback
+        # takes back
+        self.unfinished = {}
+        
+        # ids not used yet in every column's segment, and ids freed by merges that can be given out again.
+        # merges give base columns new ids one column at a time, tail pages of all columns always share one id
+        self.next_base_ids = [0] * num_col
+        self.free_base_ids = [[] for _ in range(num_col)]
+        self.next_tail_id = 0
+        self.free_tail_ids = []
+        # ids replaced by merges while a write-ahead log is kept. retired ids may still be read by running operations,
+        # cleared ones are emptied and only wait for a checkpoint, until then replaying the log may write to them
+        self.retired_base_ids = []
+        self.retired_tail_ids = []
+        self.cleared_base_ids = []
+        self.cleared_tail_ids = []
+        # tail-sequence number: every tail record of the range with a RID up to it has been merged into the base pages
+        self.tps = -1
+        # allocation and the page lists are also changed by the merge and deallocation threads
+        self.lock = threading.Lock()
+        # held by an update while it appends its tail record
+        self.tail_lock = threading.Lock()
+        # held by a merge from reading the range until its pages are installed, rollbacks in the range wait for it
+        self.merge_lock = threading.Lock()
+        # counts up before and after a merge installs its base pages and TPS, odd while it does. a read that saw it
+        # change went by both versions of the range and is retried
+        self.installs = 0
+        
+        # initalize first tail page for each column
+        self.add_tail_page()
         
         
     # check if base page range has capacity
@@ -42,15 +94,194 @@ class PageRange:
         
         # add base page id for each column
         for col in range(len(self.base_pages)):
-            new_page_id = len(self.base_pages[col])
-            self.base_pages[col].append(new_page_id)
+            self.base_pages[col].append(self.allocate_base_id(col))
         
         
     def add_tail_page(self):
         # add tail page id for each column
-        for col in range(len(self.tail_pages)):
-            new_page_id = len(self.tail_pages[col])
-            self.tail_pages[col].append(new_page_id)
+        with self.lock:
+            new_page_id = self.free_tail_ids.pop() if self.free_tail_ids else self.next_tail_id
+            self.next_tail_id = max(self.next_tail_id, new_page_id + 1)
+            for col in range(len(self.tail_pages)):
+                self.tail_pages[col].append(new_page_id)
+            
+            
+    def allocate_base_id(self, col):
+        with self.lock:
+            if self.free_base_ids[col]:
+                return self.free_base_ids[col].pop()
+            new_page_id = self.next_base_ids[col]
+            self.next_base_ids[col] += 1
+            return new_page_id
+        
+        
+    """
+    # Gives page ids back once nothing can read their pages anymore
+    :param base_ids: list[(int, int)]   #(column, page id) of freed base pages
+    :param tail_ids: list[int]          #freed tail page ids, for every column
+    """
+    def release(self, base_ids, tail_ids):
+        with self.lock:
+            for col, page_id in base_ids:
+                self.free_base_ids[col].append(page_id)
+            self.free_tail_ids.extend(tail_ids)
+            
+            
+    """
+    # Keeps page ids replaced by a merge from being given out, the merge installed pages that no longer use them
+    :param base_ids: list[(int, int)]   #(column, page id) of replaced base pages
+    :param tail_ids: list[int]          #merged tail page ids, for every column
+    """
+    def retire(self, base_ids, tail_ids):
+        with self.lock:
+            self.retired_base_ids.extend(base_ids)
+            self.retired_tail_ids.extend(tail_ids)
+            
+            
+    """
+    # Called once nothing reads the retired pages any more and they are emptied
+    :param base_ids: list[(int, int)]   #(column, page id) of emptied base pages
+    :param tail_ids: list[int]          #emptied tail page ids
+    :param reusable: bool               #give the ids out right away, False to wait for the next checkpoint
+    """
+    def clear(self, base_ids, tail_ids, reusable):
+        with self.lock:
+            for ids in base_ids:
+                self.retired_base_ids.remove(ids)
+            for page_id in tail_ids:
+                self.retired_tail_ids.remove(page_id)
+            if reusable:
+                for col, page_id in base_ids:
+                    self.free_base_ids[col].append(page_id)
+                self.free_tail_ids.extend(tail_ids)
+            else:
+                self.cleared_base_ids.extend(base_ids)
+                self.cleared_tail_ids.extend(tail_ids)
+                
+                
+    # (column, page id) of every base page some version is read from
+    def _used_base_ids(self):
+        used = set()
+        for pages in [self.base_pages, self.horizon_pages] + [merge[2] for merge in self.history]:
+            for col, page_ids in enumerate(pages):
+                used.update((col, page_id) for page_id in page_ids)
+        return used
+                
+                
+    """
+    # Switches the range to the base pages a merge wrote. Its tail pages and new base pages join the history, the
+    # pages of merges older than the newest MERGE_HISTORY ones are no longer read
+    :param installed: list[(int, int, int)]    #(column, page index, new page id) of every written base page
+    :param tps: int                            #TPS after the merge
+    :param tail_ids: list[int]                 #merged tail page ids
+    # returns (base ids, tail ids) no version is read from any more, to be retired
+    """
+    def install(self, installed, tps, tail_ids):
+        with self.lock:
+            used = self._used_base_ids()
+            
+            # readers retry when they ran into the switch, they never mix the pages and TPS of both versions
+            self.installs += 1
+            for col, page_ind, page_id in installed:
+                self.base_pages[col][page_ind] = page_id
+            for col in range(len(self.tail_pages)):
+                self.tail_pages[col] = [page_id for page_id in self.tail_pages[col] if page_id not in tail_ids]
+            if tps > self.tps:
+                written = [[] for _ in range(self.num_col)]
+                for col, page_ind, page_id in sorted(installed, key = lambda page: page[1]):
+                    written[col].append(page_id)
+                self.history.append([tps, list(tail_ids), written])
+                self.tps = tps
+            
+            freed_tail_ids = []
+            while len(self.history) > MERGE_HISTORY:
+                self.horizon, merged_tail_ids, self.horizon_pages = self.history.pop(0)
+                freed_tail_ids += merged_tail_ids
+            self.installs += 1
+            
+            return sorted(used - self._used_base_ids()), freed_tail_ids
+                
+                
+    """
+    # Keeps merges from applying the tail records of a running transaction, a rollback finds them unmerged
+    :param transaction_id: int
+    :param page_id: int             #first tail page written by the transaction, None to stop every merge
+    """
+    def hold(self, transaction_id, page_id):
+        with self.lock:
+            if page_id is None or transaction_id not in self.unfinished:
+                self.unfinished[transaction_id] = page_id
+                
+                
+    # called once the transaction committed or rolled back its changes
+    def finish(self, transaction_id):
+        with self.lock:
+            self.unfinished.pop(transaction_id, None)
+                
+                
+    """
+    # Allocation state for a checkpoint. Cleared ids are taken out and saved as free, they are released once the
+    # checkpoint is saved since the log that follows it never writes to them
+    # returns (allocation, cleared base ids, cleared tail ids)
+    """
+    def seal(self):
+        with self.lock:
+            base_ids, tail_ids = self.cleared_base_ids, self.cleared_tail_ids
+            self.cleared_base_ids, self.cleared_tail_ids = [], []
+            
+            free_base_ids = [list(ids) for ids in self.free_base_ids]
+            for col, page_id in base_ids:
+                free_base_ids[col].append(page_id)
+            allocation = {
+                "next_base_ids": list(self.next_base_ids),
+                "free_base_ids": free_base_ids,
+                "next_tail_id": self.next_tail_id,
+                "free_tail_ids": self.free_tail_ids + tail_ids,
+                "retired_base_ids": list(self.retired_base_ids),
+                "retired_tail_ids": list(self.retired_tail_ids),
+                "tps": self.tps,
+                "history": [[tps, list(tail_ids), [list(page_ids) for page_ids in written]] for tps, tail_ids, written in self.history],
+                "horizon": self.horizon,
+                "horizon_pages": [list(page_ids) for page_ids in self.horizon_pages],
+            }
+            return allocation, base_ids, tail_ids
+            
+            
+    # marks a base page id seen in the log as used, it may have been free when the table was saved
+    def claim_base_id(self, col, page_id):
+        with self.lock:
+            if page_id in self.free_base_ids[col]:
+                self.free_base_ids[col].remove(page_id)
+            self.next_base_ids[col] = max(self.next_base_ids[col], page_id + 1)
+            
+            
+    def claim_tail_id(self, page_id):
+        with self.lock:
+            if page_id in self.free_tail_ids:
+                self.free_tail_ids.remove(page_id)
+            self.next_tail_id = max(self.next_tail_id, page_id + 1)
+            
+            
+    """
+    :param allocation: dict or None     #saved by seal(), None for tables saved before page ids were reused
+    """
+    def restore_allocation(self, allocation):
+        if allocation is None:
+            # page ids used to be positions in the page lists, nothing was ever freed
+            self.next_base_ids = [max(pages, default = -1) + 1 for pages in self.base_pages]
+            self.next_tail_id = max((max(pages, default = -1) + 1 for pages in self.tail_pages), default = 0)
+            return
+        
+        self.next_base_ids = allocation["next_base_ids"]
+        self.free_base_ids = allocation["free_base_ids"]
+        self.next_tail_id = allocation["next_tail_id"]
+        self.free_tail_ids = allocation["free_tail_ids"]
+        self.retired_base_ids = [tuple(ids) for ids in allocation.get("retired_base_ids", [])]
+        self.retired_tail_ids = allocation.get("retired_tail_ids", [])
+        self.tps = allocation["tps"]
+        self.history = allocation.get("history", self.history)
+        self.horizon = allocation.get("horizon", -1)
+        self.horizon_pages = allocation.get("horizon_pages", self.horizon_pages)
             
         
 class Record:
@@ -69,40 +300,43 @@ class Table:
     :param name: string         #Table name
     :param num_columns: int     #Number of Columns: all columns are integer
     :param key: int             #Index of table key in columns
+    :param cumulative: bool     #tail records carry every column updated so far instead of only the ones of their update
     """
-    def __init__(self, name, num_columns, key):
+    def __init__(self, name, num_columns, key, cumulative = False):
         self.name = name
         self.key = key
         self.num_columns = num_columns
-        self.page_directory = {}
-        self.tail_page_directory = {}
+        self.cumulative = cumulative
+        self.page_directory = PageDirectory()
+        self.tail_page_directory = PageDirectory()
+        self.version_index = VersionIndex()
         self.index = Index(self)
-        self.merge_threshold_pages = 10  # The threshold to trigger a merge
         self.page_ranges = []
         self.rid_counter = 0
-        self.mergeQ = queue.Queue()          # queue of page_range_ids to merge
-        self.deallocateQ = queue.Queue()
-        self._merge_scheduled = set()
-        
-        self._merge_thread = threading.Thread(target = self._merge_worker, daemon = True)
-        self._merge_thread.start()
-        
-    """
-    :param record: list[int]     #list of column values to be inserted
-    """     
-    def insert(self, record):
-        rid = self.rid_counter
-        # increment rid_counter to ensure RID uniqueness for every insert
-        self.rid_counter += 1
-        
-        indirection = 0
-        timestamp = int(time())
-        schema_encoding = 0
-        base_rid = rid
-        
-        user_record = list(record)
-        record = [indirection, rid, timestamp, schema_encoding, base_rid] + user_record
-        
+        # decides when page ranges are merged and runs the merges, set by the database
+        self.merge_scheduler = None
+        # write-ahead log of the database, None if changes are only saved on close
+        self.wal = None
+        # checkpoint the table was last saved at, log records written before it are already in the saved table
+        self.log_generation = 0
+        # writes pass it so a checkpoint can copy the table between them, the database shares one with all its tables
+        self.write_gate = WriteGate()
+        # record locks of transactions, the database shares one with all its tables
+        self.lock_manager = LockManager()
+        # bulk loads running, they index their records at the end and checkpoints wait for them
+        self.loading = 0
+        self.deallocateQ = queue.Queue()     # pages replaced by merges, freed once no operation can read them
+        self.epochs = Epochs()
+        # held while records are appended to base pages and while a merge installs new base pages
+        self._append_lock = threading.Lock()
+        # base and tail records of every thread take their RIDs from the one counter
+        self._rid_lock = threading.Lock()
+        
+        self._deallocate_thread = threading.Thread(target = self._deallocate_worker, daemon = True)
+        self._deallocate_thread.start()
+        
+    # returns the last page range and the free slots in its last base page, adding a page range or base page if needed
+    def _base_space(self):
         # create page range if there isn't one or if last page range is full
         if not self.page_ranges or not self.page_ranges[-1].base_has_capacity():
             self.page_ranges.append(PageRange(self.num_columns + 5, MAX_BASE_PAGES))
@@ -118,35 +352,94 @@ class Table:
         page_id0 = last_page_range.base_pages[0][-1]
         path0 = self._page_path("base", page_range_ind, 0, page_id0)
         page0 = self.bufferpool.get_page(path0)
+        room = MAX_RECORDS_PER_PAGE - page0.num_records
+        self.bufferpool.unpin(path0)
         
-        if not page0.has_capacity():
-            self.bufferpool.unpin(path0)
+        if room == 0:
+            if not last_page_range.base_has_capacity():
+                # last base page of the range is full, start a new range
+                return self._base_space()
             last_page_range.add_base_page()
+            room = MAX_RECORDS_PER_PAGE
             
-            page_id0 = last_page_range.base_pages[0][-1]
-            path0 = self._page_path("base", page_range_ind, 0, page_id0)
-            page0 = self.bufferpool.get_page(path0)
+        return page_range_ind, last_page_range, room
+    
+    
+    # returns the first of count new consecutive RIDs
+    def _allocate_rids(self, count):
+        with self._rid_lock:
+            first_rid = self.rid_counter
+            self.rid_counter += count
+            return first_rid
+    
+    
+    # appends a record to the write-ahead log before the pages it describes change, returns its LSN
+    def _log(self, kind, values, tag = None):
+        if self.wal is None:
+            return 0
+        return self.wal.append(kind, self.name, values, tag)
+    
+    
+    # tag of the log records of a change made by a transaction: its id and the position of the undo entry the change
+    # adds. the transaction logs its end to every log it wrote to
+    def _tag(self, transaction):
+        if transaction is None or self.wal is None:
+            return None
+        transaction.logs.add(self.wal)
+        return (transaction.id, len(transaction.undo))
+    
+    
+    # keeps merges of a page range off the changes of a running transaction until it ends, see PageRange.hold
+    def _hold(self, transaction, page_range, page_id):
+        page_range.hold(transaction.id, page_id)
+        transaction.ranges.add(page_range)
+    
+    
+    def _commit(self, lsn):
+        if self.wal is not None:
+            self.wal.commit(lsn)
+    
+    
+    """
+    :param record: list[int]     #list of column values to be inserted
+    :param transaction: Transaction     #transaction inserting the record, None outside transactions
+    """     
+    def insert(self, record, transaction = None):
+        with self.write_gate.enter():
+            rid = self._insert(record, self._tag(transaction))
+        if transaction is not None:
+            transaction.undo.append((self, INSERT, [rid]))
+        return rid
         
-        # done checking if there's space
-        self.bufferpool.unpin(path0)
         
-        # write each value into its column's last base page using bufferpool
-        offset = None
-        for col, val in enumerate(record):
-            page_id = last_page_range.base_pages[col][-1]
-            path = self._page_path("base", page_range_ind, col, page_id)
-            page = self.bufferpool.get_page(path)
-            
-            page.write(val)
-            self.bufferpool.mark_dirty(path)
+    def _insert(self, record, tag = None):
+        # increment rid_counter to ensure RID uniqueness for every insert
+        rid = self._allocate_rids(1)
+        
+        indirection = 0
+        timestamp = int(time())
+        schema_encoding = 0
+        base_rid = rid
+        
+        user_record = list(record)
+        record = [indirection, rid, timestamp, schema_encoding, base_rid] + user_record
+        
+        # write each value into its column's last base page using bufferpool, the space is taken under the
+        # append lock so concurrent inserts never fill the same slot
+        with self._append_lock:
+            page_range_ind, last_page_range, room = self._base_space()
+            page_ind = len(last_page_range.base_pages[0]) - 1
+            page_ids = [pages[page_ind] for pages in last_page_range.base_pages]
+            offset = MAX_RECORDS_PER_PAGE - room
+            lsn = self._log(INSERT, [page_range_ind, page_ind, offset, 1] + page_ids + record, tag)
             
-            if col == 0:
-                offset = page.num_records - 1
-                
-            self.bufferpool.unpin(path)
+            for col, val in enumerate(record):
+                path = self._page_path("base", page_range_ind, col, page_ids[col])
+                with self.bufferpool.latched(path, exclusive = True) as page:
+                    page.write(val)
+                    self.bufferpool.mark_dirty(path, lsn)
             
         # update page directory
-        page_ind = len(last_page_range.base_pages[0]) - 1
         self.page_directory[rid] = (page_range_ind, page_ind, offset)
         
         # add rid to every index for the record's column values
@@ -154,162 +447,287 @@ class Table:
             if self.index.indices[col] is not None:
                 self.index.add_to_index(col, user_record[col], rid)
         
+        self._commit(lsn)
         return rid
     
     
     """
-    :param rid: int
-    :param col: int     #user column index
-    """ 
-    def read(self, rid, col):
-        # get record location
-        page_range_ind, page_ind, offset = self.page_directory[rid]
-        
-        page_range = self.page_ranges[page_range_ind]
-        
-        # get base page data from buffer pool
-        base_page_id = page_range.base_pages[col + 5][page_ind]
-        base_path = self._page_path("base", page_range_ind, col + 5, base_page_id)
-        base_page = self.bufferpool.get_page(base_path)
-        
-        # get base indirection page from buffer pool
-        indir_page_id = page_range.base_pages[INDIRECTION_COLUMN][page_ind]
-        indir_path = self._page_path("base", page_range_ind, INDIRECTION_COLUMN, indir_page_id)
-        indir_page = self.bufferpool.get_page(indir_path)
-        tail_rid = indir_page.read(offset)
+    # Inserts many records, pinning each column page once per filled page instead of once per record
+    :param records: list[list[int]]     #list of records, each a list of column values
+    :param transaction: Transaction     #transaction inserting the records, None outside transactions
+    """
+    def insert_batch(self, records, transaction = None):
+        rids = []
+        timestamp = int(time())
         
-        # no tail record, read from base page
-        if tail_rid in [0, None]:
-            val = base_page.read(offset)
-            
-            # unpin pinned pages
-            self.bufferpool.unpin(indir_path)
-            self.bufferpool.unpin(base_path)
+        start = 0
+        while start < len(records):
+            # chunks pass the write gate one at a time, a checkpoint can run between them
+            with self.write_gate.enter():
+                # the space is taken and filled under the append lock, so concurrent inserts get pages of their own
+                with self._append_lock:
+                    page_range_ind, last_page_range, room = self._base_space()
+                    chunk = records[start:start + room]
+                    count = len(chunk)
+                    
+                    first_rid = self._allocate_rids(count)
+                    chunk_rids = range(first_rid, first_rid + count)
+                    
+                    # one list of values per column, metadata columns first
+                    columns = [
+                        [0] * count,
+                        chunk_rids,
+                        [timestamp] * count,
+                        [0] * count,
+                        chunk_rids,
+                    ]
+                    user_columns = [list(values) for values in zip(*chunk)]
+                    columns.extend(user_columns)
+                    
+                    # write each column's slice of the chunk into its last base page in one go
+                    page_ind = len(last_page_range.base_pages[0]) - 1
+                    page_ids = [pages[page_ind] for pages in last_page_range.base_pages]
+                    first_offset = MAX_RECORDS_PER_PAGE - room
+                    lsn = self._log(INSERT, [page_range_ind, page_ind, first_offset, count] + page_ids +
+                                    [value for values in columns for value in values], self._tag(transaction))
+                    
+                    for col, values in enumerate(columns):
+                        path = self._page_path("base", page_range_ind, col, page_ids[col])
+                        with self.bufferpool.latched(path, exclusive = True) as page:
+                            page.write_many(values)
+                            self.bufferpool.mark_dirty(path, lsn)
+                    
+                # update page directory
+                self.page_directory.set_many(first_rid, page_range_ind, page_ind, first_offset, count)
+                    
+                # add the chunk to every index at once
+                for col in range(self.num_columns):
+                    if self.index.indices[col] is not None:
+                        self.index.add_many(col, user_columns[col], chunk_rids)
+                        
+                rids.extend(chunk_rids)
+                start += count
+                self._commit(lsn)
+            if transaction is not None:
+                transaction.undo.append((self, INSERT, list(chunk_rids)))
             
-            return val
+        return rids
     
-        # tail record exists, get record location from tail page directory 
-        tail_page_range_ind, tail_page_ind, tail_offset = self.tail_page_directory[tail_rid]
-        
-        # get tail page from buffer pool
-        tail_path = self._page_path("tail", tail_page_range_ind, col + 5, tail_page_ind)
-        tail_page = self.bufferpool.get_page(tail_path)
-        
-        # get tail schema page from buffer pool
-        schema_path = self._page_path("tail", tail_page_range_ind, SCHEMA_ENCODING_COLUMN, tail_page_ind)
-        schema_page = self.bufferpool.get_page(schema_path)
-        schema_encoding = schema_page.read(tail_offset)
-        
-        # get bit position for column in schema encoding bitmap
-        bit_ind = col 
-        
-        # read from tail page if column was updated (bit value 1), else read from base page
-        if (schema_encoding >> bit_ind) & 1:
-            val = tail_page.read(tail_offset)
-        else:
-            val = base_page.read(offset)
+    
+    """
+    # Streams records from a CSV or packed int64 file into new base pages, written straight to storage
+    :param path: string         #file to load, see lstore.loader for the formats
+    :param format: string       #csv or bin, taken from the file extension if None
+    # returns the number of records loaded, a bad row raises BulkLoadError with the number loaded before it
+    """
+    def bulk_load(self, path, format = None):
+        # keys and other indexed values of the records loaded so far, indexed in one sorted pass at the end
+        indexed_cols = [col for col in range(self.num_columns) if self.index.indices[col] is not None]
+        loaded_rids = array('q')
+        loaded_values = {col: array('q') for col in indexed_cols}
+        
+        # rows read but not written yet, never more than one page worth
+        pending = []
+        count = 0
+        # keys of the file streamed so far. the records written straight to storage are only indexed at the end.
+        # a bitmap like the index postings keeps runs of keys at a few bytes each
+        loaded_keys = RidSet()
+        
+        # the last base page may already hold records and be cached, so it is filled through the buffer pool
+        with self.write_gate.enter(), self._append_lock:
+            _, _, room = self._base_space()
+        
+        with self._append_lock:
+            self.loading += 1
+        try:
+            for chunk in read_rows(path, self.num_columns, MAX_RECORDS_PER_PAGE, format):
+                for row in chunk:
+                    key = row[self.key]
+                    if not loaded_keys.add(key) or self.index.locate(self.key, key):
+                        raise ValueError(f"Duplicate key {key}")
+                
+                pending.extend(chunk)
+                
+                if room:
+                    self.insert_batch(pending[:room])
+                    count += len(pending[:room])
+                    pending = pending[room:]
+                    room = 0
+                
+                while len(pending) >= MAX_RECORDS_PER_PAGE:
+                    rids = self._write_base_page(pending[:MAX_RECORDS_PER_PAGE])
+                    self._collect_loaded(pending[:MAX_RECORDS_PER_PAGE], rids, loaded_rids, loaded_values)
+                    count += len(rids)
+                    pending = pending[MAX_RECORDS_PER_PAGE:]
+                    
+            if pending:
+                rids = self._write_base_page(pending)
+                self._collect_loaded(pending, rids, loaded_rids, loaded_values)
+                count += len(rids)
+        except ValueError as e:
+            # the rows of the file before the ones still pending are in the table and stay there
+            raise BulkLoadError(f"{e}, the first {count} rows were loaded", count) from e
+        finally:
+            # index whatever made it to disk, in key order
+            for col in indexed_cols:
+                values = loaded_values[col]
+                order = sorted(range(len(values)), key = values.__getitem__)
+                self.index.add_many(col, [values[i] for i in order], [loaded_rids[i] for i in order])
+            with self._append_lock:
+                self.loading -= 1
+                
+        return count
+    
+    
+    def _collect_loaded(self, rows, rids, loaded_rids, loaded_values):
+        loaded_rids.extend(rids)
+        for col, values in loaded_values.items():
+            values.extend(row[col] for row in rows)
+    
+    
+    # writes up to one page of records into a new base page of every column without going through the buffer pool
+    def _write_base_page(self, rows):
+        with self.write_gate.enter(), self._append_lock:
+            if not self.page_ranges or not self.page_ranges[-1].base_has_capacity():
+                self.page_ranges.append(PageRange(self.num_columns + 5, MAX_BASE_PAGES))
+                
+            page_range = self.page_ranges[-1]
+            page_range_ind = len(self.page_ranges) - 1
+            page_range.add_base_page()
+            page_ind = len(page_range.base_pages[0]) - 1
             
-        # unpin pinned pages
-        self.bufferpool.unpin(schema_path)
-        self.bufferpool.unpin(tail_path)
-        self.bufferpool.unpin(indir_path)
-        self.bufferpool.unpin(base_path)
-        
-        return val
-        
+            count = len(rows)
+            first_rid = self._allocate_rids(count)
+            rids = range(first_rid, first_rid + count)
+            timestamp = int(time())
+            
+            columns = [[0] * count, rids, [timestamp] * count, [0] * count, rids]
+            columns.extend(zip(*rows))
+            
+            # the pages skip the buffer pool, so the log has to be on disk before them
+            page_ids = [pages[page_ind] for pages in page_range.base_pages]
+            lsn = self._log(INSERT, [page_range_ind, page_ind, 0, count] + page_ids + [value for values in columns for value in values])
+            if self.wal is not None:
+                self.wal.flush(lsn)
+            
+            for col, values in enumerate(columns):
+                page = Page()
+                page.write_many(values)
+                segment, page_id = self._page_path("base", page_range_ind, col, page_range.base_pages[col][page_ind])
+                self.bufferpool.storage.write_page(segment, page_id, page)
+                
+            self.page_directory.set_many(first_rid, page_range_ind, page_ind, 0, count)
+                
+            return rids
+    
+    
     """
     :param rid: int
     :param col: int                     #user column index
     :param relative_version: int        #relative version of record to be read
     """     
     def read_version(self, rid, col, relative_version):
+        projection = [0] * self.num_columns
+        projection[col] = 1
+        return self.read_record(rid, projection, relative_version)[col]
+    
+
+    """
+    # Reads several columns of one version of a record
+    :param rid: int
+    :param projection: list[int]        #1 for every user column to read, 0 otherwise
+    :param relative_version: int        #0 for the latest version, -k for k versions before it
+    # returns a list with the value of every projected column and None for the others
+    """
+    def read_record(self, rid, projection, relative_version):
         # get record location
         page_range_ind, page_ind, offset = self.page_directory[rid]
         page_range = self.page_ranges[page_range_ind]
-        
-        # get base indirection page from buffer pool
-        base_indir_page_id = page_range.base_pages[INDIRECTION_COLUMN][page_ind]
-        base_indir_path = self._page_path("base", page_range_ind, INDIRECTION_COLUMN, base_indir_page_id)
-        base_indir_page = self.bufferpool.get_page(base_indir_path)
-        tail_rid = base_indir_page.read(offset)
-        
-        # relative_version 0 indicates user wants to read latest version and existence of tail record means latest version is in tail page
-        if relative_version == 0 and tail_rid not in [0, None]:
-            self.bufferpool.unpin(base_indir_path)
-            
-            # go through tail records until its schema bit for col is 1, meaning col was updated in that tail record
-            while tail_rid not in [0, None]:               
-                # find record location from tail page directory
-                tail_page_range_ind, tail_page_ind, tail_offset = self.tail_page_directory[tail_rid]
-                tail_page_range = self.page_ranges[tail_page_range_ind]
-
-                # get tail schema page from buffer pool
-                schema_page_id = tail_page_range.tail_pages[SCHEMA_ENCODING_COLUMN][tail_page_ind]
-                schema_path = self._page_path("tail", tail_page_range_ind, SCHEMA_ENCODING_COLUMN, schema_page_id)
-                schema_page = self.bufferpool.get_page(schema_path)
-                schema = schema_page.read(tail_offset)
-            
-                # if bit value is 1, column was updated from this tail record
-                if ((schema >> col) & 1) == 1:
-                    data_page_id = tail_page_range.tail_pages[col + 5][tail_page_ind]
-                    data_path = self._page_path("tail", tail_page_range_ind, col + 5, data_page_id)
-                    data_page = self.bufferpool.get_page(data_path)
-                    val = data_page.read(tail_offset)
-                    
-                    self.bufferpool.unpin(data_path)
-                    self.bufferpool.unpin(schema_path)
-                
-                    return val
-                
-                # if not then check previous tail record 
-                indir_page_id = tail_page_range.tail_pages[INDIRECTION_COLUMN][tail_page_ind]
-                indir_path = self._page_path("tail", tail_page_range_ind, INDIRECTION_COLUMN, indir_page_id)
-                indir_page = self.bufferpool.get_page(indir_path)
-                next_tail_rid = indir_page.read(tail_offset)
-                tail_rid = next_tail_rid
-                
-                self.bufferpool.unpin(indir_path)
-                self.bufferpool.unpin(schema_path)
-        
-        else:
-            # if didn't unpin in if statemement, unpin now
-            self.bufferpool.unpin(base_indir_path)
-            
-        
-        # if no update for column was found after going through all tail records or don't want latest version, read from base page    
-        base_data_page_id = page_range.base_pages[col + 5][page_ind]   
-        base_data_path = self._page_path("base", page_range_ind, col + 5, base_data_page_id)    
-        base_page = self.bufferpool.get_page(base_data_path)
-        val = base_page.read(offset)
-        
-        self.bufferpool.unpin(base_data_path)
-        
-        return val
+
+        values = [None] * self.num_columns
+        columns = [col for col, projected in enumerate(projection) if projected == 1]
+
+        # pages pinned so far, each page is pinned once however many columns or tail records use it
+        pinned = {}
+        def pin(path):
+            page = pinned.get(path)
+            if page is None:
+                page = self.bufferpool.get_page(path)
+                pinned[path] = page
+            return page
+
+        # page ids read below stay valid until the operation leaves its epoch, even if a merge replaces them
+        epoch = self.epochs.enter()
+        try:
+            while True:
+                installs = page_range.installs
+                if installs & 1:
+                    # a merge is switching the range to its new pages, that takes no more than a few assignments
+                    sleep(0)
+                    continue
+
+                try:
+                    # tail record holding each column of the version, found in memory through the version index.
+                    # the base record holds the values as of the range's TPS, older versions are read from merged
+                    # tail records and from the horizon pages once those are freed
+                    tail_rids = self.version_index.locate(rid, columns, relative_version, self.cumulative, page_range.tps,
+                                                          page_range.horizon)
+
+                    for col in columns:
+                        tail_rid = tail_rids.get(col)
+                        if not tail_rid:
+                            # column not updated as of this version, read from the base record. one updated by freed
+                            # tail records only is read as of the horizon
+                            pages = page_range.base_pages if tail_rid is None else page_range.horizon_pages
+                            base_data_path = self._page_path("base", page_range_ind, col + 5, pages[col + 5][page_ind])
+                            values[col] = pin(base_data_path).read(offset)
+                            continue
+
+                        tail_page_range_ind, tail_page_id, tail_offset = self.tail_page_directory[tail_rid]
+                        data_path = self._page_path("tail", tail_page_range_ind, col + 5, tail_page_id)
+                        values[col] = pin(data_path).read(tail_offset)
+
+                finally:
+                    for path in pinned:
+                        self.bufferpool.unpin(path)
+                    pinned.clear()
+
+                # base pages read after a merge installed them hold values newer than the TPS the version was found with
+                if page_range.installs == installs:
+                    return values
+
+        finally:
+            self.epochs.exit(epoch)
+
     
-        
     """
     :param rid: int
     :param *cols: tuple     #updated column values
+    :param transaction: Transaction     #transaction updating the record, None outside transactions
     """  
-    def update(self, rid, *cols):
+    def update(self, rid, *cols, transaction = None):
+        epoch = self.epochs.enter()
+        try:
+            with self.write_gate.enter():
+                return self._update(rid, *cols, transaction = transaction)
+        finally:
+            self.epochs.exit(epoch)
+            
+            
+    def _update(self, rid, *cols, transaction = None):
         # get record location
         page_range_ind, page_ind, offset = self.page_directory[rid]
         page_range = self.page_ranges[page_range_ind]
         
-        # get base indirection from buffer pool
-        base_indir_page_id = page_range.base_pages[INDIRECTION_COLUMN][page_ind]
-        base_indir_path = self._page_path("base", page_range_ind, INDIRECTION_COLUMN, base_indir_page_id)
-        base_indir_page = self.bufferpool.get_page(base_indir_path)
-        tail_rid = base_indir_page.read(offset)
-        
-        new_tail_rid = self.rid_counter
-        self.rid_counter += 1
+        # the version index is rebuilt from the log on recovery, the indirection column may be ahead of it
+        tail_rid = self.version_index.latest(rid)
         
         timestamp = int(time())
         indirection = tail_rid
         schema_encoding = 0
         base_rid = rid
-        tail_record = [indirection, new_tail_rid, timestamp, schema_encoding, base_rid]
+        # the RID is taken once the record has its place in a tail page
+        tail_record = [indirection, 0, timestamp, schema_encoding, base_rid]
         
         # update schema encoding bitmap (1 for updated, 0 for not updated)
         for i , val in enumerate(cols):
@@ -319,12 +737,110 @@ class Table:
             else:
                 tail_record.append(0)
         
+        # carry the columns of the previous tail record this update doesn't change, so it holds every updated column.
+        # a merged previous record has its columns in the base pages already
+        prev_rid = tail_rid
+        while self.cumulative and prev_rid not in [0, None] and prev_rid > page_range.tps:
+            prev_range_ind, prev_page_id, prev_offset = self.tail_page_directory[prev_rid]
+            
+            prev_schema = self.version_index.schemas[prev_rid]
+            
+            for col in range(self.num_columns):
+                if (prev_schema >> col) & 1 and not (schema_encoding >> col) & 1:
+                    prev_path = self._page_path("tail", prev_range_ind, col + 5, prev_page_id)
+                    tail_record[col + 5] = self.bufferpool.get_page(prev_path).read(prev_offset)
+                    self.bufferpool.unpin(prev_path)
+            schema_encoding |= prev_schema & ~SNAPSHOT_FLAG
+            
+            # a snapshot is the newest tail record when a crash came between it and the update after it, the one
+            # before it holds the other columns
+            if not prev_schema & SNAPSHOT_FLAG:
+                break
+            prev_rid = self.version_index.links[prev_rid]
+        
         tail_record[SCHEMA_ENCODING_COLUMN] = schema_encoding
         
+        # columns updated for the first time keep their original value in a snapshot tail record written before the
+        # update, merges overwrite it in the base record
+        first_updated = 0
+        for col, new_val in enumerate(cols):
+            if new_val is not None:
+                first_updated |= 1 << col
+        first_updated &= ~self.version_index.updated_columns(rid)
+        
+        # latest values of the updated columns that are indexed, or of all of them if the update may be rolled back,
+        # and the values the snapshot keeps
+        indexed_cols = [col for col, new_val in enumerate(cols) if new_val is not None and self.index.indices[col] is not None]
+        updated_cols = [col for col, new_val in enumerate(cols) if new_val is not None]
+        read_cols = updated_cols if transaction is not None else indexed_cols
+        read_cols = [col for col in range(self.num_columns) if col in read_cols or (first_updated >> col) & 1]
+        old_values = self.read_record(rid, [1 if col in read_cols else 0 for col in range(self.num_columns)], 0) if read_cols else None
+        
+        # update indices for updated columns
+        old_indexed = []
+        for col in indexed_cols:
+            new_val = cols[col]
+            # old value is the latest version before update
+            old_val = old_values[col]
+            # remove rid from old value index
+            self.index.remove_from_index(col, old_val, rid)
+            # add rid to new value index
+            self.index.add_to_index(col, new_val, rid)
+            old_indexed += [col, old_val]
+        # recovery rolls back updates of transactions that never ended with the old values of every updated column
+        logged_old = [value for col in updated_cols for value in (col, old_values[col])] if transaction is not None else old_indexed
+        tag = self._tag(transaction)
+        
+        # updates of the range append one at a time, so tail RIDs grow with their offsets in the tail pages
+        snapshot_rid = 0
+        with page_range.tail_lock:
+            if first_updated:
+                snapshot_record = [indirection, 0, timestamp, first_updated | SNAPSHOT_FLAG, base_rid]
+                snapshot_record += [old_values[col] if (first_updated >> col) & 1 else 0 for col in range(self.num_columns)]
+                snapshot_rid, _ = self._append_tail_record(page_range_ind, page_range, snapshot_record, [], tag)
+                tail_record[INDIRECTION_COLUMN] = snapshot_rid
+            new_tail_rid, lsn = self._append_tail_record(page_range_ind, page_range, tail_record, logged_old, tag)
+            # the page stays the last one until the tail lock is released, no merge has it in its plan yet
+            if transaction is not None:
+                self._hold(transaction, page_range, self.tail_page_directory[snapshot_rid or new_tail_rid][1])
+            
+            # update indirection column in base record to point to new tail record. merges never rewrite the
+            # metadata columns, the page id doesn't change under us
+            base_indir_path = self._page_path("base", page_range_ind, INDIRECTION_COLUMN, page_range.base_pages[INDIRECTION_COLUMN][page_ind])
+            self._write_value(base_indir_path, offset, new_tail_rid, lsn)
+
+        # let the scheduler decide whether the range needs a merge now
+        if self.merge_scheduler is not None:
+            chain_length = self.version_index.chain_length(rid, page_range.tps, self.merge_scheduler.max_chain_length)
+            self.merge_scheduler.updated(self, page_range_ind, chain_length)
+        
+        # rolling back unlinks the tail record and its snapshot again and puts the old values back where they are
+        # indexed. columns a cumulative tail record carries over keep their value
+        if transaction is not None:
+            changes = [(col, old_values[col] if cols[col] is not None else tail_record[col + 5], tail_record[col + 5])
+                       for col in range(self.num_columns) if (schema_encoding >> col) & 1]
+            transaction.undo.append((self, UPDATE, (rid, new_tail_rid, snapshot_rid, indirection, changes)))
+        
+        self._commit(lsn)
+        return True
+    
+    
+    """
+    # Appends a tail record to the last tail page of a page range, called with the range's tail lock held
+    :param page_range_ind: int          #page range of the updated record
+    :param page_range: PageRange
+    :param tail_record: list[int]       #metadata and user columns of the tail record, its RID is filled in here
+    :param old_values: list[int]        #column and old value of the changed columns replay and recovery need
+    :param tag: tuple                   #log tag of the transaction making the update, see _tag
+    # returns the RID of the tail record and the LSN it was logged with
+    """
+    def _append_tail_record(self, page_range_ind, page_range, tail_record, old_values, tag = None):
+        new_tail_rid = self._allocate_rids(1)
+        tail_record[RID_COLUMN] = new_tail_rid
+        
         # make sure tail page exists for all cols being written to
         if not page_range.tail_pages[0]:
-            for col_id in range(len(tail_record)):
-                page_range.add_tail_page(col_id)
+            page_range.add_tail_page()
         
         # check capacity using 0 column
         page_id0 = page_range.tail_pages[0][-1]
@@ -338,51 +854,28 @@ class Table:
             page_id0 = page_range.tail_pages[0][-1]
             path0 = self._page_path("tail", page_range_ind, 0, page_id0)
             page0 = self.bufferpool.get_page(path0)
-                
-            page_id0 = page_range.tail_pages[0][-1]
-            path0 = self._page_path("tail", page_range_ind, 0, page_id0)
-            page0 = self.bufferpool.get_page(path0)
             
         tail_offset = page0.num_records
         self.bufferpool.unpin(path0)
         
-        tail_page_ind = len(page_range.tail_pages[0]) - 1
+        # tail records are found by the id of their tail page, it doesn't change when merged pages leave the list
+        tail_page_id = page_id0
         
-        # update indices for updated columns
-        for col, new_val in enumerate(cols):
-            if new_val is not None and self.index.indices[col] is not None:
-                # old value is the latest version before update
-                old_val = self.read_version(rid, col, 0)
-                # remove rid from old value index
-                self.index.remove_from_index(col, old_val, rid)
-                # add rid to new value index
-                self.index.add_to_index(col, new_val, rid)
+        # the old values of indexed columns let replay move the record in the indexes without reading it
+        base_rid = tail_record[BASE_RID_COLUMN]
+        lsn = self._log(UPDATE, [page_range_ind, base_rid, tail_page_id, tail_offset] + tail_record + old_values, tag)
         
         # write tail record to tail page using bufferpool
         for col_id, val in enumerate(tail_record):
-            page_id = page_range.tail_pages[col_id][-1]
-            path = self._page_path("tail", page_range_ind, col_id, page_id)
-            page = self.bufferpool.get_page(path)
-            
-            page.write(val)
-            self.bufferpool.mark_dirty(path)
-            self.bufferpool.unpin(path)
-        
-        # update indirection column in base record to point to new tail record
-        base_indir_page.update(offset, new_tail_rid)
-        self.bufferpool.mark_dirty(base_indir_path)
-        self.bufferpool.unpin(base_indir_path)
+            path = self._page_path("tail", page_range_ind, col_id, tail_page_id)
+            with self.bufferpool.latched(path, exclusive = True) as page:
+                page.write(val)
+                self.bufferpool.mark_dirty(path, lsn)
             
         # update tail page directory
-        self.tail_page_directory[new_tail_rid] = (page_range_ind, tail_page_ind, tail_offset)
-
-        # schedule merge if tail is getting large
-        if len(page_range.tail_pages[0]) >= self.merge_threshold_pages:
-            if page_range_ind not in self._merge_scheduled:
-                self._merge_scheduled.add(page_range_ind)
-                self.mergeQ.put(page_range_ind)
-        
-        return True
+        self.tail_page_directory[new_tail_rid] = (page_range_ind, tail_page_id, tail_offset)
+        self.version_index.add(base_rid, new_tail_rid, tail_record[SCHEMA_ENCODING_COLUMN])
+        return new_tail_rid, lsn
     
     
     def _table_dir(self, db_root: str):
@@ -393,33 +886,39 @@ class Table:
         return os.path.join(self._table_dir(db_root), page_type, f"page_range_{range_id}")
     
     
+    # pages are identified by the segment file of their column and their position in it
     def _page_path(self, page_type: str, range_id: int, col_id: int, page_id: int):
-        return os.path.join(
+        segment = os.path.join(
             self.db_root,
             self.name,
             page_type,
             f"range_{range_id}",
-            f"col_{col_id}_page_{page_id}.bin"
+            SEGMENT_NAME.format(col_id = col_id)
         )
+        return (segment, page_id)
         
         
-    def _rebuild_index(self):
+    """
+    :param kinds: dict      #mapping of column to index type for every column that was indexed
+    """
+    def _rebuild_index(self, kinds):
         self.index = Index(self)   
         
-        # create indices for every col
-        for col in range(self.num_columns):
-            if self.index.indices[col] is None:
-                   self.index.indices[col] = {'index': {}}
+        # create empty indices for the columns that were indexed
+        for col, kind in kinds.items():
+            if col != self.key:
+                self.index.indices[col] = INDEX_TYPES[kind]()
                    
         # add every record back into indexed columns
+        indexed_cols = list(kinds)
         for rid in self.page_directory.keys():
-            for col in range(self.num_columns):
+            for col in indexed_cols:
                 val = self.read_version(rid, col, 0)
                 self.index.add_to_index(col, val, rid)
     
     
     def _rebuild_page_directory(self):
-        self.page_directory = {}
+        self.page_directory = PageDirectory()
         
         for page_range_ind, page_range in enumerate(self.page_ranges):
             if not page_range.base_pages or not page_range.base_pages[RID_COLUMN]:
@@ -429,47 +928,88 @@ class Table:
                 rid_path = self._page_path("base", page_range_ind, RID_COLUMN, rid_page)
                 rid_page = self.bufferpool.get_page(rid_path)
                 
-                for offset in range(rid_page.num_records):
-                    rid = rid_page.read(offset)
+                for offset, rid in enumerate(rid_page.read_all()):
+                    # deleted records have their RID set to 0, only the very first record really has RID 0
+                    if rid == 0 and (page_range_ind, page_ind, offset) != (0, 0, 0):
+                        continue
                     self.page_directory[rid] = (page_range_ind, page_ind, offset)
                     
                 self.bufferpool.unpin(rid_path)
     
     
     def _rebuild_tail_page_directory(self):
-        self.tail_page_directory = {}
+        self.tail_page_directory = PageDirectory()
         
         for page_range_ind, page_range in enumerate(self.page_ranges):
             if not page_range.tail_pages or not page_range.tail_pages[RID_COLUMN]:
                 continue
             
-            for page_ind, rid_page in enumerate(page_range.tail_pages[RID_COLUMN]):
-                rid_path = self._page_path("tail", page_range_ind, RID_COLUMN, rid_page)
+            merged_tail_ids = [page_id for _, tail_ids, _ in page_range.history for page_id in tail_ids]
+            for page_id in merged_tail_ids + page_range.tail_pages[RID_COLUMN]:
+                rid_path = self._page_path("tail", page_range_ind, RID_COLUMN, page_id)
                 rid_page = self.bufferpool.get_page(rid_path)
                 
-                for offset in range(rid_page.num_records):
-                    tail_rid = rid_page.read(offset)
+                for offset, tail_rid in enumerate(rid_page.read_all()):
                     #if tail_rid is None:
                     if tail_rid in (0, None):
                         continue
-                    self.tail_page_directory[tail_rid] = (page_range_ind, page_ind, offset)
+                    self.tail_page_directory[tail_rid] = (page_range_ind, page_id, offset)
                     
                 self.bufferpool.unpin(rid_path)
     
     
-    def flush(self, db_root: str):
-        table_dir = self._table_dir(db_root)
-        os.makedirs(table_dir, exist_ok = True)
-        
-        # write metadata
+    # tail chains from the tail pages, RIDs come from one counter so the tail directory lists them in update order
+    def _rebuild_version_index(self):
+        self.version_index = VersionIndex()
+        
+        for tail_rid, (page_range_ind, page_id, offset) in self.tail_page_directory.items():
+            base_rid_path = self._page_path("tail", page_range_ind, BASE_RID_COLUMN, page_id)
+            schema_path = self._page_path("tail", page_range_ind, SCHEMA_ENCODING_COLUMN, page_id)
+            base_rid = self.bufferpool.get_page(base_rid_path).read(offset)
+            schema = self.bufferpool.get_page(schema_path).read(offset)
+            self.bufferpool.unpin(schema_path)
+            self.bufferpool.unpin(base_rid_path)
+            
+            # chains of deleted records are not needed
+            if base_rid not in self.page_directory:
+                continue
+            # the oldest tail record kept may follow freed ones, the chain goes on to them so reads of older versions
+            # know to use the horizon pages
+            if not self.version_index.latest(base_rid):
+                indirection_path = self._page_path("tail", page_range_ind, INDIRECTION_COLUMN, page_id)
+                previous_rid = self.bufferpool.get_page(indirection_path).read(offset)
+                self.bufferpool.unpin(indirection_path)
+                if previous_rid:
+                    self.version_index.relink(base_rid, previous_rid)
+            self.version_index.add(base_rid, tail_rid, schema)
+    
+    
+    """
+    # Copies what a checkpoint saves of the table, called while the write gate is closed so no write is half done
+    :param generation: int      #generation of the log started by the checkpoint
+    # returns the snapshot to pass to save_snapshot
+    """
+    def snapshot(self, generation):
+        allocations = []
+        sealed = []
+        for page_range in self.page_ranges:
+            allocation, base_ids, tail_ids = page_range.seal()
+            allocations.append(allocation)
+            sealed.append((base_ids, tail_ids))
+            
         meta = {
             "name": self.name,
             "num_columns": self.num_columns,
             "key": self.key,
+            "cumulative": self.cumulative,
             "rid_counter": self.rid_counter,
+            "log_generation": generation,
+            "indexes": self.index.kinds(),
             "num_page_ranges": len(self.page_ranges),
             "base_pages": [page_range.base_pages for page_range in self.page_ranges],
             "tail_pages": [page_range.tail_pages for page_range in self.page_ranges],
+            # free page ids and TPS of every page range
+            "allocation": allocations,
             
             # open() needs to know how many files to load
             "base_page_counts": [len(page_range.base_pages[0]) if page_range.base_pages and page_range.base_pages[0] else 0
@@ -480,8 +1020,59 @@ class Table:
             ]
         }
         
-        with open(os.path.join(table_dir, "meta.json"), "w") as file:
-            json.dump(meta, file)
+        return {
+            "generation": generation,
+            "rid_counter": self.rid_counter,
+            # the page lists keep changing once writes go on, the metadata is serialized right away
+            "meta": json.dumps(meta),
+            "directories": (
+                PageDirectory(self.page_directory.locations[:]),
+                PageDirectory(self.tail_page_directory.locations[:]),
+                VersionIndex(self.version_index.links[:], self.version_index.numbers[:], self.version_index.schemas[:]),
+            ),
+            "index": self.index.snapshot(),
+            "sealed": sealed,
+        }
+    
+    
+    """
+    # Saves a snapshot, once every page changed before it is on disk
+    :param db_root: string      #directory of the database
+    :param snapshot: dict       #taken by snapshot
+    """
+    def save_snapshot(self, db_root, snapshot):
+        table_dir = self._table_dir(db_root)
+        os.makedirs(table_dir, exist_ok = True)
+        generation = snapshot["generation"]
+        rid_counter = snapshot["rid_counter"]
+        
+        # save indexes and page directories before metadata. they are named by generation, so until the new metadata
+        # replaces the old one it still finds the files it was saved with
+        directory_file = DIRECTORY_FILE.format(generation = generation)
+        index_file = INDEX_FILE.format(generation = generation)
+        self.index.save(os.path.join(table_dir, index_file), rid_counter, snapshot["index"])
+        save_directories(os.path.join(table_dir, directory_file), rid_counter, *snapshot["directories"])
+        
+        # the log before the checkpoint is deleted once every table is saved, so the metadata must be on disk by then
+        meta_path = os.path.join(table_dir, "meta.json")
+        with open(meta_path + ".tmp", "w") as file:
+            file.write(snapshot["meta"])
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(meta_path + ".tmp", meta_path)
+        sync_directory(table_dir)
+        self.log_generation = generation
+        
+        # snapshot files of earlier checkpoints
+        for name in os.listdir(table_dir):
+            if SNAPSHOT_FILE_PATTERN.match(name) and name not in (directory_file, index_file):
+                os.remove(os.path.join(table_dir, name))
+                
+                
+    # gives out the ids a saved snapshot recorded as free
+    def release_sealed(self, snapshot):
+        for page_range, (base_ids, tail_ids) in zip(self.page_ranges, snapshot["sealed"]):
+            page_range.release(base_ids, tail_ids)
             
     
     def load(self, db_root):
@@ -493,7 +1084,9 @@ class Table:
             
         self.num_columns = meta["num_columns"]
         self.key = meta["key"]
+        self.cumulative = meta.get("cumulative", False)
         self.rid_counter = meta["rid_counter"]
+        self.log_generation = meta.get("log_generation", 0)
         
         num_page_ranges = meta["num_page_ranges"]
         
@@ -503,6 +1096,12 @@ class Table:
             page_range = PageRange(self.num_columns + 5, MAX_BASE_PAGES)
             page_range.base_pages = meta["base_pages"][range_id]
             page_range.tail_pages = meta["tail_pages"][range_id]
+            page_range.restore_allocation(meta["allocation"][range_id] if "allocation" in meta else None)
+            # tables saved while merged tail pages were never freed have them all in one list, the base pages hold
+            # the values as of its TPS
+            if meta.get("merged_tail_pages", [[]] * num_page_ranges)[range_id] and not page_range.history:
+                written = [pages if col >= 5 else [] for col, pages in enumerate(page_range.base_pages)]
+                page_range.history = [[page_range.tps, meta["merged_tail_pages"][range_id], [list(pages) for pages in written]]]
             self.page_ranges.append(page_range)
             
             """
@@ -516,12 +1115,45 @@ class Table:
             for col_id in range(len(page_range.tail_pages)):
                 page_range.tail_pages[col_id] = list(range(tail_counts[col_id]))"""
             
-        self._rebuild_tail_page_directory()
-        self._rebuild_page_directory()
-        self._rebuild_index()
+        # snapshot files of the checkpoint the table was saved at, tables saved before checkpoints have unnumbered ones
+        directory_path = os.path.join(table_dir, DIRECTORY_FILE.format(generation = self.log_generation))
+        index_path = os.path.join(table_dir, INDEX_FILE.format(generation = self.log_generation))
+        if not os.path.exists(directory_path) and not os.path.exists(index_path):
+            directory_path = os.path.join(table_dir, "directory.bin")
+            index_path = os.path.join(table_dir, "index.bin")
+        
+        # restore saved page directories with one read, only scan the RID pages if the snapshot is missing or stale
+        directories = load_directories(directory_path, self.rid_counter)
+        if directories is not None:
+            self.page_directory, self.tail_page_directory, self.version_index = directories
+        else:
+            self._rebuild_tail_page_directory()
+            self._rebuild_page_directory()
+            self._rebuild_version_index()
         
+        # restore saved indexes, only rebuild the columns that were indexed if the file is missing or stale
+        if not self.index.load(index_path, self.rid_counter):
+            kinds = {int(col): kind for col, kind in meta.get("indexes", {str(self.key): "ordered"}).items()}
+            self._rebuild_index(kinds)
         
-    def delete(self, rid):
+        
+    """
+    :param rid: int
+    :param transaction: Transaction     #transaction deleting the record, None outside transactions
+    """
+    def delete(self, rid, transaction = None):
+        if transaction is not None and rid in self.page_directory:
+            # a merge running now finishes first, later ones wait for the transaction. merges skip deleted records,
+            # the base pages kept as history must not miss the record if the delete is rolled back
+            page_range = self.page_ranges[self.page_directory[rid][0]]
+            with page_range.merge_lock:
+                self._hold(transaction, page_range, None)
+        with self.write_gate.enter():
+            return self._delete(rid, transaction)
+        
+        
+    # rollbacks delete inserted records with the tag of the entry they undo and without a transaction
+    def _delete(self, rid, transaction = None, tag = None):
         if rid not in self.page_directory:
             return False
         
@@ -529,185 +1161,496 @@ class Table:
         page_range = self.page_ranges[page_range_ind]
         
         try:
-            rid_page_id = page_range.base_pages[RID_COLUMN][page_ind]
-            rid_path = self._page_path("base", page_range_ind, RID_COLUMN, rid_page_id)
-            rid_page = self.bufferpool.get_page(rid_path)
-            rid_page.update(offset, 0)
-            self.bufferpool.mark_dirty(rid_path)
-            self.bufferpool.unpin(rid_path)
+            # values of indexed columns, to remove the record from the indexes. they are logged so replay doesn't read it.
+            # a delete that may be rolled back keeps every value, merges from now on leave the record out of the base pages.
+            # its log record holds them and where the record was, for recovery to roll it back
+            projection = [1 if index is not None or transaction is not None else 0 for index in self.index.indices]
+            values = self.read_record(rid, projection, 0)
+            indexed = []
+            logged = []
+            for col, projected in enumerate(projection):
+                if projected:
+                    logged += [col, values[col]]
+                    if self.index.indices[col] is not None:
+                        indexed += [col, values[col]]
+            latest = self.version_index.latest(rid)
+            tps = page_range.tps
+            if transaction is not None:
+                tag = self._tag(transaction)
             
+            lsn = self._log(DELETE, [rid, page_range_ind, page_ind, offset, latest, tps] + logged, tag)
+            
+            rid_page_id = page_range.base_pages[RID_COLUMN][page_ind]
+            self._write_value(self._page_path("base", page_range_ind, RID_COLUMN, rid_page_id), offset, 0, lsn)
             
             indir_page_id = page_range.base_pages[INDIRECTION_COLUMN][page_ind]
-            indir_path = self._page_path("base", page_range_ind, INDIRECTION_COLUMN, indir_page_id)
-            indir_page = self.bufferpool.get_page(indir_path)
-            indir_page.update(offset, 0)
-            self.bufferpool.mark_dirty(indir_path)
-            self.bufferpool.unpin(indir_path)
+            self._write_value(self._page_path("base", page_range_ind, INDIRECTION_COLUMN, indir_page_id), offset, 0, lsn)
             
             del self.page_directory[rid]
+            self.version_index.remove(rid)
+            
+            for i in range(0, len(indexed), 2):
+                self.index.remove_from_index(indexed[i], indexed[i + 1], rid)
             
+            if transaction is not None:
+                transaction.undo.append((self, DELETE, (rid, (page_range_ind, page_ind, offset), latest, tps, values)))
+            
+            self._commit(lsn)
             return True
         except Exception:
             return False
 
 
-    def __read_page_direct(self, path):
-        if not os.path.exists(path):
-            return Page()
-        with open(path, "rb") as f:
-            raw = f.read()
-        return Page.from_bytes(raw)
+    """
+    # Undoes a change of an aborted transaction with what the change saved in the transaction's undo list
+    :param kind: int            #INSERT, UPDATE or DELETE
+    :param values: tuple        #undo entry of the change
+    :param tag: tuple           #log tag of the undo records: the transaction id and ~position of the undo entry
+    """
+    def rollback(self, kind, values, tag = None):
+        if kind == INSERT:
+            # inserted records are deleted again, their slots stay empty like those of any deleted record
+            for rid in values:
+                with self.write_gate.enter():
+                    self._delete(rid, tag = tag)
+        elif kind == UPDATE:
+            self._rollback_update(*values, tag)
+        elif kind == DELETE:
+            self._rollback_delete(*values, tag)
 
 
-    def __write_page_direct(self, path, page):
-        os.makedirs(os.path.dirname(path), exist_ok=True)
-        data = page.to_bytes()
+    """
+    # Builds the undo entry of a change from its log records, for recovery to roll back transactions that never ended
+    :param kind: int                #INSERT, UPDATE or DELETE
+    :param records: list[array]     #values of the records the change was logged with
+    # returns the undo entry, None for records rollbacks need not undo
+    """
+    def undo_entry(self, kind, records):
+        if kind == INSERT:
+            values = records[0]
+            count = values[3]
+            first_rid = values[4 + self.num_columns + 5 + RID_COLUMN * count]
+            return list(range(first_rid, first_rid + count))
+        if kind == UPDATE:
+            # an update is logged after the snapshot written before it, a crash between the two leaves the snapshot
+            # to unlink on its own
+            first = records[0][4:self.num_columns + 9]
+            snapshot_rid = first[RID_COLUMN] if first[SCHEMA_ENCODING_COLUMN] & SNAPSHOT_FLAG else 0
+            values = records[-1]
+            tail_record = values[4:self.num_columns + 9]
+            schema = tail_record[SCHEMA_ENCODING_COLUMN]
+            if schema & SNAPSHOT_FLAG:
+                return (values[1], snapshot_rid, 0, first[INDIRECTION_COLUMN], [])
+            old_values = values[self.num_columns + 9:]
+            old = {old_values[i]: old_values[i + 1] for i in range(0, len(old_values), 2)}
+            changes = [(col, old.get(col, tail_record[col + 5]), tail_record[col + 5])
+                       for col in range(self.num_columns) if (schema >> col) & 1]
+            return (values[1], tail_record[RID_COLUMN], snapshot_rid, first[INDIRECTION_COLUMN], changes)
+        if kind == DELETE:
+            rid, page_range_ind, page_ind, offset, latest, tps = records[0][:6]
+            return (rid, (page_range_ind, page_ind, offset), latest, tps, list(records[0][7::2]))
+        return None
+
+
+    # rollbacks hold the merge lock of the range, merges run either entirely before or entirely after one
+    def _rollback_update(self, rid, tail_rid, snapshot_rid, previous_rid, changes, tag = None):
+        page_range = self.page_ranges[self.page_directory[rid][0]]
+        with page_range.merge_lock, self.write_gate.enter():
+            # a merge installed since the update has the rolled back values in the base record
+            merged = int(tail_rid <= page_range.tps)
+            # columns no older unmerged tail record holds are read from the base record once the tail record is
+            # unlinked. the base record holds their old values already, unless a merge applied the rolled back
+            # values or skipped the record while a rolled back delete had it removed
+            unmerged = self.version_index.updated_since(previous_rid, page_range.tps, self.cumulative)
+            rewrite = sum(1 << col for col, _, _ in changes if not (unmerged >> col) & 1)
+            lsn = self._log(UNDO_UPDATE, [rid, tail_rid, snapshot_rid, previous_rid, merged, rewrite] +
+                            [value for change in changes for value in change], tag)
+            self._undo_update(rid, tail_rid, snapshot_rid, previous_rid, merged, rewrite, changes, lsn)
+        self._commit(lsn)
+
+
+    def _undo_update(self, rid, tail_rid, snapshot_rid, previous_rid, merged, rewrite, changes, lsn = None):
+        page_range_ind, page_ind, offset = self.page_directory[rid]
+        page_range = self.page_ranges[page_range_ind]
+
+        for col, old_value, _ in changes:
+            if (rewrite >> col) & 1:
+                self._write_value(self._page_path("base", page_range_ind, col + 5, page_range.base_pages[col + 5][page_ind]), offset, old_value, lsn)
+        # a tail record that updates no column is skipped by merges. a merged one is never merged again
+        if not merged:
+            for unlinked_rid in (tail_rid, snapshot_rid):
+                if unlinked_rid:
+                    _, tail_page_id, tail_offset = self.tail_page_directory[unlinked_rid]
+                    self._write_value(self._page_path("tail", page_range_ind, SCHEMA_ENCODING_COLUMN, tail_page_id), tail_offset, 0, lsn)
+
+        self._write_value(self._page_path("base", page_range_ind, INDIRECTION_COLUMN, page_range.base_pages[INDIRECTION_COLUMN][page_ind]),
+                          offset, previous_rid, lsn)
+        # the columns the snapshot kept were never updated before, they read from the base record again
+        self.version_index.unlink(rid, tail_rid)
+        if snapshot_rid:
+            self.version_index.unlink(rid, snapshot_rid)
+
+        for col, old_value, new_value in changes:
+            if self.index.indices[col] is not None and old_value != new_value:
+                self.index.remove_from_index(col, new_value, rid)
+                self.index.add_to_index(col, old_value, rid)
+
+
+    def _rollback_delete(self, rid, location, latest, tps, values, tag = None):
+        page_range_ind, page_ind, offset = location
+        page_range = self.page_ranges[page_range_ind]
+        with page_range.merge_lock, self.write_gate.enter():
+            # merges since the delete left the record out. its columns that no unmerged tail record holds are read
+            # from the base record, their newest values are written back to it
+            rewrite = 0
+            if page_range.tps != tps:
+                unmerged = self.version_index.updated_since(latest, page_range.tps, self.cumulative)
+                rewrite = ((1 << self.num_columns) - 1) & ~unmerged
+            lsn = self._log(UNDO_DELETE, [rid, page_range_ind, page_ind, offset, latest, rewrite] + list(values), tag)
+            self._undo_delete(rid, location, latest, rewrite, values, lsn)
+        self._commit(lsn)
+
+
+    def _undo_delete(self, rid, location, latest, rewrite, values, lsn = None):
+        page_range_ind, page_ind, offset = location
+        page_range = self.page_ranges[page_range_ind]
+
+        def base_path(col):
+            return self._page_path("base", page_range_ind, col, page_range.base_pages[col][page_ind])
+
+        for col, value in enumerate(values):
+            if (rewrite >> col) & 1:
+                self._write_value(base_path(col + 5), offset, value, lsn)
+        self._write_value(base_path(RID_COLUMN), offset, rid, lsn)
+        self._write_value(base_path(INDIRECTION_COLUMN), offset, latest, lsn)
+
+        self.page_directory[rid] = location
+        self.version_index.relink(rid, latest)
+        for col, value in enumerate(values):
+            if self.index.indices[col] is not None:
+                self.index.add_to_index(col, value, rid)
+
+
+    # writes one value of a record. without an LSN it is replayed, pages merged away later may have been emptied since
+    def _write_value(self, path, offset, value, lsn = None):
+        if lsn is None:
+            self._replay_write(path, offset, array('q', [value]))
+            return
+        # flushes and merges reading the page hold its latch shared, they never see it half written
+        with self.bufferpool.latched(path, exclusive = True) as page:
+            page.update(offset, value)
+            self.bufferpool.mark_dirty(path, lsn)
+
+
+    """
+    # Applies a record of the write-ahead log, recovery replays every record logged since the table was saved
+    :param kind: int            #record kind, see lstore.wal
+    :param values: array        #values of the record
+    """
+    def replay(self, kind, values):
+        if kind == INSERT:
+            self._replay_insert(values)
+        elif kind == UPDATE:
+            self._replay_update(values)
+        elif kind == DELETE:
+            self._replay_delete(values)
+        elif kind == MERGE:
+            self._replay_merge(values)
+        elif kind == UNDO_UPDATE:
+            rid, tail_rid, snapshot_rid, previous_rid, merged, rewrite = values[:6]
+            changes = [tuple(values[i:i + 3]) for i in range(6, len(values), 3)]
+            self._undo_update(rid, tail_rid, snapshot_rid, previous_rid, merged, rewrite, changes)
+        elif kind == UNDO_DELETE:
+            rid, page_range_ind, page_ind, offset, latest, rewrite = values[:6]
+            self._undo_delete(rid, (page_range_ind, page_ind, offset), latest, rewrite, values[6:])
+            
+            
+    # writes values at offset of a page, records past the end of the page are added to it
+    def _replay_write(self, path, offset, values):
+        with self.bufferpool.latched(path, exclusive = True) as page:
+            page.values[offset:offset + len(values)] = values
+            page.num_records = max(page.num_records, offset + len(values))
         
-        tmp = path + f".{threading.get_ident()}.tmp"
         
-        with open(tmp, "wb") as file:
-            file.write(data)
-            file.flush()
+    def _replay_insert(self, values):
+        page_range_ind, page_ind, first_offset, count = values[:4]
+        num_cols = self.num_columns + 5
+        page_ids = values[4:4 + num_cols]
+        columns = values[4 + num_cols:]
+        
+        while len(self.page_ranges) <= page_range_ind:
+            self.page_ranges.append(PageRange(num_cols, MAX_BASE_PAGES))
+        page_range = self.page_ranges[page_range_ind]
+        
+        # the first insert into a base page added it, pages merged since keep their new ids
+        if len(page_range.base_pages[0]) == page_ind:
+            for col in range(num_cols):
+                page_range.base_pages[col].append(page_ids[col])
+                page_range.claim_base_id(col, page_ids[col])
+                
+        for col in range(num_cols):
+            path = self._page_path("base", page_range_ind, col, page_ids[col])
+            self._replay_write(path, first_offset, columns[col * count:(col + 1) * count])
             
-        os.replace(tmp, path)
+        first_rid = columns[RID_COLUMN * count]
+        self.page_directory.set_many(first_rid, page_range_ind, page_ind, first_offset, count)
+        self.rid_counter = max(self.rid_counter, first_rid + count)
         
-    
-    def _read_latest_page(self, path):
-        p = self.__read_page_direct(path)
-        raw_bytes = p.to_bytes()
-        self.bufferpool.unpin(path)
-        return Page.from_bytes(raw_bytes)
+        # indexes were saved by the checkpoint the log starts at, records logged since are added to them
+        rids = range(first_rid, first_rid + count)
+        for col in range(self.num_columns):
+            self.index.add_many(col, columns[(col + 5) * count:(col + 6) * count], rids)
+        
+        
+    def _replay_update(self, values):
+        page_range_ind, base_rid, tail_page_id, tail_offset = values[:4]
+        tail_record = values[4:self.num_columns + 9]
+        old_indexed = values[self.num_columns + 9:]
+        page_range = self.page_ranges[page_range_ind]
+        
+        # the first update into a tail page added it
+        if tail_page_id not in page_range.tail_pages[0] and not any(tail_page_id in tail_ids for _, tail_ids, _ in page_range.history):
+            for col in range(len(page_range.tail_pages)):
+                page_range.tail_pages[col].append(tail_page_id)
+            page_range.claim_tail_id(tail_page_id)
             
+        for col, value in enumerate(tail_record):
+            self._replay_write(self._page_path("tail", page_range_ind, col, tail_page_id), tail_offset, array('q', [value]))
             
-    def _merge_worker(self):
-        while True:
-            range_id = self.mergeQ.get()
-            if range_id is None:
-                break
-            try:
-                self.__merge_page_range(range_id)
-            finally:
-                self._merge_scheduled.discard(range_id)
+        tail_rid = tail_record[RID_COLUMN]
+        if base_rid in self.page_directory:
+            _, page_ind, offset = self.page_directory[base_rid]
+            indir_path = self._page_path("base", page_range_ind, INDIRECTION_COLUMN, page_range.base_pages[INDIRECTION_COLUMN][page_ind])
+            self._replay_write(indir_path, offset, array('q', [tail_rid]))
+            
+        self.tail_page_directory[tail_rid] = (page_range_ind, tail_page_id, tail_offset)
+        # a tail record already in the saved version index would link to itself
+        if tail_rid >= len(self.version_index.numbers) or not self.version_index.numbers[tail_rid]:
+            self.version_index.add(base_rid, tail_rid, tail_record[SCHEMA_ENCODING_COLUMN])
+        self.rid_counter = max(self.rid_counter, tail_rid + 1)
+        
+        # updates made by transactions log the old value of every updated column, not only of indexed ones
+        for i in range(0, len(old_indexed), 2):
+            col = old_indexed[i]
+            if self.index.indices[col] is not None:
+                self.index.remove_from_index(col, old_indexed[i + 1], base_rid)
+                self.index.add_to_index(col, tail_record[col + 5], base_rid)
+        
+        
+    def _replay_delete(self, values):
+        rid = values[0]
+        # logs written before deletes carried the record's location hold only the RID before the values
+        pairs = values[1:] if len(values) % 2 else values[6:]
+        if rid not in self.page_directory:
+            return
+        
+        page_range_ind, page_ind, offset = self.page_directory[rid]
+        page_range = self.page_ranges[page_range_ind]
+        for col in (RID_COLUMN, INDIRECTION_COLUMN):
+            path = self._page_path("base", page_range_ind, col, page_range.base_pages[col][page_ind])
+            self._replay_write(path, offset, array('q', [0]))
+            
+        del self.page_directory[rid]
+        self.version_index.remove(rid)
+        for i in range(0, len(pairs), 2):
+            if self.index.indices[pairs[i]] is not None:
+                self.index.remove_from_index(pairs[i], pairs[i + 1], rid)
+        
+        
+    def _replay_merge(self, values):
+        page_range_ind, tps, num_installed = values[:3]
+        page_range = self.page_ranges[page_range_ind]
+        
+        position = 3
+        installed = []
+        for _ in range(num_installed):
+            col, page_ind, new_id, count, num_inserted = values[position:position + 5]
+            inserted = values[position + 5:position + 5 + num_inserted]
+            position += 5 + num_inserted
+            
+            old_id = page_range.base_pages[col][page_ind]
+            if old_id == new_id:
+                continue
+            # the merged records were synced before the merge was logged, only the carried over ones are redone
+            if inserted:
+                self._replay_write(self._page_path("base", page_range_ind, col, new_id), count, inserted)
+            page_range.claim_base_id(col, new_id)
+            installed.append((col, page_ind, new_id))
+            
+        merge_tail_ids = [page_id for page_id in values[position + 1:] if page_id in page_range.tail_pages[0]]
+        page_range.retire(*page_range.install(installed, tps, merge_tail_ids))
+        
+        
+    def __write_page_direct(self, path, page):
+        segment, page_id = path
+        self.bufferpool.storage.write_page(segment, page_id, page)
+        
+    
+    """
+    # Decides which pages a merge of a page range reads and the new page ids it writes its base pages to
+    :param range_id: int        #page range to merge
+    # returns the plan for consolidate, or None if there is nothing to merge
+    """
+    def _merge_plan(self, range_id):
+        page_range = self.page_ranges[range_id]
+
+        # the last tail page is still being filled by updates, every tail page before it is full and merged. tail
+        # pages from the first one a running transaction wrote to wait for it to end
+        with page_range.lock:
+            merge_tail_ids = list(page_range.tail_pages[RID_COLUMN][:-1])
+            for page_id in page_range.unfinished.values():
+                if page_id is None:
+                    merge_tail_ids = []
+                elif page_id in merge_tail_ids:
+                    merge_tail_ids = merge_tail_ids[:merge_tail_ids.index(page_id)]
+        if not merge_tail_ids:
+            return None
+
+        # records updated by the merged tail records were all inserted by now, so they are in these base pages
+        base_page_count = len(page_range.base_pages[0])
+        if base_page_count == 0:
+            return None
+        user_cols = range(5, self.num_columns + 5)
 
+        # only user columns are consolidated, the metadata columns are never rewritten so updates and deletes
+        # keep writing to the same INDIRECTION and RID pages while the merge runs
+        base_cols = [RID_COLUMN] + list(user_cols)
+        tail_cols = [RID_COLUMN, BASE_RID_COLUMN, SCHEMA_ENCODING_COLUMN] + list(user_cols)
+        return {
+            "num_columns": self.num_columns,
+            "tps": page_range.tps,
+            "tail_page_ids": merge_tail_ids,
+            "base_pages": {col: [self._page_path("base", range_id, col, page_id) for page_id in page_range.base_pages[col][:base_page_count]]
+                           for col in base_cols},
+            "new_base_pages": {col: [self._page_path("base", range_id, col, page_range.allocate_base_id(col)) for _ in range(base_page_count)]
+                               for col in user_cols},
+            "tail_pages": {col: [self._page_path("tail", range_id, col, page_id) for page_id in merge_tail_ids] for col in tail_cols},
+        }
 
-    def __merge_page_range(self, range_id):
+
+    """
+    # Applies the full tail pages of a page range to new copies of its base pages and retires the old pages
+    :param range_id: int                    #page range to merge
+    :param executor: Executor               #process pool to consolidate the range in, None to do it in this thread
+    # returns (base pages written, tail pages merged), or False if there was nothing to merge
+    """
+    def merge_page_range(self, range_id, executor = None):
         if range_id < 0 or range_id >= len(self.page_ranges):
             return False
 
+        # rollbacks in the range wait, the merge must not read a record one is putting back half way
+        with self.page_ranges[range_id].merge_lock:
+            return self._merge_page_range(range_id, executor)
+
+
+    def _merge_page_range(self, range_id, executor):
         page_range = self.page_ranges[range_id]
-        total_cols = self.num_columns + 5
+        plan = self._merge_plan(range_id)
+        if plan is None:
+            return False
+        merge_tail_ids = plan["tail_page_ids"]
 
-        base_page_count = len(page_range.base_pages[0]) if page_range.base_pages and page_range.base_pages[0] else 0
-        if base_page_count == 0:
-            return True
+        try:
+            if executor is None:
+                tps, record_counts = consolidate(plan, self.bufferpool.latched, self.__write_page_direct)
+            else:
+                # the merge process reads the segment files, so the pages it reads must be on disk first
+                self.bufferpool.flush([path for paths in plan["base_pages"].values() for path in paths] +
+                                      [path for paths in plan["tail_pages"].values() for path in paths])
+                tps, record_counts = executor.submit(consolidate_in_process, plan).result()
+        except BaseException:
+            # nothing points at the new pages yet, they can be given out again right away
+            new_base_ids = []
+            for col, paths in plan["new_base_pages"].items():
+                for path in paths:
+                    self._free_page(path)
+                    new_base_ids.append((col, path[1]))
+            page_range.release(new_base_ids, [])
+            raise
 
-        old_base_ids = [[page_range.base_pages[c][i] for i in range(base_page_count)] for c in range(total_cols)]
+        # the log will point at the new pages, they have to be on disk before it does
+        if self.wal is not None:
+            self.bufferpool.storage.sync()
 
-        cons_pages = {} 
-        new_base_ids = [[] for _ in range(total_cols)]
+        # install the new base pages, inserts wait so none lands in an old page after it was read
+        with self.write_gate.enter(), self._append_lock:
+            installed = []
+            for col, new_paths in plan["new_base_pages"].items():
+                for page_ind, new_path in enumerate(new_paths):
+                    old_id = page_range.base_pages[col][page_ind]
+                    count = record_counts[col, page_ind]
 
-        for col in range(total_cols):
-            for page_ind in range(base_page_count):
-                old_id = page_range.base_pages[col][page_ind]
-                old_path = self._page_path("base", range_id, col, old_id)
-                base_copy = self._read_latest_page(old_path)
+                    # records inserted since the page was read have no merged updates, carry them over as they are
+                    with self.bufferpool.latched(self._page_path("base", range_id, col, old_id)) as latest_page:
+                        inserted = latest_page.values[count:latest_page.num_records].tolist()
+                    if inserted:
+                        new_page = self.bufferpool.storage.read_page(*new_path)
+                        new_page.write_many(inserted)
+                        self.__write_page_direct(new_path, new_page)
 
-                new_id = len(page_range.base_pages[col]) + page_ind
-                new_base_ids[col].append(new_id)
-                cons_pages[(col, page_ind)] = base_copy
+                    installed.append((col, page_ind, new_path[1], count, inserted))
 
-        base_rids = []
-        rid_page_ids = page_range.base_pages[RID_COLUMN]
-        
-        for base_page_ind, rid_page_id in enumerate(rid_page_ids):
-            rid_path = self._page_path("base", range_id, RID_COLUMN, rid_page_id)
-            rid_page = self._read_latest_page(rid_path)
-            for base_offset in range(rid_page.num_records):
-                base_rid = rid_page.read(base_offset)
-                if base_rid in (0, None):
-                    continue
-                base_rids.append((base_rid, base_page_ind, base_offset))
-                
-        base_lookup = {
-            rid: (page_ind, offset)
-            for rid, page_ind, offset in base_rids
-        }
-        
-        seenUpdates = set()
+            # carried over records are logged with the new page ids, replay doesn't need the old pages
+            record = [range_id, tps, len(installed)]
+            for col, page_ind, new_id, count, inserted in installed:
+                record += [col, page_ind, new_id, count, len(inserted)] + inserted
+            record += [len(merge_tail_ids)] + merge_tail_ids
+            lsn = self._log(MERGE, record)
 
-        tail_rid_page_ids = page_range.tail_pages[RID_COLUMN]
-        for tail_page_ind in range(len(tail_rid_page_ids) - 1, -1, -1):
-            rid_page_id = tail_rid_page_ids[tail_page_ind]
-            rid_path = self._page_path("tail", range_id, RID_COLUMN, rid_page_id)
-            rid_page = self._read_latest_page(rid_path)
-            
-            base_rid_page_id = page_range.tail_pages[BASE_RID_COLUMN][tail_page_ind]
-            base_rid_path = self._page_path("tail", range_id, BASE_RID_COLUMN, base_rid_page_id)
-            base_rid_page = self._read_latest_page(base_rid_path)
+            retired_base_ids, retired_tail_ids = page_range.install([(col, page_ind, new_id) for col, page_ind, new_id, _, _ in installed],
+                                                                    tps, merge_tail_ids)
+            page_range.retire(retired_base_ids, retired_tail_ids)
 
-            for tail_offset in range(rid_page.num_records - 1, -1, -1):
-                
-                if tail_offset >= base_rid_page.num_records:
-                    continue
-                
-                base_rid = base_rid_page.read(tail_offset)
-                
-                base_info = base_lookup.get(base_rid)
-                if not base_info:
-                    continue
-                
-                base_page_ind, base_offset = base_info
+        # the old pages are emptied once freed, replay must not need them any more by then
+        if self.wal is not None:
+            self.wal.flush(lsn)
 
-                schema_page_id = page_range.tail_pages[SCHEMA_ENCODING_COLUMN][tail_page_ind]
-                schema_path = self._page_path("tail", range_id, SCHEMA_ENCODING_COLUMN, schema_page_id)
-                schema_page = self._read_latest_page(schema_path)
-                
-                #if tail_offset >= schema_page.num_records:
-                    #continue
-                
-                schema = schema_page.read(tail_offset)
+        # operations running now may still hold the old page ids, the pages are freed once they are done
+        epoch = self.epochs.retire()
+        self.deallocateQ.put((epoch, range_id, retired_base_ids, retired_tail_ids))
 
-                for user_col in range(self.num_columns):
-                    if ((schema >> user_col) & 1) == 0:
-                        continue
+        return len(installed), len(merge_tail_ids) * len(page_range.tail_pages)
 
-                    tail_col_page_id = page_range.tail_pages[user_col + 5][tail_page_ind]
-                    tail_col_path = self._page_path("tail", range_id, user_col + 5, tail_col_page_id)
-                    tail_col_page = self._read_latest_page(tail_col_path)
-                    
-                    if tail_offset >= tail_col_page.num_records:
-                        continue
-                    
-                    new_val = tail_col_page.read(tail_offset)
 
-                    cons_page = cons_pages[(user_col + 5, base_page_ind)]
-                    cons_page.update(base_offset, new_val)
+    def _deallocate_worker(self):
+        while True:
+            retired = self.deallocateQ.get()
+            if retired is None:
+                break
 
-                seenUpdates.add(base_rid)
+            epoch, range_id, base_ids, tail_ids = retired
+            self.epochs.wait(epoch)
 
-                if len(seenUpdates) == len(base_rids):
-                    break
+            for col, page_id in base_ids:
+                self._free_page(self._page_path("base", range_id, col, page_id))
+            for page_id in tail_ids:
+                for col in range(self.num_columns + 5):
+                    self._free_page(self._page_path("tail", range_id, col, page_id))
 
-            if len(seenUpdates) == len(base_rids):
-                break
+            # ids are given out again only now, so pages take bounded space however many merges run.
+            # with a log they wait for the next checkpoint, replaying the log may still write to them
+            self.page_ranges[range_id].clear(base_ids, tail_ids, reusable = self.wal is None)
 
-        for col in range(total_cols):
-            for page_ind in range(base_page_count):
-                new_id = new_base_ids[col][page_ind]
-                new_path = self._page_path("base", range_id, col, new_id)
-                
-                if col == INDIRECTION_COLUMN:
-                    old_id = page_range.base_pages[col][page_ind]
-                    old_path = self._page_path("base", range_id, col, old_id)
-                    latest_indir = self._read_latest_page(old_path)
-                    self.__write_page_direct(new_path, latest_indir)
-                else:
-                    self.__write_page_direct(new_path, cons_pages[col, page_ind])
 
-        for col in range(total_cols):
-            for page_ind in range(base_page_count):
-                page_range.base_pages[col][page_ind] = new_base_ids[col][page_ind]
+    """
+    # Empties the pages of every retired id, called on open when no operation can read them
+    :param reusable: bool       #give the ids out right away, False to wait for the next checkpoint
+    """
+    def clear_retired(self, reusable):
+        for range_id, page_range in enumerate(self.page_ranges):
+            with page_range.lock:
+                base_ids, tail_ids = list(page_range.retired_base_ids), list(page_range.retired_tail_ids)
+            # replay may have written to them again, they have to start out empty when reused
+            for col, page_id in base_ids:
+                self._free_page(self._page_path("base", range_id, col, page_id))
+            for page_id in tail_ids:
+                for col in range(self.num_columns + 5):
+                    self._free_page(self._page_path("tail", range_id, col, page_id))
+            page_range.clear(base_ids, tail_ids, reusable)
 
-        self.deallocateQ.put((range_id, old_base_ids))
 
-        return True
+    # drops a page from the buffer pool and empties it on disk, so the id starts out as a new page when reused
+    def _free_page(self, path):
+        self.bufferpool.discard(path)
+        segment, page_id = path
+        self.bufferpool.storage.write_page(segment, page_id, Page())
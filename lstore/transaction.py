@@ -1,5 +1,21 @@
 from lstore.table import Table, Record
 from lstore.index import Index
+from lstore.wal import COMMIT, ABORT
+import itertools
+import threading
+
+# transaction each thread is running, its queries take their locks for it
+_running = threading.local()
+# ids tag the log records of transactions, recovery tells them apart by the commit or abort record ending each one
+_ids = itertools.count(1)
+
+
+"""
+# Returns the transaction running on this thread, None for queries run on their own
+"""
+def running_transaction():
+    return getattr(_running, "transaction", None)
+
 
 class Transaction:
 
@@ -8,7 +24,16 @@ class Transaction:
     """
     def __init__(self):
         self.queries = []
-        pass
+        # (lock manager, key) of every record lock held, released when the transaction ends
+        self.locks = set()
+        # (table, kind, values) of every change made, undone newest first if the transaction aborts
+        self.undo = []
+        self.id = next(_ids)
+        # write-ahead logs the changes went to. the end of the transaction is logged to each, recovery rolls back
+        # the changes of transactions that never logged it
+        self.logs = set()
+        # page ranges the transaction changed, merges leave its changes alone until it ends
+        self.ranges = set()
 
     """
     # Adds the given query to this transaction
@@ -21,23 +46,81 @@ class Transaction:
         self.queries.append((query, args))
         # use grades_table for aborting
 
-        
+
+    """
+    # Locks a record of the table until the transaction commits or aborts
+    :param table: Table         #table of the record
+    :param key: int             #primary key of the record
+    :param exclusive: bool      #True to change the record, False to only read it
+    # Returns False if another transaction holds the record in a conflicting mode
+    """
+    def lock(self, table, key, exclusive = False):
+        lock_key = (table.name, key)
+        if not table.lock_manager.acquire(self, lock_key, exclusive):
+            return False
+        self.locks.add((table.lock_manager, lock_key))
+        return True
+
+
     # If you choose to implement this differently this method must still return True if transaction commits or False on abort
     def run(self):
-        for query, args in self.queries:
-            result = query(*args)
-            # If the query has failed the transaction should abort
-            if result == False:
-                return self.abort()
-        return self.commit()
-
-    
+        _running.transaction = self
+        try:
+            for query, args in self.queries:
+                result = query(*args)
+                # If the query has failed the transaction should abort. a sum of 0 or an empty select didn't fail
+                if result is False:
+                    return self.abort()
+            return self.commit()
+        except BaseException:
+            self.abort()
+            raise
+        finally:
+            _running.transaction = None
+
+
+    # the changes are undone while the locks still keep other transactions off the records. only the records in
+    # the undo list are touched, however big the tables are. each undo is logged with the position of its entry,
+    # recovery finishes an abort cut short by a crash from the entries not undone yet
     def abort(self):
-        #TODO: do roll-back and any other necessary operations
+        try:
+            for position in range(len(self.undo) - 1, -1, -1):
+                table, kind, values = self.undo[position]
+                table.rollback(kind, values, (self.id, ~position))
+            self._log_end(ABORT)
+        finally:
+            self.undo = []
+            self._finish_ranges()
+            self._release_locks()
         return False
 
-    
+
+    # the changes are durable once the commit record is, the locks are held until then
     def commit(self):
-        # TODO: commit to database
+        self._log_end(COMMIT)
+        self.undo = []
+        self._finish_ranges()
+        self._release_locks()
         return True
 
+
+    def _log_end(self, kind):
+        for wal in self.logs:
+            wal.commit(wal.append(kind, "", (), (self.id, 0)))
+        self.logs = set()
+
+
+    def _finish_ranges(self):
+        for page_range in self.ranges:
+            page_range.finish(self.id)
+        self.ranges = set()
+
+
+    # strict two-phase locking: nothing is unlocked before the transaction ends, then everything is
+    def _release_locks(self):
+        keys = {}
+        for lock_manager, lock_key in self.locks:
+            keys.setdefault(lock_manager, []).append(lock_key)
+        for lock_manager, lock_keys in keys.items():
+            lock_manager.release(self, lock_keys)
+        self.locks = set()
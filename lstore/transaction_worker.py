@@ -1,44 +1,93 @@
 from lstore.table import Table, Record
 from lstore.index import Index
+import threading
 
 class TransactionWorker:
 
     """
     # Creates a transaction worker object.
+    :param transactions: list[Transaction]      #transactions to run, in order
+    :param executor: Executor                   #thread pool shared with other workers, None to run on a thread of its own
     """
-    def __init__(self, transactions = []):
+    def __init__(self, transactions = None, executor = None):
         self.stats = []
-        self.transactions = transactions
+        # every worker gets its own list, a shared default would have them all run the same transactions
+        self.transactions = transactions if transactions is not None else []
         self.result = 0
-        pass
+        self.executor = executor
+        self.thread = None
+        # set once the last transaction ran on the shared pool, and while nothing is submitted
+        self.done = threading.Event()
+        self.done.set()
+
 
-    
     """
     Appends t to transactions
     """
     def add_transaction(self, t):
         self.transactions.append(t)
 
-        
+
     """
     Runs all transaction as a thread
     """
     def run(self):
-        pass
-        # here you need to create a thread and call __run
-    
+        self.stats = []
+        if self.executor is None:
+            self.thread = threading.Thread(target = self.__run, daemon = True)
+            self.thread.start()
+        else:
+            self.done.clear()
+            self.__submit(0)
+
 
     """
     Waits for the worker to finish
     """
     def join(self):
-        pass
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        elif self.executor is not None:
+            self.done.wait()
 
 
     def __run(self):
         for transaction in self.transactions:
             # each transaction returns True if committed or False if aborted
-            self.stats.append(transaction.run())
+            self.stats.append(self.__run_transaction(transaction))
         # stores the number of transactions that committed
         self.result = len(list(filter(lambda x: x, self.stats)))
 
+
+    # a transaction that raises counts as aborted, the worker goes on with the next one
+    def __run_transaction(self, transaction):
+        try:
+            return transaction.run()
+        except Exception:
+            return False
+
+
+    # workers on a shared pool hand it one transaction at a time, so a few threads take turns running many workers
+    # while each worker still runs its transactions in order. the worker ends when no step is left to run, also when
+    # the pool refuses the next one, so join never waits on a step that will not come
+    def __submit(self, position):
+        submitted = False
+        try:
+            if position < len(self.transactions):
+                self.executor.submit(self.__step, position)
+                submitted = True
+        finally:
+            if not submitted:
+                self.result = len(list(filter(lambda x: x, self.stats)))
+                self.done.set()
+
+
+    # a step interrupted by a BaseException ends the worker instead of going on with the next transaction
+    def __step(self, position):
+        following = len(self.transactions)
+        try:
+            self.stats.append(self.__run_transaction(self.transactions[position]))
+            following = position + 1
+        finally:
+            self.__submit(following)
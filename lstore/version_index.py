@@ -0,0 +1,196 @@
+"""
+Version index of a table, the tail chains of every record kept in memory. Like the page directories it is a set of
+int64 arrays indexed by RID: for a base RID the link is its newest tail RID, for a tail RID the link is the previous
+tail RID of the same record, 0 ending the chain. Every tail RID also has its version number, 1 for the first update
+of the record, and its schema encoding, and every base RID the schema encoding of all the columns ever updated. Going
+back k versions is k hops through the links, the version numbers answer whether the chain is that long at all, and
+the columns of a version are found from the schema encodings without touching a page, so reading them pins one page
+per column.
+
+Merged tail records stay in the chains. The base record only holds the values as of the range's TPS, versions older
+than it are read from the tail records and from the snapshot tail records holding the original values. Tail records
+up to the range's horizon are freed, their columns are read from the horizon pages holding the values as of it.
+"""
+
+from lstore.config import SNAPSHOT_FLAG
+from array import array
+import threading
+
+
+class VersionIndex:
+
+
+    def __init__(self, links = None, numbers = None, schemas = None):
+        self.links = links if links is not None else array('q')
+        self.numbers = numbers if numbers is not None else array('q')
+        self.schemas = schemas if schemas is not None else array('q')
+        # updates of different page ranges add to the arrays at the same time, reads go without it
+        self.lock = threading.Lock()
+
+
+    def _grow(self, size):
+        missing = size - len(self.links)
+        if missing > 0:
+            zeros = array('q', [0]) * missing
+            self.links.extend(zeros)
+            self.numbers.extend(zeros)
+            self.schemas.extend(zeros)
+
+
+    """
+    # Makes tail_rid the newest version of base_rid
+    :param base_rid: int        #RID of the base record
+    :param tail_rid: int        #RID of the new tail record
+    :param schema: int          #schema encoding of the new tail record
+    """
+    def add(self, base_rid, tail_rid, schema):
+        with self.lock:
+            self._grow(max(base_rid, tail_rid) + 1)
+            previous = self.links[base_rid]
+            self.links[tail_rid] = previous
+            number = self.numbers[previous] if previous else 0
+            # a snapshot is no version of its own, it holds the values of the version before it
+            self.numbers[tail_rid] = number if schema & SNAPSHOT_FLAG else number + 1
+            self.schemas[tail_rid] = schema
+            self.schemas[base_rid] |= schema & ~SNAPSHOT_FLAG
+            self.links[base_rid] = tail_rid
+
+
+    # newest tail RID of base_rid, 0 if the record was never updated
+    def latest(self, base_rid):
+        if base_rid < len(self.links):
+            return self.links[base_rid]
+        return 0
+
+
+    # number of updates of base_rid
+    def count(self, base_rid):
+        latest = self.latest(base_rid)
+        return self.numbers[latest] if latest else 0
+
+
+    # schema encoding of every column of base_rid ever updated, the others still have their original value
+    def updated_columns(self, base_rid):
+        if base_rid < len(self.schemas):
+            return self.schemas[base_rid] & ~SNAPSHOT_FLAG
+        return 0
+
+
+    # number of tail records of base_rid newer than tps, counting stops at limit
+    def chain_length(self, base_rid, tps, limit):
+        tail_rid = self.latest(base_rid)
+        length = 0
+        while tail_rid and tail_rid > tps and length < limit:
+            length += 1
+            tail_rid = self.links[tail_rid]
+        return length
+
+
+    # forgets the versions of a deleted record
+    def remove(self, base_rid):
+        with self.lock:
+            if base_rid < len(self.links):
+                self.links[base_rid] = 0
+
+
+    """
+    # Drops the newest version of a record again, for an update that is rolled back
+    :param base_rid: int        #RID of the base record
+    :param tail_rid: int        #RID of the rolled back tail record, the version before it becomes the newest
+    """
+    def unlink(self, base_rid, tail_rid):
+        with self.lock:
+            if base_rid >= len(self.links) or self.links[base_rid] != tail_rid:
+                return
+            # the snapshot of a rolled back update kept the columns it updated first, they count as never updated
+            if self.schemas[tail_rid] & SNAPSHOT_FLAG:
+                self.schemas[base_rid] &= ~self.schemas[tail_rid]
+            self.links[base_rid] = self.links[tail_rid]
+            self.links[tail_rid] = 0
+            self.numbers[tail_rid] = 0
+            self.schemas[tail_rid] = 0
+
+
+    # schema encoding of the columns updated by the tail records from tail_rid back to tps
+    def updated_since(self, tail_rid, tps, cumulative = False):
+        schema = 0
+        while tail_rid and tail_rid > tps:
+            tail_schema = self.schemas[tail_rid]
+            schema |= tail_schema
+            # a cumulative tail record holds every column updated since the last merge
+            if cumulative and not tail_schema & SNAPSHOT_FLAG:
+                break
+            tail_rid = self.links[tail_rid]
+        return schema & ~SNAPSHOT_FLAG
+
+
+    # gives a deleted record its versions back, tail_rid is the newest tail RID it had
+    def relink(self, base_rid, tail_rid):
+        with self.lock:
+            self._grow(base_rid + 1)
+            self.links[base_rid] = tail_rid
+
+
+    """
+    # Finds the tail record holding each column of a version of a record
+    :param base_rid: int                #RID of the base record
+    :param columns: list[int]           #user columns to find
+    :param relative_version: int        #0 for the latest version, -k for k versions before it
+    :param cumulative: bool             #tail records hold every column updated before them
+    :param tps: int                     #tail records up to this RID are merged into the base record
+    :param horizon: int                 #tail records up to this RID are freed, versions before it read as of it
+    # returns a dict of column to tail RID, 0 for columns with their value in the horizon pages. columns missing from
+    # it have their value in the base record
+    """
+    def locate(self, base_rid, columns, relative_version, cumulative = False, tps = -1, horizon = -1):
+        tail_rid = self.latest(base_rid)
+        links = self.links
+        schemas = self.schemas
+
+        # columns never updated still have their original value in the base record
+        updated = self.updated_columns(base_rid)
+        pending = [col for col in columns if (updated >> col) & 1]
+        found = {}
+
+        # go back to the tail record of the version, snapshots are no versions and aren't counted. a snapshot passed
+        # on the way holds the value of columns first updated after the version
+        steps = -relative_version if relative_version < 0 else 0
+        while tail_rid and tail_rid > horizon and pending:
+            schema = schemas[tail_rid]
+            if schema & SNAPSHOT_FLAG:
+                for col in pending:
+                    if (schema >> col) & 1:
+                        found[col] = tail_rid
+                pending = [col for col in pending if col not in found]
+            elif not steps:
+                break
+            else:
+                steps -= 1
+            tail_rid = links[tail_rid]
+
+        # the base record holds the values as of the TPS. it answers for versions newer than that, older ones are
+        # found in the merged tail records
+        recent = tail_rid > tps
+        stop = tps if recent else horizon
+
+        # newest tail record at or before the version that updated each column
+        while tail_rid and tail_rid > stop and pending:
+            schema = schemas[tail_rid]
+            still_pending = []
+            for col in pending:
+                if (schema >> col) & 1:
+                    found[col] = tail_rid
+                else:
+                    still_pending.append(col)
+            pending = still_pending
+
+            # a cumulative tail record holds every column updated since the merge before it, the rest are in the base record
+            if cumulative and recent and not schema & SNAPSHOT_FLAG:
+                break
+            tail_rid = links[tail_rid]
+
+        # the chain goes on into freed tail records, the values as of the horizon are those of the version
+        if tail_rid and not recent:
+            for col in pending:
+                found[col] = 0
+        return found
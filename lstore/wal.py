@@ -0,0 +1,326 @@
+"""
+Write-ahead log of a database. Every change to a table is appended to the log before the pages it changes are
+modified, and a page is only written back once the log holds every change made to it, so the pages on disk never
+run ahead of the log. Opening the database replays the log on top of the tables as they were last saved.
+
+Changes made by a transaction are tagged with its id and the position of the entry they add to its undo list, and
+the transaction logs a commit or abort record when it ends. Recovery redoes every record, then rolls back the
+transactions that never ended, undoing the entries no record of theirs has undone yet.
+
+The log is a series of files, one per generation. A checkpoint starts a new generation, saves the tables as they
+were at that point and then deletes the files of older generations, so recovery only reads the log written since.
+
+Records are made durable in groups: one fsync covers every record appended before it. With synchronous commits an
+operation waits for the fsync that covers its record and concurrent operations share it, otherwise a background
+thread syncs the log every commit interval and an operation returns as soon as its record is appended. Longer
+intervals mean fewer fsyncs for more records, at the cost of commit latency or of the changes lost in a crash.
+"""
+
+from lstore.config import WAL_SYNC_COMMIT, WAL_COMMIT_INTERVAL, WAL_BUFFER_BYTES
+from array import array
+from lstore.storage import sync_directory
+from time import sleep
+import os, re, struct, zlib
+import threading
+
+# one file per generation, numbered so they list in order
+LOG_FILE = "wal_{generation:012d}.log"
+LOG_FILE_PATTERN = re.compile(r"^wal_(\d+)\.log$")
+# magic and generation of a log file: the number of the checkpoint that started it. tables save the generation of
+# the checkpoint they were saved at, and skip the records of older generations on recovery
+LOG_HEADER = struct.Struct('<8sQ')
+LOG_MAGIC = b'LSTOREWL'
+# payload length, crc32 of the kind and payload, record kind
+RECORD_HEADER = struct.Struct('<IIB')
+# length of the name of the table a record belongs to
+NAME_HEADER = struct.Struct('<H')
+# records of a transaction have this bit set in their kind and start with its id and an undo list position. a record
+# undoing the entry at position p carries ~p
+TRANSACTION_FLAG = 0x80
+TRANSACTION_HEADER = struct.Struct('<Qq')
+
+# record kinds, the payload of each is the table name followed by int64 values
+CREATE_TABLE = 1        # num_columns, key, cumulative
+DROP_TABLE = 2
+INSERT = 3              # page range, page index, first offset, count, page id of every column, values column by column
+# page range, base RID, tail page id, tail offset, tail record, (column, old value) of indexed columns or, in a
+# transaction, of every updated column
+UPDATE = 4
+# RID, page range, page index, offset, newest tail RID, TPS, (column, value) of indexed columns or, in a transaction,
+# of every column
+DELETE = 5
+# page range, TPS, n, n * (column, page index, new page id, merged records, k, k carried over values), m, m * tail page id
+MERGE = 6
+# base RID, tail RID, RID of the snapshot written before it or 0, previous tail RID, merged, columns rewritten in the
+# base record, (column, old value, new value) of updated columns
+UNDO_UPDATE = 7
+UNDO_DELETE = 8         # RID, page range, page index, offset, newest tail RID, columns rewritten in the base record, value of every column
+# end of a transaction, logged without a table. recovery rolls back transactions without one
+COMMIT = 9
+ABORT = 10
+
+
+class WriteAheadLog:
+
+
+    """
+    :param directory: string            #directory the log files are kept in
+    :param sync_commit: bool            #operations wait until their records are on disk
+    :param commit_interval: float       #seconds records may wait to share an fsync with later ones
+    """
+    def __init__(self, directory, sync_commit = WAL_SYNC_COMMIT, commit_interval = WAL_COMMIT_INTERVAL):
+        self.directory = directory
+        self.sync_commit = sync_commit
+        self.commit_interval = commit_interval
+
+        # records are appended to the file of the newest generation, opened by start once the old ones are replayed
+        self.fd = None
+        generations = self.generations()
+        self.generation = generations[-1] if generations else None
+        # records appended but not written to the file yet
+        self.buffer = bytearray()
+        # log sequence numbers are positions in the log, counted from when it was opened across every file, so
+        # pages remember the LSN of their latest change whichever generation it was logged in.
+        # start_lsn is where the current generation begins
+        self.start_lsn = 0
+        self.end_lsn = 0
+        self.durable_lsn = 0
+        # a thread writing and syncing a group of records, the others wait for it instead of syncing themselves
+        self.flushing = False
+        self.cond = threading.Condition(threading.Lock())
+
+        # generation of the first record of every transaction that hasn't ended, its files are kept for recovery
+        self.active = {}
+
+        self.fsyncs = 0
+        self.bytes_written = 0
+        self.rotations = 0
+
+        self.closed = False
+        self.flusher = None
+        if not sync_commit:
+            self.flusher = threading.Thread(target = self._flush_worker, daemon = True)
+            self.flusher.start()
+
+
+    """
+    :param kind: int                #record kind
+    :param table: string            #name of the table the record belongs to
+    :param values: list[int]        #values of the record
+    :param transaction: tuple       #(transaction id, undo list position) of a change made by a transaction, None otherwise
+    # returns the LSN of the record, the log is durable up to it once flush(lsn) returns
+    """
+    def append(self, kind, table, values = (), transaction = None):
+        name = table.encode()
+        payload = NAME_HEADER.pack(len(name)) + name + array('q', values).tobytes()
+        if transaction is not None:
+            kind |= TRANSACTION_FLAG
+            payload = TRANSACTION_HEADER.pack(*transaction) + payload
+        checksum = zlib.crc32(payload, zlib.crc32(bytes((kind,))))
+        record = RECORD_HEADER.pack(len(payload), checksum, kind) + payload
+
+        with self.cond:
+            if transaction is not None:
+                if kind & ~TRANSACTION_FLAG in (COMMIT, ABORT):
+                    self.active.pop(transaction[0], None)
+                else:
+                    self.active.setdefault(transaction[0], self.generation)
+            self.buffer += record
+            self.end_lsn += len(record)
+            lsn = self.end_lsn
+            # a full buffer is written out now rather than waiting for the interval
+            if self.flusher is not None and len(self.buffer) >= WAL_BUFFER_BYTES:
+                self.cond.notify_all()
+        return lsn
+
+
+    # waits for the record at lsn to be durable if commits are synchronous
+    def commit(self, lsn):
+        if self.sync_commit and lsn:
+            self.flush(lsn)
+
+
+    """
+    # Makes the log durable up to lsn, everything appended so far if lsn is None
+    :param lsn: int
+    """
+    def flush(self, lsn = None):
+        with self.cond:
+            target = self.end_lsn if lsn is None else min(lsn, self.end_lsn)
+            while self.durable_lsn < target:
+                if self.flushing:
+                    # another thread is syncing, its group may already cover this record
+                    self.cond.wait()
+                    continue
+
+                self.flushing = True
+                self.cond.release()
+                try:
+                    # wait for more records to join the group before paying for the fsync
+                    if self.sync_commit and self.commit_interval:
+                        sleep(self.commit_interval)
+                    self._write_group()
+                finally:
+                    self.cond.acquire()
+                    self.flushing = False
+                    self.cond.notify_all()
+
+
+    # writes and syncs every buffered record, called by the one thread that set flushing
+    def _write_group(self):
+        with self.cond:
+            data = self.buffer
+            self.buffer = bytearray()
+            end_lsn = self.end_lsn
+
+        if data:
+            os.write(self.fd, data)
+            os.fsync(self.fd)
+
+        with self.cond:
+            self.durable_lsn = max(self.durable_lsn, end_lsn)
+            if data:
+                self.fsyncs += 1
+                self.bytes_written += len(data)
+
+
+    def _flush_worker(self):
+        while True:
+            with self.cond:
+                if not self.closed:
+                    self.cond.wait(self.commit_interval)
+                if self.closed:
+                    return
+            self.flush()
+
+
+    # generations of the log files on disk, oldest first
+    def generations(self):
+        generations = []
+        for name in os.listdir(self.directory):
+            match = LOG_FILE_PATTERN.match(name)
+            if match:
+                generations.append(int(match.group(1)))
+        return sorted(generations)
+
+
+    def _path(self, generation):
+        return os.path.join(self.directory, LOG_FILE.format(generation = generation))
+
+
+    """
+    # Reads the records of every log file, stopping at the first one that was only partly written
+    # returns a list of (generation, kind, table name, values, (transaction id, undo list position) or None)
+    """
+    def records(self):
+        records = []
+        for generation in self.generations():
+            with open(self._path(generation), "rb") as file:
+                raw_bytes = file.read()
+            if len(raw_bytes) < LOG_HEADER.size or LOG_HEADER.unpack_from(raw_bytes, 0) != (LOG_MAGIC, generation):
+                break
+
+            position = LOG_HEADER.size
+            while position + RECORD_HEADER.size <= len(raw_bytes):
+                length, checksum, kind = RECORD_HEADER.unpack_from(raw_bytes, position)
+                start = position + RECORD_HEADER.size
+                payload = raw_bytes[start:start + length]
+                if len(payload) < length or zlib.crc32(payload, zlib.crc32(bytes((kind,)))) != checksum:
+                    # older files were synced before a newer one was started, only the newest can end torn
+                    return records
+
+                transaction = None
+                if kind & TRANSACTION_FLAG:
+                    transaction = TRANSACTION_HEADER.unpack_from(payload, 0)
+                    payload = payload[TRANSACTION_HEADER.size:]
+                    kind &= ~TRANSACTION_FLAG
+                (name_length,) = NAME_HEADER.unpack_from(payload, 0)
+                name = payload[NAME_HEADER.size:NAME_HEADER.size + name_length].decode()
+                records.append((generation, kind, name, array('q', payload[NAME_HEADER.size + name_length:]), transaction))
+                position = start + length
+
+        return records
+
+
+    # creates the file of a generation and makes it the one records are appended to
+    def _open_file(self, generation):
+        fd = os.open(self._path(generation), os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+        os.write(fd, LOG_HEADER.pack(LOG_MAGIC, generation))
+        os.fsync(fd)
+        sync_directory(self.directory)
+
+        if self.fd is not None:
+            os.close(self.fd)
+        self.fd = fd
+        self.generation = generation
+
+
+    """
+    # Starts appending to a new file once recovery has read the existing ones, which are kept until a checkpoint
+    :param generation: int      #newer than every file and table
+    """
+    def start(self, generation):
+        with self.cond:
+            self._open_file(generation)
+
+
+    """
+    # Ends the current generation and starts the next, called by a checkpoint while no records are being appended
+    # returns the new generation
+    """
+    def rotate(self):
+        with self.cond:
+            while self.flushing:
+                self.cond.wait()
+            self.flushing = True
+        try:
+            # records of the ending generation go to its own file, which is complete on disk from now on
+            self._write_group()
+            with self.cond:
+                self._open_file(self.generation + 1)
+                self.start_lsn = self.end_lsn
+                self.rotations += 1
+                return self.generation
+        finally:
+            with self.cond:
+                self.flushing = False
+                self.cond.notify_all()
+
+
+    """
+    # Deletes the files a checkpoint made unnecessary, files with records of transactions still running are kept
+    # since recovery needs them to roll those back
+    :param generation: int      #oldest generation recovery still needs
+    """
+    def remove_before(self, generation):
+        with self.cond:
+            generation = min([generation] + list(self.active.values()))
+        for old_generation in self.generations():
+            if old_generation < generation:
+                os.remove(self._path(old_generation))
+        sync_directory(self.directory)
+
+
+    def stats(self):
+        with self.cond:
+            return {
+                "fsyncs": self.fsyncs,
+                "bytes_written": self.bytes_written,
+                "start_lsn": self.start_lsn,
+                "end_lsn": self.end_lsn,
+                "durable_lsn": self.durable_lsn,
+                "generation": self.generation,
+                "rotations": self.rotations,
+            }
+
+
+    def close(self):
+        self.flush()
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+        if self.flusher is not None:
+            self.flusher.join()
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
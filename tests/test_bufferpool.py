@@ -0,0 +1,44 @@
+from lstore.bufferpool import BufferPool
+from time import sleep, perf_counter
+import os, threading
+
+
+class SlowLog:
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.flushing = threading.Event()
+
+    def flush(self, lsn = None):
+        self.flushing.set()
+        sleep(self.delay)
+
+
+def test_eviction_writes_back_without_the_shard_lock(tmp_path):
+    bufferpool = BufferPool(pool_size = 2, db_root = str(tmp_path))
+    bufferpool.wal = SlowLog(0.5)
+    segment = os.path.join(str(tmp_path), "pages.seg")
+    dirty, cached, missed = (segment, 0), (segment, 1), (segment, 2)
+
+    with bufferpool.latched(dirty, exclusive = True) as page:
+        page.write(42)
+        bufferpool.mark_dirty(dirty, 1)
+    bufferpool.get_page(cached)
+    bufferpool.unpin(cached)
+
+    # the miss evicts the dirty page, least recently used, and waits for the log while writing it back
+    reader = threading.Thread(target = lambda: (bufferpool.get_page(missed), bufferpool.unpin(missed)))
+    reader.start()
+    assert bufferpool.wal.flushing.wait(5)
+
+    hit_time_0 = perf_counter()
+    bufferpool.get_page(cached)
+    bufferpool.unpin(cached)
+    assert perf_counter() - hit_time_0 < 0.25
+
+    # a hit on the page being evicted waits for the write back and reads it again
+    with bufferpool.latched(dirty) as page:
+        assert page.read(0) == 42
+    reader.join()
+    assert bufferpool.stats()["pinned_frames"] == 0
+    bufferpool.storage.close()
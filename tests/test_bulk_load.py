@@ -0,0 +1,60 @@
+from lstore.db import Database
+from lstore.query import Query
+from lstore.config import MAX_RECORDS_PER_PAGE
+from lstore.loader import BulkLoadError
+import pytest
+
+number_of_records = 4 * MAX_RECORDS_PER_PAGE
+
+
+def write_csv(path, keys):
+    with open(path, "w") as file:
+        file.write("key,a,b\n")
+        for key in keys:
+            file.write(f"{key},{key * 2},{key % 7}\n")
+
+
+def test_bulk_load(tmp_path):
+    csv_path = str(tmp_path / "rows.csv")
+    write_csv(csv_path, range(number_of_records))
+
+    db = Database()
+    db.open(str(tmp_path / "db"))
+    db.create_table('Rows', 3, 0)
+    assert db.bulk_load('Rows', csv_path) == number_of_records
+
+    query = Query(db.get_table('Rows'))
+    for key in (0, MAX_RECORDS_PER_PAGE, number_of_records - 1):
+        assert query.select(key, 0, [1, 1, 1])[0].columns == [key, key * 2, key % 7]
+    db.close()
+
+
+def check_loaded(query, loaded):
+    assert query.sum(0, number_of_records, 1) == sum(key * 2 for key in range(loaded))
+    assert [record.columns for record in query.select(loaded - 1, 0, [1, 1, 1])] == [[loaded - 1, (loaded - 1) * 2, (loaded - 1) % 7]]
+    assert not query.select(loaded, 0, [1, 1, 1])
+
+
+def test_bulk_load_rejects_duplicate_in_file(tmp_path):
+    # the repeated key is read pages after its first row was written straight to storage. the rows of its chunk
+    # before it are not loaded either, the table holds the rows of the file up to the last page written
+    duplicate = MAX_RECORDS_PER_PAGE * 3 - 36
+    loaded = number_of_records - MAX_RECORDS_PER_PAGE
+    csv_path = str(tmp_path / "rows.csv")
+    write_csv(csv_path, list(range(loaded + 10)) + [duplicate] + list(range(loaded + 10, number_of_records)))
+
+    db = Database()
+    db.open(str(tmp_path / "db"))
+    table = db.create_table('Rows', 3, 0)
+    with pytest.raises(BulkLoadError) as error:
+        db.bulk_load('Rows', csv_path)
+    assert error.value.loaded == loaded
+    assert len(table.index.locate(0, duplicate)) == 1
+    check_loaded(Query(table), loaded)
+    db.close()
+
+    db = Database()
+    db.open(str(tmp_path / "db"))
+    assert len(db.get_table('Rows').index.locate(0, duplicate)) == 1
+    check_loaded(Query(db.get_table('Rows')), loaded)
+    db.close()
@@ -0,0 +1,31 @@
+from lstore.checkpoint import Checkpointer, WriteGate
+from time import sleep
+
+
+class FailingDatabase:
+
+    def __init__(self, failures):
+        self.failures = failures
+        self.write_gate = WriteGate()
+
+    def checkpoint(self):
+        if self.failures:
+            self.failures -= 1
+            raise OSError("no space left on device")
+        return True
+
+
+def test_failed_checkpoints_keep_thread_running():
+    checkpointer = Checkpointer(FailingDatabase(failures = 2), interval = 0.01)
+    try:
+        for _ in range(500):
+            if checkpointer.stats()["checkpoints"]:
+                break
+            sleep(0.01)
+
+        stats = checkpointer.stats()
+        assert stats["checkpoints"] >= 1
+        assert stats["failed"] == 2
+        assert "no space left" in stats["last_error"]
+    finally:
+        checkpointer.stop()
@@ -0,0 +1,81 @@
+from lstore.db import Database
+from lstore.query import Query
+from lstore.config import INDIRECTION_COLUMN
+from random import Random
+import threading
+
+number_of_threads = 4
+records_per_thread = 500
+updates_per_thread = 4000
+
+
+def test_write_waits_for_shared_latch(tmp_path):
+    db = Database()
+    db.open(str(tmp_path))
+    grades_table = db.create_table('Grades', 3, 0)
+    query = Query(grades_table)
+    query.insert(1, 2, 3)
+
+    page_range_ind, page_ind, _ = grades_table.page_directory[0]
+    page_id = grades_table.page_ranges[page_range_ind].base_pages[INDIRECTION_COLUMN][page_ind]
+    path = grades_table._page_path("base", page_range_ind, INDIRECTION_COLUMN, page_id)
+
+    # a flush or merge reading the page holds its latch shared, the update has to wait to point the record at its tail record
+    writer = threading.Thread(target = query.update, args = (1, None, 5, None))
+    with db.bufferpool.latched(path):
+        writer.start()
+        writer.join(0.2)
+        assert writer.is_alive()
+    writer.join()
+
+    assert query.select(1, 0, [1, 1, 1])[0].columns == [1, 5, 3]
+    db.close()
+
+
+def test_writes_during_flush_and_merge(tmp_path):
+    db = Database()
+    db.open(str(tmp_path), pool_size = 256)
+    db.merge_scheduler.min_tail_pages = 1
+    grades_table = db.create_table('Grades', 3, 0)
+    query = Query(grades_table)
+
+    expected = {}
+    def write(thread_ind):
+        random = Random(thread_ind)
+        keys = range(thread_ind * records_per_thread, (thread_ind + 1) * records_per_thread)
+        for key in keys:
+            query.insert(key, 0, 0)
+            expected[key] = [key, 0, 0]
+        for _ in range(updates_per_thread):
+            key = random.choice(keys)
+            columns = [None, None, None]
+            columns[random.randint(1, 2)] = random.randint(0, 1000)
+            query.update(key, *columns)
+            expected[key] = [value if value is not None else old for value, old in zip(columns, expected[key])]
+
+    done = threading.Event()
+    def flush():
+        while not done.is_set():
+            db.bufferpool.flush_all()
+
+    flusher = threading.Thread(target = flush)
+    flusher.start()
+    writers = [threading.Thread(target = write, args = (thread_ind,)) for thread_ind in range(number_of_threads)]
+    for writer in writers:
+        writer.start()
+    for writer in writers:
+        writer.join()
+    done.set()
+    flusher.join()
+
+    assert db.merge_scheduler.stats()["merges"] > 0
+    for key, record in expected.items():
+        assert query.select(key, 0, [1, 1, 1])[0].columns == record
+    db.close()
+
+    db = Database()
+    db.open(str(tmp_path))
+    query = Query(db.get_table('Grades'))
+    for key, record in expected.items():
+        assert query.select(key, 0, [1, 1, 1])[0].columns == record
+    db.close()
@@ -0,0 +1,66 @@
+from lstore.db import Database
+from lstore.query import Query
+from lstore.config import MAX_RECORDS_PER_PAGE
+from lstore.transaction import Transaction
+
+
+# updates of other records, the tail page being filled is full afterwards and merged with the next merge
+def fill_tail_page(query):
+    for update in range(MAX_RECORDS_PER_PAGE):
+        query.update(5 + update % 5, None, update, None)
+
+
+def test_read_retried_when_merge_installs_pages(tmp_path):
+    db = Database()
+    db.open(str(tmp_path))
+    db.merge_scheduler.min_tail_pages = float('inf')
+    table = db.create_table('Rows', 3, 0)
+    query = Query(table)
+    for key in range(10):
+        query.insert(key, 1, 4)
+    query.update(3, None, 2, 5)
+    fill_tail_page(query)
+    table.merge_page_range(0)
+    # the version before the newest is after the TPS, its last column is read from the base record
+    query.update(3, None, 2, None)
+    query.update(3, None, None, 6)
+    fill_tail_page(query)
+
+    # the merge installs its pages after the read found the record's version with the old TPS
+    locate = table.version_index.locate
+    merges = []
+    def locate_then_merge(*args):
+        tail_rids = locate(*args)
+        if not merges:
+            merges.append(table.merge_page_range(0))
+        return tail_rids
+    table.version_index.locate = locate_then_merge
+
+    assert query.select_version(3, 0, [1, 1, 1], -1)[0].columns == [3, 2, 5]
+    assert merges[0]
+    assert query.select_version(3, 0, [1, 1, 1], 0)[0].columns == [3, 2, 6]
+    db.close()
+
+
+def test_merge_leaves_running_transaction_alone(tmp_path):
+    db = Database()
+    db.open(str(tmp_path))
+    db.merge_scheduler.min_tail_pages = float('inf')
+    table = db.create_table('Rows', 3, 0)
+    query = Query(table)
+    for key in range(10):
+        query.insert(key, 1, 4)
+
+    transaction = Transaction()
+    rid = table.index.locate(0, 3)[0]
+    table.update(rid, None, 2, None, transaction = transaction)
+    fill_tail_page(query)
+    # the tail page of the update waits, the merge kept as history never holds a value a rollback takes back
+    assert not table.merge_page_range(0)
+    assert table.page_ranges[0].tps == -1
+
+    transaction.abort()
+    assert table.merge_page_range(0)
+    assert query.select(3, 0, [1, 1, 1])[0].columns == [3, 1, 4]
+    assert query.select_version(3, 0, [1, 1, 1], -1)[0].columns == [3, 1, 4]
+    db.close()
@@ -0,0 +1,37 @@
+from lstore.merge import MergeScheduler
+from time import sleep
+
+
+class FailingTable:
+
+    def __init__(self, failures):
+        self.failures = failures
+        self.merged = []
+
+    def merge_page_range(self, range_id, executor = None):
+        if self.failures:
+            self.failures -= 1
+            raise OSError("disk full")
+        self.merged.append(range_id)
+        return 1, 1
+
+
+def test_failed_merges_keep_workers_running():
+    scheduler = MergeScheduler(workers = 2, pages_per_second = None, processes = 0)
+    table = FailingTable(failures = 2)
+    try:
+        for range_id in range(3):
+            scheduler.schedule(table, range_id)
+        for _ in range(500):
+            if table.merged:
+                break
+            sleep(0.01)
+
+        stats = scheduler.stats()
+        assert table.merged == [2]
+        assert stats["merges"] == 1
+        assert stats["failed_merges"] == 2
+        assert "disk full" in stats["last_error"]
+        assert stats["scheduled"] == 0
+    finally:
+        scheduler.stop()
@@ -0,0 +1,84 @@
+from lstore.db import Database
+from lstore.query import Query
+import os, subprocess, sys
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# loads a table, commits one transaction and dies in the middle of another, with every change on disk
+CRASH = """
+import os, sys
+from lstore.db import Database
+from lstore.query import Query
+from lstore.transaction import Transaction
+
+path, mode = sys.argv[1], sys.argv[2]
+db = Database()
+db.open(path)
+db.merge_scheduler.min_tail_pages = float('inf')
+table = db.create_table('Grades', 3, 0)
+table.index.create_index(1)
+query = Query(table)
+for key in range(100):
+    query.insert(key, key, key)
+
+committed = Transaction()
+committed.add_query(query.update, table, 1, None, 1010, None)
+committed.add_query(query.insert, table, 100, 100, 100)
+assert committed.run()
+
+def crash(transaction):
+    if mode == "abort":
+        # the abort only got to undo the newest change
+        position = len(transaction.undo) - 1
+        undone, kind, values = transaction.undo[position]
+        undone.rollback(kind, values, (transaction.id, ~position))
+    db.wal.flush()
+    db.bufferpool.flush_all()
+    os._exit(0)
+
+unfinished = Transaction()
+unfinished.add_query(query.update, table, 2, None, 1020, None)
+unfinished.add_query(query.update, table, 2, None, None, 1021)
+unfinished.add_query(query.delete, table, 3)
+unfinished.add_query(query.insert, table, 200, 200, 200)
+unfinished.add_query(query.update, table, 4, None, 1040, 1041)
+unfinished.add_query(crash, table, unfinished)
+unfinished.run()
+"""
+
+# recovers and dies again before the tables are saved, the next recovery replays the rollback from the log
+RECOVER = """
+import os, sys
+from lstore.db import Database
+
+db = Database()
+db.open(sys.argv[1])
+db.bufferpool.flush_all()
+os._exit(0)
+"""
+
+
+def check(path):
+    db = Database()
+    db.open(path)
+    query = Query(db.get_table('Grades'))
+    for key in range(101):
+        expected = [1, 1010, 1] if key == 1 else [key, key, key]
+        assert query.select(key, 0, [1, 1, 1])[0].columns == expected
+    assert not query.select(200, 0, [1, 1, 1])
+    assert not query.select(1020, 1, [1, 1, 1])
+    assert not query.select(1040, 1, [1, 1, 1])
+    assert [record.columns for record in query.select(2, 1, [1, 1, 1])] == [[2, 2, 2]]
+    assert query.select_version(2, 0, [1, 1, 1], -1)[0].columns == [2, 2, 2]
+    assert query.sum(0, 200, 2) == sum(range(101))
+    db.close()
+
+
+@pytest.mark.parametrize("mode", ["crash", "abort"])
+def test_unfinished_transaction_rolled_back(tmp_path, mode):
+    path = str(tmp_path)
+    subprocess.run([sys.executable, "-c", CRASH, path, mode], cwd = ROOT, check = True)
+    subprocess.run([sys.executable, "-c", RECOVER, path], cwd = ROOT, check = True)
+    check(path)
+    check(path)
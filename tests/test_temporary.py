@@ -0,0 +1,23 @@
+import os, subprocess, sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# uses a database without opening or closing it, like __main__.py
+SCRIPT = """
+from lstore.db import Database
+from lstore.query import Query
+
+db = Database()
+query = Query(db.create_table('Grades', 5, 0))
+for key in range(1000):
+    query.insert(key, 1, 2, 3, 4)
+assert query.sum(0, 999, 1) == 1000
+print(db.path)
+"""
+
+
+def test_scratch_directory_removed_at_exit():
+    result = subprocess.run([sys.executable, "-c", SCRIPT], cwd = ROOT, check = True, capture_output = True, text = True)
+    path = result.stdout.strip()
+    assert os.path.basename(path).startswith("lstore_")
+    assert not os.path.exists(path)
@@ -0,0 +1,57 @@
+from lstore.transaction_worker import TransactionWorker
+from concurrent.futures import ThreadPoolExecutor
+import threading
+
+
+class Interrupted(BaseException):
+    pass
+
+
+class FakeTransaction:
+
+    def __init__(self, raises = None):
+        self.raises = raises
+        self.ran = False
+
+    def run(self):
+        self.ran = True
+        if self.raises is not None:
+            raise self.raises
+        return True
+
+
+def join_within(worker, timeout = 5):
+    thread = threading.Thread(target = worker.join, daemon = True)
+    thread.start()
+    thread.join(timeout)
+    return not thread.is_alive()
+
+
+def test_join_before_run_returns():
+    with ThreadPoolExecutor(max_workers = 1) as executor:
+        worker = TransactionWorker([FakeTransaction()], executor = executor)
+        assert join_within(worker)
+        worker.run()
+        assert join_within(worker)
+        assert worker.result == 1
+
+
+def test_interrupted_step_ends_worker():
+    transactions = [FakeTransaction(), FakeTransaction(raises = Interrupted()), FakeTransaction()]
+    with ThreadPoolExecutor(max_workers = 1) as executor:
+        worker = TransactionWorker(transactions, executor = executor)
+        worker.run()
+        assert join_within(worker)
+    assert worker.result == 1
+    assert not transactions[2].ran
+
+
+def test_refused_step_ends_worker():
+    executor = ThreadPoolExecutor(max_workers = 1)
+    executor.shutdown()
+    worker = TransactionWorker([FakeTransaction()], executor = executor)
+    try:
+        worker.run()
+    except RuntimeError:
+        pass
+    assert join_within(worker)
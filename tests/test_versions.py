@@ -0,0 +1,136 @@
+from lstore.db import Database
+from lstore.query import Query
+from lstore.config import MAX_RECORDS_PER_PAGE, MERGE_HISTORY
+from random import randint, seed
+import os, glob
+import pytest
+
+number_of_records = 600
+number_of_updates = 5
+
+
+def load(path, cumulative):
+    seed(3562901)
+    db = Database()
+    db.open(path)
+    # merges are run by the test, not in the background
+    db.merge_scheduler.min_tail_pages = float('inf')
+    grades_table = db.create_table('Grades', 5, 0, cumulative = cumulative)
+    query = Query(grades_table)
+
+    # versions[key][k] is the record k updates after the insert
+    versions = {}
+    for i in range(number_of_records):
+        key = 92106429 + i
+        record = [key, randint(0, 20), randint(0, 20), randint(0, 20), randint(0, 20)]
+        query.insert(*record)
+        versions[key] = [record]
+    for _ in range(number_of_updates):
+        for key in versions:
+            updated = list(versions[key][-1])
+            columns = [None] * 5
+            for col in range(1, 5):
+                if randint(0, 1):
+                    columns[col] = updated[col] = randint(0, 20)
+            query.update(key, *columns)
+            versions[key].append(updated)
+    return db, grades_table, query, versions
+
+
+def merge_all(grades_table):
+    for range_id in range(len(grades_table.page_ranges)):
+        grades_table.merge_page_range(range_id)
+
+
+def check_versions(query, versions):
+    for key, history in versions.items():
+        for relative_version in range(0, -number_of_updates - 3, -1):
+            expected = history[max(len(history) - 1 + relative_version, 0)]
+            assert query.select_version(key, 0, [1, 1, 1, 1, 1], relative_version)[0].columns == expected
+
+    keys = sorted(versions)
+    for relative_version in (0, -1, -2, -number_of_updates):
+        expected = sum(history[max(len(history) - 1 + relative_version, 0)][1] for history in versions.values())
+        assert query.sum_version(keys[0], keys[-1], 1, relative_version) == expected
+
+
+@pytest.mark.parametrize("cumulative", [False, True])
+def test_versions_after_merge(tmp_path, cumulative):
+    db, grades_table, query, versions = load(str(tmp_path), cumulative)
+    check_versions(query, versions)
+
+    merge_all(grades_table)
+    assert any(page_range.tps >= 0 for page_range in grades_table.page_ranges)
+    check_versions(query, versions)
+
+    db.close()
+    db = Database()
+    db.open(str(tmp_path))
+    check_versions(Query(db.get_table('Grades')), versions)
+    db.close()
+
+
+def test_versions_after_merge_and_more_updates(tmp_path):
+    db, grades_table, query, versions = load(str(tmp_path), False)
+    merge_all(grades_table)
+
+    for key in versions:
+        updated = list(versions[key][-1])
+        updated[2] = randint(0, 20)
+        query.update(key, None, None, updated[2], None, None)
+        versions[key].append(updated)
+    merge_all(grades_table)
+
+    check_versions(query, versions)
+    db.close()
+
+
+def check_horizon(query, rounds):
+    # the merges of the rounds before the last MERGE_HISTORY ones are freed, their last version is the oldest read
+    oldest = rounds - MERGE_HISTORY - 1
+    for relative_version in range(0, -rounds - 2, -1):
+        expected = [3, max(rounds - 1 + relative_version, oldest), 100]
+        assert query.select_version(3, 0, [1, 1, 1], relative_version)[0].columns == expected
+    assert query.select_version(4, 0, [1, 1, 1], -rounds)[0].columns == [4, oldest, 4]
+
+
+def test_versions_before_horizon_freed(tmp_path):
+    db = Database()
+    db.open(str(tmp_path))
+    db.merge_scheduler.min_tail_pages = float('inf')
+    table = db.create_table('Rows', 3, 0)
+    query = Query(table)
+    for key in range(10):
+        query.insert(key, 1, key)
+
+    # every round updates records 3 and 4 once, fills a tail page with updates of other records and merges it
+    rounds = MERGE_HISTORY + 3
+    merged_tail_ids = []
+    for number in range(rounds):
+        query.update(3, None, number, 100 if number == 0 else None)
+        query.update(4, None, number, None)
+        for update in range(MAX_RECORDS_PER_PAGE):
+            query.update(5 + update % 5, None, update, None)
+        merged_tail_ids.append(list(table.page_ranges[0].tail_pages[0][:-1]))
+        assert table.merge_page_range(0)
+
+    page_range = table.page_ranges[0]
+    assert len(page_range.history) == MERGE_HISTORY
+    assert page_range.horizon >= 0
+    check_horizon(query, rounds)
+    db.close()
+
+    db = Database()
+    db.open(str(tmp_path))
+    check_horizon(Query(db.get_table('Rows')), rounds)
+    # the tail pages of the first merge were freed and are given out again
+    assert set(merged_tail_ids[0]) <= set(db.get_table('Rows').page_ranges[0].free_tail_ids)
+    db.close()
+
+    # the chains rebuilt from the tail pages go on to the freed tail records
+    for path in glob.glob(os.path.join(str(tmp_path), "tables", "Rows", "directory*.bin")):
+        os.remove(path)
+    db = Database()
+    db.open(str(tmp_path))
+    check_horizon(Query(db.get_table('Rows')), rounds)
+    db.close()